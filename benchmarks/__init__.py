@@ -0,0 +1,7 @@
+"""
+Benchmarks of the PyRTL simulators.
+
+The benchmarks follow the conventions of airspeed velocity (asv): run them
+with "asv run" using the asv.conf.json at the top of the repository, or
+offline and without asv with "python benchmarks/run.py".
+"""
@@ -0,0 +1,315 @@
+"""
+Simulation throughput of the PyRTL simulators on designs from pyrtl.rtllib.
+
+Every benchmark is run for each combination of design, simulation engine
+and the passes applied to the design before simulating it.  To benchmark
+a new engine, add it to ENGINES; to benchmark a new design, add a function
+building it to DESIGNS.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import random
+import timeit
+
+import pyrtl
+from pyrtl.rtllib import adders, aes, barrel, multipliers, muxes
+
+
+# --------------------------------------------------------------------
+#    __   ___  __     __        __
+#   |  \ |__  /__` | / _` |\ | /__`
+#   |__/ |___ .__/ | \__> | \| .__/
+#
+
+def _kogge_stone():
+    a, b = pyrtl.Input(32, 'a'), pyrtl.Input(32, 'b')
+    out = pyrtl.Output(33, 'out')
+    out <<= adders.kogge_stone(a, b)
+
+
+def _ripple_add():
+    a, b = pyrtl.Input(32, 'a'), pyrtl.Input(32, 'b')
+    out = pyrtl.Output(33, 'out')
+    out <<= adders.ripple_add(a, b)
+
+
+def _tree_multiplier():
+    a, b = pyrtl.Input(16, 'a'), pyrtl.Input(16, 'b')
+    out = pyrtl.Output(32, 'out')
+    out <<= multipliers.tree_multiplier(a, b)
+
+
+def _aes_encryption():
+    plaintext, key = pyrtl.Input(128, 'plaintext'), pyrtl.Input(128, 'key')
+    ciphertext = pyrtl.Output(128, 'ciphertext')
+    ciphertext <<= aes.AES().encryption(plaintext, key)
+
+
+def _aes_state_machine():
+    plaintext, key = pyrtl.Input(128, 'plaintext'), pyrtl.Input(128, 'key')
+    reset = pyrtl.Input(1, 'reset')
+    ready, ciphertext = pyrtl.Output(1, 'ready'), pyrtl.Output(128, 'ciphertext')
+    ready_out, cipher_out = aes.AES().encrypt_state_m(plaintext, key, reset)
+    ready <<= ready_out
+    ciphertext <<= cipher_out
+
+
+def _sparse_mux():
+    sel = pyrtl.Input(4, 'sel')
+    vals = {i: pyrtl.Input(16, 'val%d' % i) for i in (0, 1, 3, 4, 7, 9, 12, 15)}
+    out = pyrtl.Output(16, 'out')
+    out <<= muxes.sparse_mux(sel, vals)
+
+
+def _barrel_shifter():
+    shift_in, bit_in = pyrtl.Input(32, 'shift_in'), pyrtl.Input(1, 'bit_in')
+    direction, shift_dist = pyrtl.Input(1, 'direction'), pyrtl.Input(4, 'shift_dist')
+    out = pyrtl.Output(32, 'out')
+    out <<= barrel.barrel_shifter(shift_in, bit_in, direction, shift_dist)
+
+
+# functions building each design in the working block
+DESIGNS = {
+    'kogge_stone': _kogge_stone,
+    'ripple_add': _ripple_add,
+    'tree_multiplier': _tree_multiplier,
+    'aes_encryption': _aes_encryption,
+    'aes_state_machine': _aes_state_machine,
+    'sparse_mux': _sparse_mux,
+    'barrel_shifter': _barrel_shifter,
+}
+
+# passes applied to each design before simulating it
+PASSES = {
+    'none': (),
+    'synthesize': (pyrtl.synthesize,),
+    'synthesize+optimize': (pyrtl.synthesize, pyrtl.optimize),
+}
+
+
+def _native_simulation(**kwargs):
+    sim = pyrtl.FastSimulation(native=True, **kwargs)
+    if not sim.native:  # e.g. wires over 64 bits; the numbers would be those of python
+        raise NotImplementedError('the design cannot be simulated natively')
+    return sim
+
+
+# the simulation engines, each called as engine(tracer=..., block=...)
+ENGINES = {
+    'Simulation': pyrtl.Simulation,
+    'EventDrivenSimulation': pyrtl.EventDrivenSimulation,
+    'FastSimulation': pyrtl.FastSimulation,
+    'FastSimulation-native': _native_simulation,
+    'PartitionedSimulation': pyrtl.PartitionedSimulation,
+}
+
+# the number of cycles simulated by each measurement of the steady state;
+# kept small for the designs that are slow to simulate once synthesized
+CYCLES = {
+    'aes_encryption': 20,
+    'aes_state_machine': 44,
+}
+DEFAULT_CYCLES = 200
+
+_prepared = {}
+
+
+def prepared_design(design, passes):
+    """ Return a block holding the design, with the passes applied to it.
+
+    The blocks are built once per process and shared between benchmarks,
+    as synthesizing and optimizing the larger designs takes a few seconds.
+    """
+    key = (design, passes)
+    if key not in _prepared:
+        block = pyrtl.Block()
+        with pyrtl.set_working_block(block):
+            DESIGNS[design]()
+            for apply_pass in PASSES[passes]:
+                block = apply_pass()
+        _prepared[key] = block
+    return _prepared[key]
+
+
+def stimulus(block, cycles, seed=0, hold=1):
+    """ Return a list of random input values for each cycle, keyed by the Inputs of block.
+
+    An Input named "reset" is set only on every 11th cycle, so that state
+    machines get to run to completion.  The other inputs get new values only
+    every hold cycles, for a design that is idle most of the time.
+    """
+    rand = random.Random(seed)
+    inputs = sorted(block.wirevector_subset(pyrtl.Input), key=lambda w: w.name)
+    values = []
+    for cycle in range(cycles):
+        if cycle % hold == 0:
+            current = {w: rand.getrandbits(len(w)) for w in inputs if w.name != 'reset'}
+        values.append({w: (int(cycle % 11 == 0) if w.name == 'reset' else current[w])
+                       for w in inputs})
+    return values
+
+
+def make_simulator(engine, block):
+    """ Return a simulator of block, raising NotImplementedError if the engine cannot run it. """
+    return ENGINES[engine](tracer=pyrtl.SimulationTrace(block=block), block=block)
+
+
+# --------------------------------------------------------------------
+#    __   ___       __        __             __        __
+#   |__) |__  |\ | /  ` |__| |  |  /\  |__/ /__`
+#   |__) |___ | \| \__, |  | |/\| /~~\ |  \ .__/
+#
+
+class Compile(object):
+    """ The time to build a simulator of a design, which includes code generation. """
+    params = (sorted(DESIGNS), sorted(ENGINES), sorted(PASSES))
+    param_names = ('design', 'engine', 'passes')
+    timeout = 600
+
+    def setup(self, design, engine, passes):
+        self.block = prepared_design(design, passes)
+        if engine == 'FastSimulation-native':  # skipped if it would fall back to python
+            make_simulator(engine, self.block)
+
+    def time_compile(self, design, engine, passes):
+        make_simulator(engine, self.block)
+
+
+class SteadyState(object):
+    """ The speed of stepping an already built (and warmed up) simulator. """
+    params = (sorted(DESIGNS), sorted(ENGINES), sorted(PASSES))
+    param_names = ('design', 'engine', 'passes')
+    timeout = 600
+
+    def setup(self, design, engine, passes):
+        block = prepared_design(design, passes)
+        self.values = stimulus(block, CYCLES.get(design, DEFAULT_CYCLES))
+        self.sim = make_simulator(engine, block)
+        for inputs in self.values[:2]:
+            self.sim.step(inputs)
+
+    def teardown(self, design, engine, passes):
+        close = getattr(self.sim, 'close', None)
+        if close is not None:
+            close()
+
+    def time_cycles(self, design, engine, passes):
+        step = self.sim.step
+        for inputs in self.values:
+            step(inputs)
+
+    def track_cycles_per_second(self, design, engine, passes):
+        step = self.sim.step
+        start = timeit.default_timer()
+        for inputs in self.values:
+            step(inputs)
+        return len(self.values) / (timeit.default_timer() - start)
+    track_cycles_per_second.unit = 'cycles/s'
+
+
+class LowActivity(SteadyState):
+    """ The speed of stepping a simulator whose inputs change only every tenth cycle.
+
+    Most of the logic is then idle, which is where EventDrivenSimulation is
+    expected to be faster than Simulation; with the random inputs of
+    SteadyState it is not.
+    """
+
+    def setup(self, design, engine, passes):
+        block = prepared_design(design, passes)
+        self.values = stimulus(block, CYCLES.get(design, DEFAULT_CYCLES), hold=10)
+        self.sim = make_simulator(engine, block)
+        for inputs in self.values[:2]:
+            self.sim.step(inputs)
+
+
+class Run(object):
+    """ The speed of running an already built simulator for many cycles with a single call.
+
+    Only the engines with a run method are measured; compare with
+    SteadyState for the speed of stepping the same engine once per cycle.
+    """
+    params = (sorted(DESIGNS), sorted(e for e in ENGINES if e.startswith('FastSimulation')),
+              sorted(PASSES))
+    param_names = ('design', 'engine', 'passes')
+    timeout = 600
+
+    def setup(self, design, engine, passes):
+        block = prepared_design(design, passes)
+        values = stimulus(block, CYCLES.get(design, DEFAULT_CYCLES))
+        self.columns = {w: [inputs[w] for inputs in values] for w in values[0]}
+        self.sim = make_simulator(engine, block)
+        self.sim.run(inputs={w: column[:2] for w, column in self.columns.items()})
+
+    def time_run(self, design, engine, passes):
+        self.sim.run(inputs=self.columns)
+
+    def track_cycles_per_second(self, design, engine, passes):
+        start = timeit.default_timer()
+        cycles = self.sim.run(inputs=self.columns)
+        return cycles / (timeit.default_timer() - start)
+    track_cycles_per_second.unit = 'cycles/s'
+
+
+def edited_design(design, passes):
+    """ Return a copy of the prepared block with a small piece of logic added to it. """
+    block = pyrtl.copy_block(prepared_design(design, passes), update_working_block=False)
+    with pyrtl.set_working_block(block):
+        first = min(block.wirevector_subset(pyrtl.Input), key=lambda w: w.name)
+        tweak = pyrtl.Output(len(first) + 1, 'bench_tweak')
+        tweak <<= first + 1
+    return block
+
+
+class Rebuild(object):
+    """ The time FastSimulation.rebuild takes to switch to a slightly edited design.
+
+    A full rebuild compiles the whole design again, while an incremental
+    one only compiles the regions whose logic changed.  Each measurement
+    switches between the design and its edited copy.
+    """
+    params = (sorted(DESIGNS), ['full', 'incremental'], sorted(PASSES))
+    param_names = ('design', 'mode', 'passes')
+    timeout = 600
+
+    def setup(self, design, mode, passes):
+        self.blocks = [edited_design(design, passes), prepared_design(design, passes)]
+        self.sim = pyrtl.FastSimulation(block=self.blocks[1], incremental=mode == 'incremental')
+
+    def time_rebuild(self, design, mode, passes):
+        self.blocks.reverse()
+        self.sim.rebuild(self.blocks[1])
+
+
+class ParallelSimulate(object):
+    """ The time to simulate many independent stimulus sets of a design.
+
+    With no workers the sets are run one after another with FastSimulation.run,
+    restoring the initial state in between; otherwise they are spread over
+    that many processes with parallel_simulate.  Both include the time to
+    build the simulators, which parallel_simulate does once per worker.
+    """
+    params = (sorted(DESIGNS), [0, 1, 2, 4])
+    param_names = ('design', 'workers')
+    timeout = 600
+    n_stimuli = 16
+
+    def setup(self, design, workers):
+        block = prepared_design(design, 'none')
+        cycles = CYCLES.get(design, DEFAULT_CYCLES)
+        self.stimuli = []
+        for seed in range(self.n_stimuli):
+            values = stimulus(block, cycles, seed=seed)
+            self.stimuli.append({w.name: [inputs[w] for inputs in values] for w in values[0]})
+
+    def time_simulate(self, design, workers):
+        block = prepared_design(design, 'none')
+        if workers:
+            pyrtl.parallel_simulate(block, self.stimuli, max_workers=workers)
+            return
+        sim = pyrtl.FastSimulation(block=block)
+        start = sim.snapshot()
+        for inputs in self.stimuli:
+            sim.restore(start)
+            sim.run(inputs=inputs)
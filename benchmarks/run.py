@@ -0,0 +1,159 @@
+"""
+Runs the benchmarks without asv and stores the results as JSON.
+
+    python benchmarks/run.py [-b REGEX] [-o results.json] [-c baseline.json]
+
+Benchmarks are written in the style of asv: a class with params and
+param_names whose time_* methods are timed and whose track_* methods
+return the value to record.  Each result is stored under the name
+"<module>.<class>.<method>" and a string of its parameters, and when a
+baseline file from an earlier run is given the two runs are compared.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import datetime
+import importlib
+import itertools
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import timeit
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _root not in sys.path:
+    sys.path.insert(0, _root)
+
+MODULES = ('bench_simulation',)
+
+
+def discover(modules=MODULES):
+    """ Yield (name, class, method name) for each benchmark of the modules. """
+    for module_name in modules:
+        module = importlib.import_module('benchmarks.' + module_name)
+        for class_name in sorted(vars(module)):
+            cls = getattr(module, class_name)
+            if not isinstance(cls, type) or cls.__module__ != module.__name__:
+                continue
+            for method in sorted(vars(cls)):
+                if method.startswith('time_') or method.startswith('track_'):
+                    yield '.'.join((module_name, class_name, method)), cls, method
+
+
+def run_benchmark(cls, method, params, repeat):
+    """ Return the time or tracked value of one benchmark, or None if it is skipped. """
+    bench = cls()
+    try:
+        if hasattr(bench, 'setup'):
+            bench.setup(*params)
+    except NotImplementedError:  # the asv way of skipping a combination of parameters
+        return None
+    try:
+        func = getattr(bench, method)
+        if method.startswith('track_'):
+            return func(*params)
+        samples = []
+        for _ in range(repeat):
+            start = timeit.default_timer()
+            func(*params)
+            samples.append(timeit.default_timer() - start)
+        return min(samples)
+    finally:
+        if hasattr(bench, 'teardown'):
+            bench.teardown(*params)
+
+
+def run(pattern=None, repeat=3, out=sys.stdout):
+    """ Run the benchmarks whose names match the regular expression pattern. """
+    results = {}
+    for name, cls, method in discover():
+        if pattern is not None and not re.search(pattern, name):
+            continue
+        param_sets = getattr(cls, 'params', ())
+        combos = list(itertools.product(*param_sets)) if param_sets else [()]
+        unit = getattr(getattr(cls, method), 'unit', 'seconds')
+        values = {}
+        for params in combos:
+            key = ', '.join(str(p) for p in params)
+            values[key] = run_benchmark(cls, method, params, repeat)
+            print('%s(%s): %s' % (name, key, _format(values[key], unit)), file=out)
+            out.flush()
+        results[name] = {'unit': unit, 'param_names': list(getattr(cls, 'param_names', ())),
+                         'values': values}
+    return results
+
+
+def compare(baseline, results, threshold=0.1, out=sys.stdout):
+    """ Print the benchmarks that changed by more than threshold between two runs.
+
+    Times are better when lower, while rates (a unit of the form "x/s",
+    such as cycles per second) are better when higher.
+    """
+    for name in sorted(set(baseline) & set(results)):
+        unit = results[name]['unit']
+        old_values, new_values = baseline[name]['values'], results[name]['values']
+        for key in sorted(set(old_values) & set(new_values)):
+            old, new = old_values[key], new_values[key]
+            if not old or not new:
+                continue
+            ratio = new / old
+            if unit.endswith('/s'):
+                ratio = 1 / ratio
+            if abs(ratio - 1) <= threshold:
+                continue
+            change = 'slower' if ratio > 1 else 'faster'
+            print('%-7s %5.2fx  %s(%s): %s -> %s' % (
+                change, ratio if ratio > 1 else 1 / ratio, name, key,
+                _format(old, unit), _format(new, unit)), file=out)
+
+
+def _format(value, unit):
+    if value is None:
+        return 'skipped'
+    if unit == 'seconds':
+        return '%.6fs' % value
+    return '%.6g %s' % (value, unit)
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=_root, stderr=subprocess.STDOUT
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the PyRTL benchmarks.')
+    parser.add_argument('-b', '--bench', help='only run benchmarks matching this regex')
+    parser.add_argument('-o', '--output', help='file to store the results in as JSON')
+    parser.add_argument('-c', '--compare', help='JSON results of an earlier run to compare to')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='times to repeat each timing, the fastest is kept (default 3)')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='relative change reported when comparing (default 0.1)')
+    args = parser.parse_args(argv)
+
+    results = run(args.bench, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': _commit(),
+                'date': datetime.datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'machine': platform.node(),
+                'results': results,
+            }, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        compare(baseline, results, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
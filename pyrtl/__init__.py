@@ -45,8 +45,17 @@ from .conditional import currently_under_condition
 
 # block simulation support
 from .simulation import Simulation
+from .simulation import EventDrivenSimulation
 from .simulation import FastSimulation
+from .simulation import BitParallelSimulation
 from .simulation import SimulationTrace
+from .simulation import StreamingVcdTrace
+from .simulation import RingBufferTrace
+from .simulation import SimulationCodeCache
+from .simulation import SimulationSnapshot
+from .simulation import SimulationProfile
+from .simulation import parallel_simulate
+from .simulation import PartitionedSimulation
 
 # input and output to file format routines
 from .inputoutput import input_from_blif
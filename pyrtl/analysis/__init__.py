@@ -1,3 +1,5 @@
 from .estimate import area_estimation
+from .estimate import power_estimation
 from .estimate import TimingAnalysis
 from .estimate import yosys_area_delay
+from .partition import partition_block
@@ -43,60 +43,20 @@ def area_estimation(tech_in_nm=130, block=None):
         tech_in_um = tech_in_nm / 1000.0
         return 0.001 * tech_in_um**2.07 * bits**0.9 * ports**0.7 + 0.0048
 
-    # Subset of the raw data gathered from yosys, mapping to vsclib 130nm library
-    # Width   Adder_Area  Mult_Area  (area in "tracks" as discussed below)
-    # 8       211         2684
-    # 16      495         12742
-    # 32      1110        49319
-    # 64      2397        199175
-    # 128     4966        749828
-
-    def adder_stdcell_estimate(width):
-        return width * 34.4 - 25.8
-
-    def multiplier_stdcell_estimate(width):
-        if width == 1:
-            return 5
-        elif width == 2:
-            return 39
-        elif width == 3:
-            return 219
-        else:
-            return -958 + (150 * width) + (45 * width**2)
-
-    def stdcell_estimate(net):
-        if net.op in 'w~sc':
-            return 0
-        elif net.op in '&|n':
-            return 40/8.0 * len(net.args[0])   # 40 lambda
-        elif net.op in '^=<>x':
-            return 80/8.0 * len(net.args[0])   # 80 lambda
-        elif net.op == 'r':
-            return 144/8.0 * len(net.args[0])  # 144 lambda
-        elif net.op in '+-':
-            return adder_stdcell_estimate(len(net.args[0]))
-        elif net.op == '*':
-            return multiplier_stdcell_estimate(len(net.args[0]))
-        elif net.op in 'm@':
-            return 0  # memories handled elsewhere
-        else:
-            raise PyrtlInternalError('Unable to estimate the following net '
-                                     'due to unimplemented op :\n%s' % str(net))
-
     block = working_block(block)
 
-    # The functions above were gathered and calibrated by mapping
+    # The stdcell functions were gathered and calibrated by mapping
     # reference designs to an openly available 130nm stdcell library.
     # http://www.vlsitechnology.org/html/vsc_description.html
     # http://www.vlsitechnology.org/html/cells/vsclib013/lib_gif_index.html
 
     # In a standard cell design, each gate takes up a length of standard "track"
-    # in the chip.  The functions above return that length for each of the different
+    # in the chip.  The stdcell functions return that length for each of the different
     # types of functions in the units of "tracks".  In the 130nm process used,
     # 1 lambda is 55nm, and 1 track is 8 lambda.
 
     # first, sum up the area of all of the logic elements (including registers)
-    total_tracks = sum(stdcell_estimate(a_net) for a_net in block.logic)
+    total_tracks = sum(_stdcell_estimate(a_net) for a_net in block.logic)
     total_length_in_nm = total_tracks * 8 * 55
     # each track is then 72 lambda tall, and converted from nm2 to mm2
     area_in_mm2_for_130nm = (total_length_in_nm * (72 * 55)) / 1e12
@@ -113,6 +73,91 @@ def area_estimation(tech_in_nm=130, block=None):
     return logic_area, mem_area
 
 
+# Subset of the raw data gathered from yosys, mapping to vsclib 130nm library
+# Width   Adder_Area  Mult_Area  (area in "tracks" as discussed in area_estimation)
+# 8       211         2684
+# 16      495         12742
+# 32      1110        49319
+# 64      2397        199175
+# 128     4966        749828
+
+
+def _adder_stdcell_estimate(width):
+    return width * 34.4 - 25.8
+
+
+def _multiplier_stdcell_estimate(width):
+    if width == 1:
+        return 5
+    elif width == 2:
+        return 39
+    elif width == 3:
+        return 219
+    else:
+        return -958 + (150 * width) + (45 * width**2)
+
+
+def _stdcell_estimate(net):
+    """ The length of standard cell "track" of a net (see area_estimation). """
+    if net.op in 'w~sc':
+        return 0
+    elif net.op in '&|n':
+        return 40/8.0 * len(net.args[0])   # 40 lambda
+    elif net.op in '^=<>x':
+        return 80/8.0 * len(net.args[0])   # 80 lambda
+    elif net.op == 'r':
+        return 144/8.0 * len(net.args[0])  # 144 lambda
+    elif net.op in '+-':
+        return _adder_stdcell_estimate(len(net.args[0]))
+    elif net.op == '*':
+        return _multiplier_stdcell_estimate(len(net.args[0]))
+    elif net.op in 'm@':
+        return 0  # memories handled elsewhere
+    else:
+        raise PyrtlInternalError('Unable to estimate the following net '
+                                 'due to unimplemented op :\n%s' % str(net))
+
+
+# Rough switched capacitance per track of standard cell, and supply voltage,
+# of the 130nm process the stdcell estimates are calibrated for.  Each bit of
+# a wire is also charged a track worth of capacitance for its routing.
+_capacitance_per_track_130nm = 2e-15
+_vdd_130nm = 1.2
+_wire_tracks_per_bit = 1.0
+
+
+def power_estimation(toggle_counts, tech_in_nm=130, block=None):
+    """ Estimates the dynamic energy spent switching the logic of the block.
+
+    :param toggle_counts: the number of bit flips of each wire, as
+        {wire name: toggles}, as returned by the toggle_counts method of a
+        simulation created with count_toggles=True
+    :param tech_in_nm: the size of the circuit technology to be estimated
+        (for example, 65 is 65nm and 250 is 0.25um)
+    :return: the estimated energy in joules spent over the simulated cycles
+
+    Each flip of a bit driven by a net is charged the energy of switching the
+    capacitance of that net's standard cells (per output bit) plus that of
+    the wire, with the cells sized by the same models as area_estimation.
+    Capacitance is scaled linearly with the technology and the supply
+    voltage is kept at that of 130nm.  Memory arrays themselves are not
+    modeled, only the logic around them.  Like area_estimation, this is meant
+    for comparing variants of a design, not for absolute numbers.
+    """
+    block = working_block(block)
+    capacitance_per_track = _capacitance_per_track_130nm * tech_in_nm / 130.0
+    energy_per_track = 0.5 * capacitance_per_track * _vdd_130nm**2
+
+    total_tracks = 0.0  # summed over all of the bit flips
+    for net in block.logic:
+        for dest in net.dests:
+            toggles = toggle_counts.get(dest.name, 0)
+            if toggles:
+                tracks_per_bit = _stdcell_estimate(net) / float(len(dest)) + _wire_tracks_per_bit
+                total_tracks += toggles * tracks_per_bit
+    return total_tracks * energy_per_track
+
+
 def _bits_and_ports_from_memory(mem):
     """ Helper to extract mem bits and ports for estimation. """
     bits = 2**mem.addrwidth * mem.bitwidth
@@ -262,7 +307,7 @@ class TimingAnalysis(object):
             of nets) as the second
         """
         critical_paths = []  # storage of all completed critical paths
-        wire_src_map, dst_map = self.block.net_connections()
+        wire_src_map, dst_map = self.block._net_connections()
 
         def critical_path_pass(old_critical_path, first_wire):
             if isinstance(first_wire, (Input, Const, Register)):
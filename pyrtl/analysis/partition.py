@@ -0,0 +1,105 @@
+"""
+Contains functions to split a block into regions of logic that only
+communicate through registers.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import collections
+
+from ..core import working_block, set_working_block, Block
+from ..wire import Input, Const, Register
+from ..memory import RomBlock
+from ..transform import clone_wire, _copy_net
+
+
+# --------------------------------------------------------------------
+#    __        __  ___    ___    __
+#   |__)  /\  |__)  |  |   |  | /  \ |\ |
+#   |    /~~\ |  \  |  |   |  | \__/ | \|
+#
+
+def partition_block(block=None):
+    """ Partition the logic of a block into regions connected only through registers.
+
+    :param block: the block to partition (defaults to the working block)
+    :return: a list of frozensets of LogicNets, largest first
+
+    Two nets are in the same region if one reads a (non-register) wire the
+    other drives, or if both are ports of the same memory.  Inputs and
+    constants do not connect regions, and neither do registers: the logic
+    computing the next value of a register and the logic reading it can
+    be in different regions.  Within a cycle each region can therefore be
+    evaluated on its own, given the values of the inputs and registers it
+    reads.
+    """
+    regions = _partition_nets(working_block(block))
+    return sorted((frozenset(nets) for nets in regions), key=len, reverse=True)
+
+
+def _partition_nets(block):
+    """ Return the regions of block (see partition_block) as lists of nets in topological order.
+
+    The regions are listed in the topological order of their first nets.
+    """
+    # the nets are handled by their index in the topological order, both so
+    # that the result does not depend on hashing and as hashing a LogicNet
+    # hashes all of its fields
+    nets = tuple(block)
+    parent = list(range(len(nets)))
+
+    def find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    def union(a, b):
+        parent[find(a)] = find(b)
+
+    producer = {}
+    for i, net in enumerate(nets):
+        for w in net.dests:
+            producer[w] = i
+    mem_port = {}
+    for i, net in enumerate(nets):
+        for w in net.args:
+            if w in producer and not isinstance(w, Register):
+                union(i, producer[w])
+        if net.op in 'm@' and not isinstance(net.op_param[1], RomBlock):
+            memid = net.op_param[1].id
+            if memid in mem_port:
+                union(i, mem_port[memid])
+            else:
+                mem_port[memid] = i
+
+    regions = collections.OrderedDict()
+    for i, net in enumerate(nets):
+        regions.setdefault(find(i), []).append(net)
+    return list(regions.values())
+
+
+def _region_block(nets):
+    """ Return a new block holding a copy of the nets of one or more regions.
+
+    Wires the nets read but do not drive (i.e. inputs and the registers of
+    other regions) become Inputs of the same name.
+    """
+    region = Block()
+    driven = set(w for net in nets for w in net.dests)
+    wires = {}
+    with set_working_block(region, no_sanity_check=True):
+        for net in nets:
+            for w in net.args + net.dests:
+                if w in wires:
+                    continue
+                if isinstance(w, Const) or w in driven:
+                    wires[w] = clone_wire(w)
+                else:
+                    wires[w] = Input(len(w), name=w.name)
+        mems = {}
+        for net in nets:
+            _copy_net(region, net, wires, mems)
+    return region
@@ -126,6 +126,44 @@ class LogicNet(collections.namedtuple('LogicNet', ['op', 'op_param', 'args', 'de
     __ge__ = _compare_error
 
 
+class _BlockSet(set):
+    """ A set that tells the block it belongs to whenever it is modified.
+
+    Block.logic and Block.wirevector_set are stored as _BlockSets so that
+    the structures the block derives from them (such as the topological
+    order of the nets) can be cached and dropped on any change, including
+    changes made directly to the sets by passes.
+    """
+
+    def __init__(self, block, items=()):
+        super(_BlockSet, self).__init__(items)
+        self._block = block
+
+    def __reduce__(self):
+        return (_BlockSet, (self._block, list(self)))
+
+    def _modified(self, result=None):
+        self._block._invalidate_caches()
+        return result
+
+
+def _invalidating(method_name):
+    base_method = getattr(set, method_name)
+
+    def method(self, *args):
+        return self._modified(base_method(self, *args))
+    method.__name__ = method_name
+    method.__doc__ = base_method.__doc__
+    return method
+
+
+for _method_name in ('add', 'remove', 'discard', 'pop', 'clear', 'update',
+                     'difference_update', 'intersection_update',
+                     'symmetric_difference_update', '__ior__', '__iand__',
+                     '__isub__', '__ixor__'):
+    setattr(_BlockSet, _method_name, _invalidating(_method_name))
+
+
 class Block(object):
     """ Block encapsulates a netlist.
 
@@ -208,6 +246,7 @@ class Block(object):
 
     def __init__(self):
         """Creates an empty hardware block."""
+        self._caches = {}  # structures derived from the logic, see _invalidate_caches
         self.logic = set()  # set of nets, each is a LogicNet named tuple
         self.wirevector_set = set()  # set of all wirevectors
         self.wirevector_by_name = {}  # map from name->wirevector, used for performance
@@ -219,6 +258,34 @@ class Block(object):
         """String form has one LogicNet per line."""
         return '\n'.join(str(l) for l in self)
 
+    @property
+    def logic(self):
+        return self._logic
+
+    @logic.setter
+    def logic(self, nets):
+        self._logic = _BlockSet(self, nets)
+        self._invalidate_caches()
+
+    @property
+    def wirevector_set(self):
+        return self._wirevector_set
+
+    @wirevector_set.setter
+    def wirevector_set(self, wirevectors):
+        self._wirevector_set = _BlockSet(self, wirevectors)
+        self._invalidate_caches()
+
+    def _invalidate_caches(self):
+        """ Drop everything computed from the logic and wirevectors of the block.
+
+        Called on every change to logic or wirevector_set (through add_net,
+        add_wirevector, remove_wirevector, assignment of either attribute, or
+        a direct modification of either set).
+        """
+        if self._caches:
+            self._caches.clear()
+
     def add_wirevector(self, wirevector):
         """ Add a wirevector object to the block."""
         self.sanity_check_wirevector(wirevector)
@@ -296,7 +363,22 @@ class Block(object):
 
         Look at input_output.net_graph for one such graph that uses the information
         from this function
+
+        The dictionaries returned are new copies that the caller is free to
+        modify; the underlying maps are computed once and cached until the
+        block changes.
         """
+        src_list, dst_list = self._net_connections(include_virtual_nodes)
+        return dict(src_list), {wire: list(nets) for wire, nets in dst_list.items()}
+
+    def _net_connections(self, include_virtual_nodes=False):
+        """ Cached version of net_connections, the results must not be modified. """
+        key = ('net_connections', include_virtual_nodes)
+        if key not in self._caches:
+            self._caches[key] = self._build_net_connections(include_virtual_nodes)
+        return self._caches[key]
+
+    def _build_net_connections(self, include_virtual_nodes):
         src_list = {}
         dst_list = {}
 
@@ -342,12 +424,22 @@ class Block(object):
         Note: this method will throw an error if there are loops in the
         logic that do not involve registers
         Also, the order of the nets is not guaranteed to be the the same
-        over multiple iterations"""
+        over multiple iterations
+
+        The order is computed once and cached until the block changes, so
+        repeated iteration over an unchanged block is cheap."""
+        if 'topological_order' not in self._caches:
+            self._caches['topological_order'] = self._build_topological_order()
+        return iter(self._caches['topological_order'])
+
+    def _build_topological_order(self):
+        """ Return a tuple of all the nets in the block in topological order. """
         from .wire import Input, Const, Register
-        src_dict, dest_dict = self.net_connections()
+        src_dict, dest_dict = self._net_connections()
         to_clear = self.wirevector_subset((Input, Const, Register))
         cleared = set()
         remaining = self.logic.copy()
+        order = []
         try:
             while len(to_clear):
                 wire_to_check = to_clear.pop()
@@ -355,7 +447,7 @@ class Block(object):
                 if wire_to_check in dest_dict:
                     for gate in dest_dict[wire_to_check]:  # loop over logicnets not yet returned
                         if all(arg in cleared for arg in gate.args):  # if all args ready
-                            yield gate
+                            order.append(gate)
                             remaining.remove(gate)
                             if gate.op != 'r':
                                 to_clear.update(gate.dests)
@@ -367,6 +459,7 @@ class Block(object):
             from pyrtl.helperfuncs import find_and_print_loop
             find_and_print_loop(self)
             raise PyrtlError("Failure in Block Iterator due to non-register loops")
+        return tuple(order)
 
     def sanity_check(self):
         """ Check block and throw PyrtlError or PyrtlInternalError if there is an issue.
@@ -400,7 +493,7 @@ class Block(object):
         all_input_and_consts = self.wirevector_subset((Input, Const))
 
         # The following line also checks for duplicate wire drivers
-        wire_src_dict, wire_dst_dict = self.net_connections()
+        wire_src_dict, wire_dst_dict = self._net_connections()
         dest_set = set(wire_src_dict.keys())
         arg_set = set(wire_dst_dict.keys())
         full_set = dest_set | arg_set
@@ -452,7 +545,7 @@ class Block(object):
             return  # nothing to check here
 
         if wire_src_dict is None:
-            wire_src_dict, wdd = self.net_connections()
+            wire_src_dict, wdd = self._net_connections()
 
         from .wire import Input, Const
         sync_src = 'r'
@@ -237,10 +237,19 @@ def check_rtl_assertions(sim):
     for (w, exp) in sim.block.rtl_assert_dict.items():
         try:
             value = sim.inspect(w)
-            if not value:
-                raise exp
         except KeyError:
-            pass
+            continue
+        if not value:
+            _rtl_assertion_failed(sim, w, exp)
+
+
+def _rtl_assertion_failed(sim, w, exp):
+    """ Raise exp, the exception of the failing assertion w, in sim. """
+    # let the tracer record the state leading up to the failure
+    assertion_failed = getattr(getattr(sim, 'tracer', None), 'assertion_failed', None)
+    if assertion_failed is not None:
+        assertion_failed(w, exp)
+    raise exp
 
 
 def _check_for_loop(block=None):
@@ -285,7 +294,7 @@ def find_loop(block=None):
 
     # now making a map to quickly look up nets
     dest_nets = {dest_w: net_ for net_ in logic_left for dest_w in net_.dests}
-    initial_w = random.sample(wires_left, 1)[0]
+    initial_w = random.choice(list(wires_left))
 
     current_wires = set()
     checking_stack = [_FilteringState(initial_w)]
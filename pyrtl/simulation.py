@@ -6,13 +6,27 @@ import sys
 import re
 import numbers
 import collections
+import heapq
+import array
+import bisect
+import itertools
+import functools
+import os
+import timeit
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:  # python 2
+    from collections import Mapping, MutableMapping
 
 from .pyrtlexceptions import PyrtlError, PyrtlInternalError
-from .core import working_block, PostSynthBlock, _PythonSanitizer
+from .core import working_block, reset_working_block, Block, PostSynthBlock, _PythonSanitizer
 from .wire import Input, Register, Const, Output, WireVector
-from .memory import RomBlock
-from .helperfuncs import check_rtl_assertions, _currently_in_ipython
+from .memory import MemBlock, RomBlock
+from .helperfuncs import check_rtl_assertions, _rtl_assertion_failed, _currently_in_ipython
 from .inputoutput import _VerilogSanitizer
+from .analysis.partition import partition_block, _partition_nets, _region_block
+
 
 # ----------------------------------------------------------------
 #    __                         ___    __
@@ -20,6 +34,279 @@ from .inputoutput import _VerilogSanitizer
 #   .__/ |  |  | \__/ |___ /~~\  |  | \__/ | \|
 #
 
+class SimulationSnapshot(collections.namedtuple(
+        'SimulationSnapshot', ['registers', 'memories', 'values', 'trace_length'])):
+    """ The state of a simulation, as returned by snapshot.
+
+    registers maps register names to their state, memories maps memory names
+    to their contents, values maps wire names to their values in the last
+    cycle (None if no cycle had been simulated), and trace_length is the
+    length of the trace at the time of the snapshot (None if unknown).
+    Everything is referred to by name, so snapshots can be pickled and
+    restored into a simulation of the same design in another process.
+    """
+    __slots__ = ()
+
+
+def _block_memories(block):
+    """ Map the names of the (non-ROM) memories of block to the memories. """
+    return {net.op_param[1].name: net.op_param[1] for net in block.logic_subset('m@')
+            if not isinstance(net.op_param[1], RomBlock)}
+
+
+def _copy_state(state):
+    """ Copy a register or memory state, containers down to the values. """
+    if isinstance(state, (dict, _DenseMemory)):
+        return {key: _copy_state(val) for key, val in state.items()}
+    elif isinstance(state, list):
+        return [_copy_state(val) for val in state]
+    elif hasattr(state, 'copy'):  # numpy arrays of the batched simulation
+        return state.copy()
+    return state
+
+
+class _DenseMemory(MutableMapping):
+    """ The contents of a memory, stored densely in a list (or ctypes array).
+
+    Behaves like the {address: value} dictionaries memories are otherwise
+    stored as: only the addresses not holding the default value are keys
+    (for iteration, len and in), while reading any other address in range
+    gives the default value, as get(addr, default_value) would.  Compiled
+    code reads the storage directly.
+    """
+
+    def __init__(self, init, size, default_value, native=False):
+        if native:  # shared with the native code of FastSimulation
+            import ctypes
+            self.storage = (ctypes.c_uint64 * size)()
+        else:
+            self.storage = [default_value] * size
+        self.default_value = default_value
+        self.load(init)
+
+    def load(self, contents):
+        """ Replace the contents with those of the {address: value} map. """
+        self.storage[:] = [self.default_value] * len(self.storage)
+        for addr, value in contents.items():
+            self[addr] = value
+
+    def __getitem__(self, addr):
+        if not 0 <= addr < len(self.storage):
+            raise KeyError(addr)
+        return self.storage[addr]
+
+    def __setitem__(self, addr, value):
+        if not 0 <= addr < len(self.storage):
+            raise PyrtlError('error, address %s outside of bounds' % str(addr))
+        self.storage[addr] = value
+
+    def __delitem__(self, addr):
+        self[addr] = self.default_value
+
+    def __contains__(self, addr):
+        return (isinstance(addr, numbers.Integral) and 0 <= addr < len(self.storage)
+                and self.storage[addr] != self.default_value)
+
+    def __iter__(self):
+        default = self.default_value
+        return (addr for addr, value in enumerate(self.storage) if value != default)
+
+    def __len__(self):
+        return sum(1 for addr in self)
+
+
+class _NativeRegisters(MutableMapping):
+    """ The register values of a native FastSimulation, as {name: value}.
+
+    The values are held in the ctypes array the native code updates in place.
+    """
+
+    def __init__(self, names, storage):
+        self._index = {name: i for i, name in enumerate(names)}
+        self.storage = storage
+
+    def __getitem__(self, name):
+        return self.storage[self._index[name]]
+
+    def __setitem__(self, name, value):
+        self.storage[self._index[name]] = value
+
+    def __delitem__(self, name):
+        raise PyrtlError('the registers of a simulation cannot be removed')
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def copy(self):
+        return dict(self)
+
+
+class _RomData(dict):
+    """ The contents of a RomBlock, read out of it once.
+
+    Addresses whose data is invalid are left out, so that reading them
+    raises the error of the RomBlock (only) when they are read.
+    """
+
+    def __init__(self, rom):
+        super(_RomData, self).__init__()
+        self.rom = rom
+        for addr in range(2**rom.addrwidth):
+            try:
+                self[addr] = rom._get_read_data(addr)
+            except PyrtlError:
+                pass
+
+    def __missing__(self, addr):
+        return self.rom._get_read_data(addr)
+
+
+def _dense_mem_state(mem, init, default_value, max_addrwidth):
+    """ Return the state of mem, densely stored if its addrwidth is at most max_addrwidth.
+
+    init is the {address: value} map of a memory, and is ignored for roms.
+    """
+    if max_addrwidth is None or mem.addrwidth > max_addrwidth:
+        return mem if isinstance(mem, RomBlock) else init
+    if isinstance(mem, RomBlock):
+        return _RomData(mem)
+    return _DenseMemory(init, 2**mem.addrwidth, default_value)
+
+
+class SimulationProfile(object):
+    """ The number of evaluations of, and the time spent on, each net of a simulation.
+
+    A simulation given profile=True keeps one of these as its attribute
+    profile.  stats() sums the counts and times up per op, per wire (the
+    wire a net drives, or the memory it writes) and per call site (the line
+    of the design code that created that wire, known only for designs built
+    in debug mode, see set_debug_mode), and report() prints the same as
+    tables sorted by time.
+
+    Timing every net adds a lot of overhead to the simulation, so the times
+    are only meaningful relative to each other.
+    """
+
+    def __init__(self, nets):
+        self.nets = tuple(nets)
+        self.counts = [0] * len(self.nets)
+        self.times = [0.0] * len(self.nets)
+        self._index = {net: i for i, net in enumerate(self.nets)}
+
+    def reset(self):
+        """ Set all of the counts and times back to zero. """
+        # in place, the simulations hold on to the lists
+        self.counts[:] = [0] * len(self.nets)
+        self.times[:] = [0.0] * len(self.nets)
+
+    def _timed(self, i, execute):
+        """ Wrap execute, the function evaluating net i, to profile it. """
+        counts, times, clock = self.counts, self.times, _profile_clock
+
+        def timed_execute():
+            start = clock()
+            execute()
+            times[i] += clock() - start
+            counts[i] += 1
+        return timed_execute
+
+    def _timed_execute(self, execute):
+        """ Wrap execute(net) to profile it. """
+        counts, times, index, clock = self.counts, self.times, self._index, _profile_clock
+
+        def timed_execute(net):
+            start = clock()
+            execute(net)
+            if net in index:
+                times[index[net]] += clock() - start
+                counts[index[net]] += 1
+        return timed_execute
+
+    def stats(self):
+        """ Return the profile as a dict of dicts.
+
+        The keys of the outer dict are 'op', 'wire' and 'site', and each inner
+        dict maps an op, a wire name or a call site ("file:line") to a
+        dict {'count': evaluations, 'time': seconds}.
+        """
+        stats = {'op': {}, 'wire': {}, 'site': {}}
+        for net, count, time in zip(self.nets, self.counts, self.times):
+            for by, key in (('op', net.op), ('wire', _net_name(net)), ('site', _net_site(net))):
+                entry = stats[by].setdefault(key, {'count': 0, 'time': 0.0})
+                entry['count'] += count
+                entry['time'] += time
+        return stats
+
+    def report(self, by='op', limit=None, file=sys.stdout):
+        """ Print the profile summed up per op, wire or call site, most time first.
+
+        :param by: one of 'op', 'wire' and 'site'
+        :param limit: the number of rows to print, defaults to all of them
+        :param file: where to print the report to
+        """
+        stats = self.stats()
+        if by not in stats:
+            raise PyrtlError('profile report by "%s" should be by op, wire or site' % str(by))
+        rows = sorted(stats[by].items(), key=lambda item: (-item[1]['time'], item[0]))
+        total = sum(self.times) or 1.0
+        width = max([len(by)] + [len(key) for key, entry in rows])
+        print('%-*s %12s %12s %7s' % (width, by, 'count', 'time (s)', 'time'), file=file)
+        for key, entry in rows[:limit]:
+            print('%-*s %12d %12.6f %6.1f%%' % (width, key, entry['count'], entry['time'],
+                                                100.0 * entry['time'] / total), file=file)
+
+
+_profile_clock = timeit.default_timer
+_pyrtl_dir = os.path.dirname(os.path.abspath(__file__))
+_frame_regex = re.compile(r'File "(.*)", line (\d+)')
+
+
+def _net_name(net):
+    """ The name of the wire net drives, or of the memory it writes. """
+    if net.op == '@':
+        return net.op_param[1].name
+    return net.dests[0].name
+
+
+def _net_site(net):
+    """ The innermost line outside of pyrtl in the call stack creating the wire net drives. """
+    call_stack = getattr(net.dests[0], 'init_call_stack', None) if net.dests else None
+    for frame in reversed(call_stack or ()):
+        match = _frame_regex.search(frame)
+        if match and not os.path.abspath(match.group(1)).startswith(_pyrtl_dir):
+            return '%s:%s' % (match.group(1), match.group(2))
+    return 'unknown'
+
+
+def _bound_input_wires(block, inputs):
+    """ Check that inputs lists every Input of block once, return them as wires. """
+    wires = []
+    for i in inputs:
+        name = i.name if isinstance(i, WireVector) else i
+        wire = block.wirevector_by_name.get(name)
+        if not isinstance(wire, Input):
+            raise PyrtlError('bind_inputs given "%s" which is not a known input' % name)
+        wires.append(wire)
+    if len(set(wires)) != len(wires):
+        raise PyrtlError('bind_inputs given the same input more than once')
+    for wire in block.wirevector_subset(Input).difference(wires):
+        raise PyrtlError('Input "%s" is not among the bound inputs' % wire.name)
+    return wires
+
+
+def _trace_length(tracer):
+    if isinstance(tracer, SimulationTrace) and len(tracer.trace):
+        return len(tracer)
+    return None
+
+
+def _truncate_trace(tracer, length):
+    if length is not None and _trace_length(tracer) is not None:
+        tracer.truncate(length)
+
 
 class Simulation(object):
     """A class for simulating blocks of logic step by step."""
@@ -42,7 +329,8 @@ class Simulation(object):
 
     def __init__(
             self, tracer=None, register_value_map=None, memory_value_map=None,
-            default_value=0, block=None):
+            default_value=0, block=None, dense_mem_addrwidth=None, profile=False,
+            count_toggles=False):
         """ Creates a new circuit simulator
 
         :param tracer: an instance of SimulationTrace used to store execution results.
@@ -57,6 +345,16 @@ class Simulation(object):
           use the value stored in the object (default to 0)
         :param block: the hardware block to be traced (which might be of type PostSynthesisBlock).
           defaults to the working block
+        :param dense_mem_addrwidth: if set, memories with an addrwidth of at
+          most this are stored in preallocated lists rather than in sparse
+          dictionaries, and the contents of roms that small are read out of
+          them once, up front.  inspect_mem then leaves out the addresses of a
+          dense memory holding the default value.
+        :param profile: if True, the number of evaluations of and the time
+          spent on each net with a logic function are recorded in the
+          attribute profile, a SimulationProfile
+        :param count_toggles: if True, the number of bits of each wire that
+          flip from one cycle to the next is counted, see toggle_counts
 
         Warning: Simulation initializes some things when called with __init__,
         so changing items in the block for Simulation will likely break
@@ -74,6 +372,9 @@ class Simulation(object):
         self.memvalue = {}  # map from {memid :{address: value}}
         self.block = block
         self.default_value = default_value
+        self.dense_mem_addrwidth = dense_mem_addrwidth
+        self.profile = profile or None  # replaced by a SimulationProfile in _initialize
+        self.count_toggles = count_toggles
         if tracer is None:
             tracer = SimulationTrace()
         self.tracer = tracer
@@ -129,6 +430,18 @@ class Simulation(object):
                         raise PyrtlError('error, %s at %s in %s outside of bounds' %
                                          (str(val), str(addr), mem.name))
 
+        # store small memories densely, and read small roms out once
+        self._rom_data = {}
+        for mem_net in self.block.logic_subset('m@'):
+            mem = mem_net.op_param[1]
+            memid = mem.id
+            state = _dense_mem_state(mem, self.memvalue[memid], default_value,
+                                     self.dense_mem_addrwidth)
+            if isinstance(state, _RomData):
+                self._rom_data[memid] = state
+            elif state is not self.memvalue[memid]:
+                self.memvalue[memid] = state
+
         # set all other variables to default value
         for w in self.block.wirevector_set:
             if w not in self.value:
@@ -138,6 +451,25 @@ class Simulation(object):
         self.reg_update_nets = tuple((self.block.logic_subset('r')))
         self.mem_update_nets = tuple((self.block.logic_subset('@')))
 
+        # subclasses that change the semantics of the ops keep the
+        # net-by-net interpretation through _execute
+        if type(self)._execute is Simulation._execute and \
+                type(self)._sanitize is Simulation._sanitize:
+            self.compiled_nets = tuple(f for f in map(self._compile_net, self.ordered_nets)
+                                       if f is not None)
+        else:
+            self.compiled_nets = None
+
+        # the toggles of each wire, and its value in the last cycle
+        self._toggles = {w: 0 for w in self.value} if self.count_toggles else None
+        self._toggle_prior = {w: 0 for w in self.value}
+
+        if self.profile:
+            self.profile = SimulationProfile(net for net in self.ordered_nets if net.op not in 'r@')
+            if self.compiled_nets is not None:
+                self.compiled_nets = tuple(self.profile._timed(i, execute)
+                                           for i, execute in enumerate(self.compiled_nets))
+
     def step(self, provided_inputs):
         """ Take the simulation forward one cycle
 
@@ -150,11 +482,110 @@ class Simulation(object):
         sim.step({'a': 1, 'x': 23}) to simulate a cycle with values 1 and 23
         respectively
         """
+        self._step(self._set_inputs, provided_inputs)
+
+    def bind_inputs(self, inputs, validate=True):
+        """ Return a function stepping the simulation with values given in a fixed order.
+
+        :param inputs: a list of all of the Input WireVectors (or their names)
+        :param validate: if False, the values are trusted to fit their inputs
+          and are not checked
+        :return: a function step_values(*values) taking one value per input,
+          in the order of inputs, and doing the same as step
+
+        The list of inputs is checked once here rather than on every step.
+        Example: step = sim.bind_inputs(['a', 'x']); step(1, 23)
+        """
+        wires = _bound_input_wires(self.block, inputs)
+        ports = tuple((w, w.bitmask) for w in wires)
+        value = self.value
+
+        def set_values(values):
+            if len(values) != len(ports):
+                raise PyrtlError('expected %d input values, got %d' % (len(ports), len(values)))
+            if validate:
+                for (wire, mask), val in zip(ports, values):
+                    if not isinstance(val, numbers.Integral) or not 0 <= val <= mask:
+                        raise PyrtlError('the value %s for input "%s" cannot be represented '
+                                         'using its bitwidth' % (str(val), wire.name))
+            value.update(zip(wires, values))
+
+        def step_values(*values):
+            self._step(set_values, values)
+        return step_values
+
+    def step_repeat(self, provided_inputs, n_cycles):
+        """ Take the simulation forward n_cycles cycles, with the same inputs in each
+
+        :param provided_inputs: a dictionary mapping wirevectors to their values,
+          as passed to step
+        :param n_cycles: the number of cycles to simulate
+        :return: the number of those cycles that were skipped rather than simulated
+
+        Once a cycle leaves the registers unchanged and either writes no
+        memory or writes exactly what the cycle before it wrote, the design
+        has reached a fixed point: with the inputs held, every later cycle
+        computes the very same values.  The remaining cycles are then not
+        simulated, but added to the tracer all at once by its
+        repeat_last_step (which takes constant time for a SimulationTrace
+        with run_length=True).  Skipped cycles are not counted in profile.
+        """
+        value = self.value
+        prior_writes = None
+        for cycle in range(n_cycles):
+            self.step(provided_inputs)
+            writes = [(net.op_param[0], value[net.args[0]], value[net.args[1]])
+                      for net in self.mem_update_nets if value[net.args[2]]]
+            if ((not writes or writes == prior_writes) and
+                    all(value[net.dests[0]] == self._sanitize(value[net.args[0]], net.dests[0])
+                        for net in self.reg_update_nets)):
+                skipped = n_cycles - cycle - 1
+                if skipped and self.tracer is not None:
+                    self.tracer.repeat_last_step(skipped)
+                return skipped
+            prior_writes = writes
+        return 0
+
+    def _step(self, set_inputs, inputs):
+        """ Take the simulation forward one cycle, with set_inputs(inputs) setting the Inputs. """
         # To avoid weird loops, we need a copy of the old values which
         # we can then use to make our updates from
         prior_value = self.value.copy()
+        set_inputs(inputs)
+
+        # Do all of the reg operations based off of the priors at clk edge
+        for net in self.reg_update_nets:
+            argval = prior_value[net.args[0]]
+            self.value[net.dests[0]] = self._sanitize(argval, net.dests[0])
+
+        if self.compiled_nets is not None:
+            for execute in self.compiled_nets:
+                execute()
+        else:
+            execute = self._execute
+            if self.profile is not None:
+                execute = self.profile._timed_execute(execute)
+            for net in self.ordered_nets:
+                execute(net)
+
+            # Do all of the mem operations based off the new values changed in _execute()
+        for net in self.mem_update_nets:
+            self._mem_update(net)
+
+        if self._toggles is not None:
+            self._count_toggles()
+
+        # at the end of the step, record the values to the trace
+        # print self.value # Helpful Debug Print
+        if self.tracer is not None:
+            self.tracer.add_step(self.value)
+
+        # finally, if any of the rtl_assert assertions are failing then we should
+        # raise the appropriate exceptions
+        check_rtl_assertions(self)
 
-        # Check that all Input have a corresponding provided_input
+    def _set_inputs(self, provided_inputs):
+        """ Check the values provided to step and set the Inputs to them. """
         input_set = self.block.wirevector_subset(Input)
         supplied_inputs = set()
         for i in provided_inputs:
@@ -186,27 +617,6 @@ class Simulation(object):
             for i in input_set.difference(supplied_inputs):
                 raise PyrtlError('Input "%s" has no input value specified' % i.name)
 
-        # Do all of the reg operations based off of the priors at clk edge
-        for net in self.reg_update_nets:
-            argval = prior_value[net.args[0]]
-            self.value[net.dests[0]] = self._sanitize(argval, net.dests[0])
-
-        for net in self.ordered_nets:
-            self._execute(net)
-
-            # Do all of the mem operations based off the new values changed in _execute()
-        for net in self.mem_update_nets:
-            self._mem_update(net)
-
-        # at the end of the step, record the values to the trace
-        # print self.value # Helpful Debug Print
-        if self.tracer is not None:
-            self.tracer.add_step(self.value)
-
-        # finally, if any of the rtl_assert assertions are failing then we should
-        # raise the appropriate exceptions
-        check_rtl_assertions(self)
-
     def inspect(self, w):
         """ Get the value of a wirevector in the last simulation cycle.
 
@@ -230,6 +640,57 @@ class Simulation(object):
         """
         return self.memvalue[mem.id]
 
+    def toggle_counts(self):
+        """ Return the number of bit flips of each wire so far, as {wire name: toggles}.
+
+        Requires the simulation to be created with count_toggles=True.  Every
+        wire is taken to be 0 before the first cycle.  The counts can be
+        turned into an energy estimate with pyrtl.analysis.power_estimation.
+        """
+        if self._toggles is None:
+            raise PyrtlError('toggles are only counted by a simulation created '
+                             'with count_toggles=True')
+        return {w.name: count for w, count in self._toggles.items() if not isinstance(w, Const)}
+
+    def _count_toggles(self):
+        toggles, prior = self._toggles, self._toggle_prior
+        for w, val in self.value.items():
+            flipped = val ^ prior[w]
+            if flipped:
+                toggles[w] += bin(flipped).count('1')
+                prior[w] = val
+
+    def snapshot(self):
+        """ Return the current state of the simulation, to be passed to restore.
+
+        This captures the values of all of the wires, the contents of the
+        memories and the length of the trace, so that a simulation can be
+        forked from a warmed-up state instead of replaying the cycles leading
+        up to it.
+        """
+        return SimulationSnapshot(
+            registers={w.name: val for w, val in self.value.items() if isinstance(w, Register)},
+            memories={name: dict(self.memvalue[mem.id])
+                      for name, mem in _block_memories(self.block).items()},
+            values={w.name: val for w, val in self.value.items()},
+            trace_length=_trace_length(self.tracer))
+
+    def restore(self, snapshot):
+        """ Set the simulation to the state captured by snapshot.
+
+        A trace longer than it was when the snapshot was taken is cut back
+        to that length.
+        """
+        wires = self.block.wirevector_by_name
+        for name, val in snapshot.values.items():
+            self.value[wires[name]] = val  # in place, the compiled nets hold on to self.value
+        for name, mem in _block_memories(self.block).items():
+            if isinstance(self.memvalue[mem.id], _DenseMemory):
+                self.memvalue[mem.id].load(snapshot.memories[name])
+            else:
+                self.memvalue[mem.id] = dict(snapshot.memories[name])
+        _truncate_trace(self.tracer, snapshot.trace_length)
+
     @staticmethod
     def _sanitize(val, wirevector):
         """Return a modified version of val that would fit in wirevector.
@@ -266,7 +727,9 @@ class Simulation(object):
             memid = net.op_param[0]
             mem = net.op_param[1]
             read_addr = self.value[net.args[0]]
-            if isinstance(mem, RomBlock):
+            if memid in self._rom_data:
+                result = self._rom_data[memid][read_addr]
+            elif isinstance(mem, RomBlock):
                 result = mem._get_read_data(read_addr)
             else:
                 result = self.memvalue[memid].get(read_addr, self.default_value)
@@ -275,6 +738,94 @@ class Simulation(object):
 
         self.value[net.dests[0]] = self._sanitize(result, net.dests[0])
 
+    def _compile_net(self, net):
+        """Return a function doing the combinational logic update of the given net.
+
+        The returned closure has the same effect as _execute(net), but the
+        dispatch on the op, the wires read and the mask of the result are all
+        resolved once up front rather than on every cycle.  Returns None for
+        nets with no logic function (registers and memory write ports).
+        """
+        value = self.value
+        op = net.op
+        if op in 'r@':
+            return None
+        dest = net.dests[0]
+        mask = dest.bitmask
+
+        if op == 'w':
+            arg, = net.args
+
+            def execute():
+                value[dest] = value[arg] & mask
+        elif op == 'x':
+            sel, f, t = net.args
+
+            def execute():
+                value[dest] = (value[f] if value[sel] == 0 else value[t]) & mask
+        elif op in self.simple_func and len(net.args) == 1:
+            func = self.simple_func[op]
+            arg, = net.args
+
+            def execute():
+                value[dest] = func(value[arg]) & mask
+        elif op in self.simple_func:
+            func = self.simple_func[op]
+            left, right = net.args
+
+            def execute():
+                value[dest] = func(value[left], value[right]) & mask
+        elif op == 'c':
+            args = tuple((arg, len(arg)) for arg in net.args)
+
+            def execute():
+                result = 0
+                for arg, width in args:
+                    result = (result << width) | value[arg]
+                value[dest] = result & mask
+        elif op == 's':
+            source = net.args[0]
+            low = net.op_param[0]
+            if tuple(net.op_param) == tuple(range(low, low + len(net.op_param))):
+                # a contiguous slice is a single shift
+                def execute():
+                    value[dest] = (value[source] >> low) & mask
+            else:
+                bits = net.op_param[::-1]
+
+                def execute():
+                    result = 0
+                    source_val = value[source]
+                    for b in bits:
+                        result = (result << 1) | (0x1 & (source_val >> b))
+                    value[dest] = result & mask
+        elif op == 'm':
+            memid, mem = net.op_param
+            addr, = net.args
+            if memid in self._rom_data:
+                rom_data = self._rom_data[memid]
+
+                def execute():
+                    value[dest] = rom_data[value[addr]] & mask
+            elif isinstance(mem, RomBlock):
+                read_data = mem._get_read_data
+
+                def execute():
+                    value[dest] = read_data(value[addr]) & mask
+            elif isinstance(self.memvalue[memid], _DenseMemory):
+                storage = self.memvalue[memid].storage  # restore loads it in place
+
+                def execute():
+                    value[dest] = storage[value[addr]] & mask
+            else:
+                memvalue, default_value = self.memvalue, self.default_value
+
+                def execute():
+                    value[dest] = memvalue[memid].get(value[addr], default_value) & mask
+        else:
+            raise PyrtlInternalError('error, unknown op type')
+        return execute
+
     def _mem_update(self, net):
         """Handle the mem update for the simulation of the given net (which is a memory).
 
@@ -293,6 +844,130 @@ class Simulation(object):
             self.memvalue[memid][write_addr] = write_val
 
 
+class EventDrivenSimulation(Simulation):
+    """A Simulation that re-evaluates only the nets whose inputs changed.
+
+    Each cycle starts from the wires that changed at the clock edge (the
+    Inputs, the Registers, and the read ports of memories written in the
+    previous cycle) and evaluates, in topological order, only the nets
+    reached from them through wires whose value actually changed.  Designs
+    in which most of the logic is idle most of the time simulate
+    proportionally faster.  The results are the same as those of Simulation.
+
+    Keeping track of the changes costs time of its own, so when most of the
+    inputs change every cycle (random stimulus, for example) this is slower
+    than Simulation.  Choose it for designs whose inputs are held for many
+    cycles at a time: with the inputs changing every tenth cycle, the
+    LowActivity benchmark steps the synthesized multiplier and shifter four
+    to six times faster than Simulation does.
+
+    nets_evaluated holds the number of nets evaluated in the last cycle, and
+    activity() gives the fraction of the nets evaluated per cycle so far
+    (only running totals are kept, so long simulations use no more memory).
+    """
+
+    def _initialize(self, register_value_map=None, memory_value_map=None, default_value=None):
+        super(EventDrivenSimulation, self)._initialize(
+            register_value_map, memory_value_map, default_value)
+        if self.compiled_nets is None:
+            raise PyrtlError('EventDrivenSimulation does not support subclasses '
+                             'overriding _execute or _sanitize')
+
+        # the nets with a logic function, in topological order, and the
+        # positions in that order of the nets reading each wire and memory
+        self.event_nets = tuple(net for net in self.ordered_nets if net.op not in 'r@')
+        self._dests = tuple(net.dests[0] for net in self.event_nets)
+        position = {net: i for i, net in enumerate(self.event_nets)}
+        wire_src_dict, wire_sink_dict = self.block._net_connections()
+        self._fanout = {}
+        for wire in self.block.wirevector_set:
+            sinks = wire_sink_dict.get(wire, ())
+            self._fanout[wire] = tuple(sorted(position[net] for net in sinks if net in position))
+        self._mem_readers = {}
+        for net in self.block.logic_subset('m'):
+            self._mem_readers.setdefault(net.op_param[0], []).append(position[net])
+
+        self._inputs = tuple(self.block.wirevector_subset(Input))
+        self._pending = set(range(len(self.event_nets)))  # everything runs in the first cycle
+        self.nets_evaluated = 0
+        self._evaluated_total = 0  # the sum of nets_evaluated over every cycle
+        self._evaluated_cycles = 0
+
+    def _step(self, set_inputs, inputs):
+        value, fanout, dests = self.value, self._fanout, self._dests
+        compiled_nets = self.compiled_nets
+
+        # the values the registers take at this clock edge
+        reg_values = [(net.dests[0], value[net.args[0]] & net.dests[0].bitmask)
+                      for net in self.reg_update_nets]
+        prior_inputs = [(w, value[w]) for w in self._inputs]
+        set_inputs(inputs)
+
+        dirty = self._pending
+        self._pending = set()
+        for w, prior in prior_inputs:
+            if value[w] != prior:
+                dirty.update(fanout[w])
+        for reg, new in reg_values:
+            if value[reg] != new:
+                value[reg] = new
+                dirty.update(fanout[reg])
+
+        # a net is only ever marked by nets before it in the topological
+        # order, so each dirty net is evaluated once, after all of its args
+        queue = list(dirty)
+        heapq.heapify(queue)
+        evaluated = 0
+        while queue:
+            i = heapq.heappop(queue)
+            dest = dests[i]
+            prior = value[dest]
+            compiled_nets[i]()
+            evaluated += 1
+            if value[dest] != prior:
+                for sink in fanout[dest]:
+                    if sink not in dirty:
+                        dirty.add(sink)
+                        heapq.heappush(queue, sink)
+        self.nets_evaluated = evaluated
+        self._evaluated_total += evaluated
+        self._evaluated_cycles += 1
+
+        # memory writes are seen by the read ports in the next cycle
+        for net in self.mem_update_nets:
+            memid = net.op_param[0]
+            addr, val, enable = (value[arg] for arg in net.args)
+            if enable:
+                mem = self.memvalue[memid]
+                if mem.get(addr, self.default_value) != val:
+                    self._pending.update(self._mem_readers.get(memid, ()))
+                mem[addr] = val
+
+        if self._toggles is not None:
+            self._count_toggles()
+        if self.tracer is not None:
+            self.tracer.add_step(self.value)
+        check_rtl_assertions(self)
+
+    def step_repeat(self, provided_inputs, n_cycles):
+        skipped = super(EventDrivenSimulation, self).step_repeat(provided_inputs, n_cycles)
+        if skipped:
+            self.nets_evaluated = 0
+            self._evaluated_cycles += skipped
+        return skipped
+    step_repeat.__doc__ = Simulation.step_repeat.__doc__
+
+    def restore(self, snapshot):
+        super(EventDrivenSimulation, self).restore(snapshot)
+        self._pending = set(range(len(self.event_nets)))  # nothing is known to be unchanged
+
+    def activity(self):
+        """ Return the average fraction of the nets evaluated per cycle. """
+        if not self._evaluated_cycles or not self.event_nets:
+            return 0.0
+        return self._evaluated_total / float(self._evaluated_cycles * len(self.event_nets))
+
+
 # ----------------------------------------------------------------
 #    ___       __  ___     __
 #   |__   /\  /__`  |     /__` |  |\/|
@@ -317,20 +992,70 @@ class FastSimulation(object):
     #  Careful use of repr() is used to make sure that strings stay the same
     #  when put into the generated code
 
+    # largest addrwidth for which a memory gets a dense per-lane array in batched mode
+    _lane_mem_max_addrwidth = 16
+
     def __init__(
             self, register_value_map=None, memory_value_map=None,
-            default_value=0, tracer=None, block=None, code_file=None):
+            default_value=0, tracer=None, block=None, code_file=None, lanes=None,
+            code_cache=None, native=False, dense_mem_addrwidth=None, profile=False,
+            count_toggles=False, chunk_size=None, incremental=False):
         """
         Instantiates a Fast Simulation instance.
 
         :param code_file: The file in which to store a copy of the generated
         python code. Defaults to no code being stored.
+        :param lanes: If set to an integer N, the simulation is run in batched
+          mode: N independent copies of the design ("lanes") are simulated at
+          once.  Each value passed to step is then a sequence of N values (or
+          a single value shared by all lanes) and inspect returns a NumPy
+          array with one entry per lane.  Requires NumPy.
+        :param code_cache: a SimulationCodeCache in which the compiled code is
+          looked up before generating it (and stored after generating it), so
+          that building a simulator of an already seen design is cheap.
+        :param native: If True, the design is compiled to C with the system C
+          compiler (the CC environment variable, or "cc") and run as native
+          code through ctypes.  The simulation silently falls back to the
+          Python code if no compiler is found, or if the design has wires
+          wider than 64 bits or memories too large to store densely; the
+          attribute native tells which one is in use.  Memories are then
+          stored densely, so inspect_mem leaves out addresses holding the
+          default value.  Not supported in batched mode.
+        :param dense_mem_addrwidth: if set, memories with an addrwidth of at
+          most this are stored in preallocated lists, which the generated code
+          indexes directly, and roms that small are read out once, up front.
+          Ignored in batched mode, which has its own memory storage.
+        :param profile: if True, the generated code records the number of
+          evaluations of and the time spent on each net in the attribute
+          profile, a SimulationProfile.  Not supported in batched or native mode.
+        :param count_toggles: if True, the generated code counts the number of
+          bits of each wire that flip from one cycle to the next, see
+          toggle_counts.  Not supported in batched or native mode.
+        :param chunk_size: if set, the generated code is split into functions
+          of about this many nets each, which are compiled one by one rather
+          than as a single huge function.  Blocks of more than 50000 nets are
+          split into chunks of 10000 nets by default.  Not supported in
+          batched mode, or together with profile or count_toggles.
+        :param incremental: if True, each region of the block (see
+          pyrtl.analysis.partition_block) is compiled into a function of its
+          own, keyed by the structure of its logic, so that rebuild only has
+          to compile the regions that changed.  With a code_cache the regions
+          are also cached on their own.  Finding the regions costs about as
+          much as compiling them, so rebuild is only modestly faster (the
+          Rebuild benchmark measures it), and slower for designs that are
+          mostly one region.  Not supported in batched or native mode,
+          together with chunk_size, or when profiling or counting toggles.
 
         Look at Simulation.__init__ for descriptions for the other parameters
 
         This builds the Fast Simulation compiled Python code, so all changes
         to the circuit after calling this function will not be reflected in
         the simulation
+
+        In batched mode every net is evaluated once per cycle across all of the
+        lanes with vectorized uint64 operations.  Designs with wires wider than
+        64 bits (or with memories too large to store densely per lane) instead
+        fall back to running the scalar generated code once per lane.
         """
 
         block = working_block(block)
@@ -343,9 +1068,19 @@ class FastSimulation(object):
         self.tracer = tracer
         self.sim_func = None
         self.code_file = code_file
+        self.code_cache = code_cache
         self.mems = {}
         self.regs = {}
         self.internal_names = _PythonSanitizer('_fastsim_tmp_')
+        self.lanes = lanes
+        self._vectorized = False
+        self.native = native
+        self.dense_mem_addrwidth = dense_mem_addrwidth if lanes is None else None
+        self.profile = profile or None  # replaced by a SimulationProfile in _initialize
+        self.count_toggles = count_toggles
+        self.chunk_size = chunk_size
+        self.incremental = incremental
+        self._region_code = {}  # the code of each region by key, in incremental mode
         self._initialize(register_value_map, memory_value_map)
 
     def _initialize(self, register_value_map=None, memory_value_map=None, default_value=None):
@@ -365,17 +1100,281 @@ class FastSimulation(object):
             else:
                 self.regs[r.name] = default_value
 
+        # memories are named by their number rather than their memid, so
+        # that the code of a rebuilt design is found in the code cache
+        self._mem_numbers = _memory_numbers(self.block)
         self._initialize_mems(memory_value_map)
+        if self.profile:
+            if self.lanes is not None or self.native:
+                raise PyrtlError('profiling is not supported in batched or native mode')
+            self.profile = SimulationProfile(self.block)
+        # the wires whose toggles are counted, the counts and their last values
+        self._toggle_wires = ()
+        if self.count_toggles:
+            if self.lanes is not None or self.native:
+                raise PyrtlError('counting toggles is not supported in batched or native mode')
+            self._toggle_wires = tuple(sorted(
+                (w for w in self.block.wirevector_set if not isinstance(w, Const)),
+                key=lambda w: w.name))
+        self._toggles = [0] * len(self._toggle_wires)
+        self._toggle_prior = [0] * len(self._toggle_wires)
+        context = self._exec_context()
+        if self.lanes is not None:
+            if self.native:
+                raise PyrtlError('native FastSimulation is not supported in batched mode')
+            self._initialize_lanes(context)
+
+        if self.chunk_size is not None:
+            if not isinstance(self.chunk_size, numbers.Integral) or self.chunk_size < 1:
+                raise PyrtlError('chunk_size must be a positive integer')
+            if self.lanes is not None or self.profile is not None or self._toggle_wires:
+                raise PyrtlError('chunked code is not supported in batched mode, '
+                                 'or when profiling or counting toggles')
+        if self.incremental:
+            if (self.lanes is not None or self.native or self.chunk_size is not None
+                    or self.profile is not None or self._toggle_wires):
+                raise PyrtlError('incremental compilation is not supported in batched or '
+                                 'native mode, with chunk_size, or when profiling or '
+                                 'counting toggles')
+
+        self._run_func = None  # compiled on the first call to run
+        self._assert_wires = sorted(self.block.rtl_assert_dict, key=lambda w: w.name)
+        if self.native:
+            self.native = self._initialize_native()
+            if self.native:
+                self._run_func = self._native_run_func
+                return
+
+        if self.incremental:
+            self._load_regions(context)
+            self._run_func = self._chunked_run_func
+            self.sim_func = context['sim_func']
+            return
+        logic_creator = self._load_code(self._compiled, self._codegen_options(), self.code_file)
+        if isinstance(logic_creator, tuple):  # chunked code
+            for code in logic_creator:
+                exec(code, context)
+            self._run_func = self._chunked_run_func
+        else:
+            exec(logic_creator, context)
+        self.sim_func = context['sim_func']
 
-        s = self._compiled()
-        if self.code_file is not None:
-            with open(self.code_file, 'w') as file:
-                file.write(s)
-
+    def _exec_context(self):
+        """ The globals the generated code is executed with. """
         context = {}
-        logic_creator = compile(s, '<string>', 'exec')
-        exec(logic_creator, context)
-        self.sim_func = context['sim_func']
+        if self.profile is not None:
+            context.update({'_fastsim_clock': _profile_clock,
+                            '_fastsim_prof_count': self.profile.counts,
+                            '_fastsim_prof_time': self.profile.times})
+        if self._toggle_wires:
+            context.update({'_fastsim_toggles': self._toggles,
+                            '_fastsim_toggle_prior': self._toggle_prior})
+        return context
+
+    def toggle_counts(self):
+        """ Return the number of bit flips of each wire so far, as {wire name: toggles}.
+
+        Requires the simulation to be created with count_toggles=True.  Every
+        wire is taken to be 0 before the first cycle.  The counts can be
+        turned into an energy estimate with pyrtl.analysis.power_estimation.
+        """
+        if not self.count_toggles:
+            raise PyrtlError('toggles are only counted by a simulation created '
+                             'with count_toggles=True')
+        return {w.name: count for w, count in zip(self._toggle_wires, self._toggles)}
+
+    def rebuild(self, block=None, tracer=None):
+        """ Switch the simulation over to an edited (or another) block, keeping its state.
+
+        :param block: the block to simulate from now on (defaults to the working block)
+        :param tracer: the tracer of the rebuilt simulation (defaults to a new
+          SimulationTrace of the block)
+
+        Registers keep their values if the block still has a Register of the
+        same name and bitwidth, and memories keep their contents if it still
+        has a memory of the same name, bitwidth and address width.  Everything
+        else starts out at the default value.  In incremental mode only the
+        regions of the block whose logic changed are compiled again.
+        """
+        if self.lanes is not None or self.native:
+            raise PyrtlError('rebuild is not supported in batched or native mode')
+        block = working_block(block)
+        block.sanity_check()
+
+        old_regs = {r.name: (r.bitwidth, self.regs[r.name])
+                    for r in self.block.wirevector_subset(Register)}
+        old_mems = {}
+        for net in self.block.logic_subset('m@'):
+            mem = net.op_param[1]
+            if not isinstance(mem, RomBlock):
+                old_mems[mem.name] = (mem.bitwidth, mem.addrwidth,
+                                      self.mems[self._mem_varname(mem)])
+        register_value_map = {}
+        for r in block.wirevector_subset(Register):
+            if r.name in old_regs and old_regs[r.name][0] == r.bitwidth:
+                register_value_map[r] = old_regs[r.name][1]
+        memory_value_map = {}
+        for net in block.logic_subset('m@'):
+            mem = net.op_param[1]
+            old = old_mems.get(mem.name)
+            if (old is not None and old[:2] == (mem.bitwidth, mem.addrwidth)
+                    and not isinstance(mem, RomBlock)):
+                memory_value_map[mem] = dict(old[2])
+
+        self.block = block
+        self.tracer = SimulationTrace(block=block) if tracer is None else tracer
+        self.regs = {}
+        self.mems = {}
+        self._initialize(register_value_map, memory_value_map)
+
+    def _load_code(self, generate, options, code_file=None):
+        """ Return the compiled code of generate(), going through the code cache.
+
+        If generate returns a list of sources (the chunks of chunked code)
+        each is compiled separately, and a tuple of code objects is returned.
+        """
+        logic_creator, cache_key = None, None
+        if self.code_cache is not None:
+            cache_key = self.code_cache.key(self.block, self._traced_names(),
+                                            self.default_value, options)
+            logic_creator = self.code_cache.load(cache_key)
+
+        if logic_creator is None or code_file is not None:
+            s = generate()
+            if code_file is not None:
+                with open(code_file, 'w') as file:
+                    file.write('\n\n\n'.join(s) if isinstance(s, list) else s)
+        if logic_creator is None:
+            if isinstance(s, list):
+                logic_creator = _compile_sources(s)
+            else:
+                logic_creator = compile(s, '<string>', 'exec')
+            if self.code_cache is not None:
+                self.code_cache.store(cache_key, logic_creator)
+        return logic_creator
+
+    def _traced_names(self):
+        """ The names of the wires the generated code has to report. """
+        if self.tracer is None:
+            return ()
+        return tuple(w.name for w in self.tracer.wires_to_track)
+
+    def _codegen_options(self):
+        """ Everything besides the block that changes the generated code. """
+        options = {'vectorized': self._vectorized,
+                   'dense_mem_addrwidth': self.dense_mem_addrwidth,
+                   'profile': self.profile is not None, 'toggles': bool(self._toggle_wires),
+                   'chunk_size': self._chunk_nets()}
+        if self.code_cache is not None and (self.profile is not None or self._toggle_wires):
+            # the profiled nets and the wires whose toggles are counted are
+            # indexed by their position, which the structural hash of the
+            # block leaves open, so their order is part of the key as well
+            import hashlib
+            labels = _interface_labels(self.block.wirevector_set, self._traced_names())
+            order = _net_labels(self.block, labels, _memory_numbers(self.block))
+            if self.profile is None:
+                order = []
+            order.extend(labels[w] for w in self._toggle_wires)
+            options['order'] = hashlib.sha1('\n'.join(order).encode('utf-8')).hexdigest()
+        return options
+
+    # blocks of more nets than this have their code split into chunks of
+    # _auto_chunk_size nets, unless a chunk_size is given
+    _auto_chunk_min_nets = 50000
+    _auto_chunk_size = 10000
+
+    def _chunk_nets(self):
+        """ The number of nets per chunk of the generated code, None if it is not chunked. """
+        if (self.lanes is not None or self.profile is not None or self._toggle_wires
+                or self.incremental):
+            return None
+        if self.chunk_size is not None:
+            return self.chunk_size
+        if len(self.block.logic) > self._auto_chunk_min_nets:
+            return self._auto_chunk_size
+        return None
+
+    def _initialize_lanes(self, context):
+        """ Convert the register and memory state to per-lane storage. """
+        try:
+            import numpy
+        except ImportError:
+            raise PyrtlError('batched FastSimulation (lanes=N) requires NumPy')
+        if not isinstance(self.lanes, numbers.Integral) or self.lanes < 1:
+            raise PyrtlError('lanes must be a positive integer, not "%s"' % str(self.lanes))
+        if self.tracer is not None and (not isinstance(self.tracer, SimulationTrace) or
+                                        isinstance(self.tracer.trace, CompactTraceStorage)):
+            raise PyrtlError('batched FastSimulation can only record to a SimulationTrace '
+                             'with the default (list) storage')
+        self._np = numpy
+        self._vectorized = self._can_vectorize()
+        dtype = numpy.uint64 if self._vectorized else object
+
+        for name, val in self.regs.items():
+            self.regs[name] = self._lane_values(self.block.wirevector_by_name[name], val, dtype)
+
+        for net in self.block.logic_subset('m@'):
+            mem = net.op_param[1]
+            varname = self._mem_varname(mem)
+            init = self.mems[varname]
+            if isinstance(init, (list, numpy.ndarray)):
+                continue  # already converted by another port to this memory
+            if not self._vectorized:
+                if not isinstance(mem, RomBlock):
+                    self.mems[varname] = [dict(init) for lane in range(self.lanes)]
+            elif isinstance(mem, RomBlock):
+                self.mems[varname] = numpy.array(
+                    [mem._get_read_data(a) for a in range(2**mem.addrwidth)], dtype=dtype)
+            else:
+                storage = numpy.full((self.lanes, 2**mem.addrwidth), self.default_value, dtype)
+                for addr, val in init.items():
+                    storage[:, addr] = val
+                self.mems[varname] = storage
+
+        if self._vectorized:
+            context.update({'_np': numpy, '_u64': numpy.uint64,
+                            '_lane_idx': numpy.arange(self.lanes)})
+
+    def _can_vectorize(self):
+        """ True if every wire and memory of the block fits the uint64 lane path. """
+        if any(len(w) > 64 for w in self.block.wirevector_set):
+            return False
+        for net in self.block.logic_subset('m@'):
+            mem = net.op_param[1]
+            if mem.addrwidth > self._lane_mem_max_addrwidth or mem.bitwidth > 64:
+                return False
+            if isinstance(mem, RomBlock):
+                # roms whose data cannot be materialized up front have to
+                # raise their errors lazily (i.e. only when read)
+                try:
+                    for addr in range(2**mem.addrwidth):
+                        mem._get_read_data(addr)
+                except PyrtlError:
+                    return False
+        return True
+
+    def _lane_values(self, wire, value, dtype=None):
+        """ Validate value(s) for wire and return them as a per-lane array. """
+        np = self._np
+        if dtype is None:
+            dtype = np.uint64 if self._vectorized else object
+        values = np.asarray(value)
+        if values.ndim == 0:
+            values = np.full(self.lanes, value, dtype=values.dtype)
+        if values.shape != (self.lanes,):
+            raise PyrtlError('expected %d lane values for wire "%s", got shape %s'
+                             % (self.lanes, wire.name, str(values.shape)))
+        if values.dtype.kind == 'O':
+            for lane_value in values:
+                if not isinstance(lane_value, numbers.Integral):
+                    raise PyrtlError('Wire {} has non-integer value {}'.format(wire, lane_value))
+        elif values.dtype.kind not in 'uib':
+            raise PyrtlError('Wire {} has non-integer values of type {}'
+                             .format(wire, values.dtype))
+        if int(values.min()) < 0 or int(values.max()) > wire.bitmask:
+            raise PyrtlError("Wire {} has a value which cannot be represented"
+                             " using its bitwidth".format(wire))
+        return values.astype(dtype)
 
     def _initialize_mems(self, memory_value_map):
         if memory_value_map is not None:
@@ -384,13 +1383,15 @@ class FastSimulation(object):
                     raise PyrtlError('error, one or more of the memories in the map is a RomBlock')
                 self.mems[self._mem_varname(mem)] = mem_map
 
+        seen = set()
         for net in self.block.logic_subset('m@'):
             mem = net.op_param[1]
-            if self._mem_varname(mem) not in self.mems:
-                if isinstance(mem, RomBlock):
-                    self.mems[self._mem_varname(mem)] = mem
-                else:
-                    self.mems[self._mem_varname(mem)] = {}
+            varname = self._mem_varname(mem)
+            if varname not in seen:
+                seen.add(varname)
+                self.mems[varname] = _dense_mem_state(mem, self.mems.get(varname, {}),
+                                                      self.default_value,
+                                                      self.dense_mem_addrwidth)
 
     def step(self, provided_inputs):
         """ Run the simulation for a cycle
@@ -398,20 +1399,97 @@ class FastSimulation(object):
         :param provided_inputs: a dictionary mapping WireVectors (or their names)
           to their values for this step
           eg: {wire: 3, "wire_name": 17}
+
+        In batched mode each value may be a sequence with one value per lane
+          eg: {wire: [3, 4, 5], "wire_name": 17}
         """
-        # validate_inputs
+        if self.lanes is not None:
+            return self._step_lanes(provided_inputs)
+        if self.native:
+            return self._step_native(provided_inputs)
+
+        self._step(self._validated_inputs(provided_inputs))
+
+    def _validated_inputs(self, provided_inputs):
+        """ Check the values provided to step and return them in a dict keyed by name. """
         for wire, value in provided_inputs.items():
             if value > wire.bitmask or value < 0:
                 raise PyrtlError("Wire {} has value {} which cannot be represented"
                                  " using its bitwidth".format(wire, value))
+        return {self._to_name(wire): value for wire, value in provided_inputs.items()}
+
+    def bind_inputs(self, inputs, validate=True):
+        """ Return a function stepping the simulation with values given in a fixed order.
 
+        :param inputs: a list of all of the Input WireVectors (or their names)
+        :param validate: if False, the values are trusted to fit their inputs
+          and are not checked
+        :return: a function step_values(*values) taking one value per input,
+          in the order of inputs, and doing the same as step
+
+        The list of inputs is checked once here rather than on every step.
+        Example: step = sim.bind_inputs(['a', 'x']); step(1, 23)
+        """
+        wires = _bound_input_wires(self.block, inputs)
+        if self.lanes is not None or self.native:
+            def step_values(*values):
+                if len(values) != len(wires):
+                    raise PyrtlError('expected %d input values, got %d'
+                                     % (len(wires), len(values)))
+                self.step(dict(zip(wires, values)))
+            return step_values
+
+        names = tuple(w.name for w in wires)
+        masks = tuple(w.bitmask for w in wires)
+
+        def step_values(*values):
+            if len(values) != len(names):
+                raise PyrtlError('expected %d input values, got %d' % (len(names), len(values)))
+            if validate:
+                for name, mask, val in zip(names, masks, values):
+                    if not isinstance(val, numbers.Integral) or not 0 <= val <= mask:
+                        raise PyrtlError('the value %s for input "%s" cannot be represented '
+                                         'using its bitwidth' % (str(val), name))
+            self._step(dict(zip(names, values)))
+        return step_values
+
+    def step_repeat(self, provided_inputs, n_cycles):
+        """ Run the simulation for n_cycles cycles, with the same inputs in each
+
+        :return: the number of those cycles that were skipped rather than simulated
+
+        See Simulation.step_repeat.  In batched or native mode every cycle
+        is simulated.
+        """
+        if self.lanes is not None or self.native:
+            for _ in range(n_cycles):
+                self.step(provided_inputs)
+            return 0
+
+        ins = self._validated_inputs(provided_inputs)
+        prior_writes = None
+        for cycle in range(n_cycles):
+            regs = self.regs
+            writes = self._step(dict(ins))
+            if (not writes or writes == prior_writes) and self.regs == regs:
+                skipped = n_cycles - cycle - 1
+                if skipped and self.tracer is not None:
+                    self.tracer.repeat_last_step(skipped)
+                return skipped
+            prior_writes = writes
+        return 0
+
+    def _step(self, ins):
+        """ Run one cycle with the values of the Inputs in ins, a dict keyed by name.
+
+        Returns the memory writes of the cycle, as (memory, address, value) tuples.
+        """
         # building the simulation data
-        ins = {self._to_name(wire): value for wire, value in provided_inputs.items()}
         ins.update(self.regs)
         ins.update(self.mems)
 
         # propagate through logic
-        self.regs, self.outs, mem_writes = self.sim_func(ins)
+        self.regs, self.outs, mem_writes, failed_assert = self.sim_func(ins)
 
         for mem, addr, value in mem_writes:
             self.mems[mem][addr] = value
@@ -423,8 +1501,174 @@ class FastSimulation(object):
         if self.tracer is not None:
             self.tracer.add_fast_step(self)
 
-        # check the rtl assertions
-        check_rtl_assertions(self)
+        # the rtl assertions are checked by sim_func
+        if failed_assert is not None:
+            wire = self._assert_wires[failed_assert]
+            _rtl_assertion_failed(self, wire, self.block.rtl_assert_dict[wire])
+        return mem_writes
+
+    # number of cycles run per call of the generated run loop when run is
+    # given no cycle count (bounds the size of the preallocated trace lists)
+    _run_block_cycles = 4096
+
+    def run(self, n_cycles=None, inputs=None):
+        """ Run the simulation for many cycles with a single call
+
+        :param n_cycles: the number of cycles to run; if None, run until the
+          input values run out
+        :param inputs: a dictionary mapping every Input WireVector (or its name)
+          to an iterable of its values, one per cycle
+          eg: {wire: [3, 4, 5], "wire_name": some_generator()}
+        :return: the number of cycles run
+
+        This is equivalent to calling step once per cycle, but the cycles are
+        looped over inside of the generated code: register values are kept in
+        local variables and traced values are written straight into
+        preallocated lists, instead of building dictionaries every cycle.
+        """
+        if self.lanes is not None:
+            raise PyrtlError('run is not supported in batched mode (lanes=N), use step')
+        if inputs is None:
+            inputs = {}
+
+        input_iters = {}
+        for wire, values in inputs.items():
+            name = self._to_name(wire)
+            if not isinstance(self.block.wirevector_by_name.get(name), Input):
+                raise PyrtlError('"%s" is not an Input of the block' % name)
+            input_iters[name] = iter(values)
+        for wire in self.block.wirevector_subset(Input):
+            if wire.name not in input_iters:
+                raise PyrtlError('no values provided for Input "%s"' % wire.name)
+        if n_cycles is None and not input_iters:
+            raise PyrtlError('n_cycles is required when the block has no inputs')
+
+        if self._run_func is None:
+            options = self._codegen_options()
+            options['run_loop'] = True
+            context = self._exec_context()
+            exec(self._load_code(self._compiled_run, options), context)
+            self._run_func = context['run_func']
+
+        traced = self._traced_names()
+        cycles_run = 0
+        while n_cycles is None or cycles_run < n_cycles:
+            chunk = self._run_block_cycles if n_cycles is None else n_cycles - cycles_run
+            traces = {name: [0] * chunk for name in traced}
+            done, status, self.regs, context = self._run_func(
+                chunk, input_iters, self.regs, self.mems, traces)
+            cycles_run += done
+            if context is not None:
+                self.context = context
+            if done and self.tracer is not None:
+                if done < chunk:
+                    traces = {name: values[:done] for name, values in traces.items()}
+                self.tracer.add_steps(traces)
+
+            if status == 'assert':
+                check_rtl_assertions(self)
+            elif status is not None:
+                name, value = status
+                if value is not None:
+                    raise PyrtlError("Wire {} has value {} which cannot be represented"
+                                     " using its bitwidth".format(name, value))
+                if n_cycles is not None:
+                    raise PyrtlError('Input "%s" ran out of values after %d cycles'
+                                     % (name, cycles_run))
+                break
+        return cycles_run
+
+    def _chunked_run_func(self, n, inputs, regs, mems, traces):
+        """ The counterpart of the generated run_func for chunked or incremental code.
+
+        See _compiled_run for the arguments and the value returned.
+
+        Rather than generating one more huge function holding the loop over
+        the cycles, this loops in Python and calls sim_func once per cycle.
+        """
+        ports = [(w.name, w.bitmask, inputs[w.name])
+                 for w in self.block.wirevector_subset(Input)]
+        traces = list(traces.items())
+        status, context = None, None
+        cycle = 0
+        while cycle < n:
+            ins = {}
+            for name, mask, values in ports:
+                value = next(values, None)
+                if value is None or not 0 <= value <= mask:
+                    status = (name, value)
+                    break
+                ins[name] = value
+            if status is not None:
+                break
+            ins.update(regs)
+            ins.update(mems)
+            new_regs, outs, mem_writes, failed_assert = self.sim_func(ins)
+            for mem, addr, value in mem_writes:
+                mems[mem][addr] = value
+            context = outs
+            context.update(regs)
+            context.update((name, ins[name]) for name, mask, values in ports)
+            for name, values in traces:
+                values[cycle] = context[name]
+            regs = new_regs
+            cycle += 1
+            if failed_assert is not None:
+                status = 'assert'
+                break
+        return cycle, status, regs, context
+
+    def _step_lanes(self, provided_inputs):
+        """ Run one cycle of every lane of a batched simulation. """
+        np = self._np
+        ins = {}
+        for wire, value in provided_inputs.items():
+            name = self._to_name(wire)
+            ins[name] = self._lane_values(self.block.wirevector_by_name[name], value)
+
+        if self._vectorized:
+            d = dict(ins)
+            d.update(self.regs)
+            d.update(self.mems)
+            regs, outs, mem_writes, _ = self.sim_func(d)
+            for mem, addr, value, enable in mem_writes:
+                enabled = np.broadcast_to(np.asarray(enable, dtype=bool), (self.lanes,))
+                addrs = np.broadcast_to(addr, (self.lanes,))
+                values = np.broadcast_to(value, (self.lanes,))
+                self.mems[mem][np.flatnonzero(enabled), addrs[enabled]] = values[enabled]
+            # values computed only from constants come back as scalars
+            for vals in (regs, outs):
+                for name, value in vals.items():
+                    if np.ndim(value) == 0:
+                        vals[name] = np.full(self.lanes, value, dtype=np.uint64)
+        else:
+            regs, outs = {}, {}
+            for lane in range(self.lanes):
+                d = {name: int(vals[lane]) for name, vals in ins.items()}
+                d.update((name, int(vals[lane])) for name, vals in self.regs.items())
+                for mem, storage in self.mems.items():
+                    d[mem] = storage if isinstance(storage, RomBlock) else storage[lane]
+                lane_regs, lane_outs, mem_writes, _ = self.sim_func(d)
+                for mem, addr, value in mem_writes:
+                    self.mems[mem][lane][addr] = value
+                for lane_vals, vals in ((lane_regs, regs), (lane_outs, outs)):
+                    for name, value in lane_vals.items():
+                        vals.setdefault(name, np.empty(self.lanes, dtype=object))[lane] = value
+        prior_regs = self.regs
+        self.regs, self.outs = regs, outs
+
+        # for tracer compatibility
+        self.context = self.outs.copy()
+        self.context.update(self.regs)
+        self.context.update(prior_regs)
+        self.context.update(ins)
+        if self.tracer is not None:
+            self.tracer.add_fast_step(self)
+
+        # an assertion fails if it fails in any lane
+        for (w, exp) in self.block.rtl_assert_dict.items():
+            if w.name in self.context and not np.all(self.context[w.name]):
+                _rtl_assertion_failed(self, w, exp)
 
     def inspect(self, w):
         """ Get the value of a wirevector in the last simulation cycle.
@@ -453,10 +1697,52 @@ class FastSimulation(object):
 
         Note that this returns the current memory state. Modifying the dictonary
         will also modify the state in the simulator
+
+        In batched mode a list with one such dictionary per lane is returned.
+        When the memory is stored densely (the vectorized path) these are
+        copies which leave out the addresses holding the default value.
         """
         if isinstance(mem, RomBlock):
             raise PyrtlError("ROM blocks are not stored in the simulation object")
-        return self.mems[self._mem_varname(mem)]
+        storage = self.mems[self._mem_varname(mem)]
+        if self._vectorized:
+            return [{addr: int(val) for addr, val in enumerate(row) if val != self.default_value}
+                    for row in storage]
+        return storage
+
+    def snapshot(self):
+        """ Return the current state of the simulation, to be passed to restore.
+
+        See Simulation.snapshot.
+        """
+        context = getattr(self, 'context', None)
+        if context is not None:
+            wires = self.block.wirevector_by_name
+            context = _copy_state({name: val for name, val in context.items() if name in wires})
+        return SimulationSnapshot(
+            registers=_copy_state(self.regs),
+            memories={name: _copy_state(self.mems[self._mem_varname(mem)])
+                      for name, mem in _block_memories(self.block).items()},
+            values=context,
+            trace_length=_trace_length(self.tracer))
+
+    def restore(self, snapshot):
+        """ Set the simulation to the state captured by snapshot.
+
+        See Simulation.restore.
+        """
+        self.regs = _copy_state(snapshot.registers)
+        for name, mem in _block_memories(self.block).items():
+            storage = self.mems[self._mem_varname(mem)]
+            if isinstance(storage, _DenseMemory):
+                storage.load(snapshot.memories[name])  # in place, native code points at it
+            else:
+                self.mems[self._mem_varname(mem)] = _copy_state(snapshot.memories[name])
+        if snapshot.values is not None:
+            self.context = _copy_state(snapshot.values)
+        elif hasattr(self, 'context'):
+            del self.context
+        _truncate_trace(self.tracer, snapshot.trace_length)
 
     def _to_name(self, name):
         """ Converts Wires to strings, keeps strings as is """
@@ -469,7 +1755,9 @@ class FastSimulation(object):
         return self.internal_names[val.name]
 
     def _mem_varname(self, val):
-        return 'fs_mem' + str(val.id)
+        if val in self._mem_numbers:
+            return 'fs_mem' + str(self._mem_numbers[val])
+        return 'fs_memid' + str(val.id)  # not in the block
 
     def _arg_varname(self, wire):
         """
@@ -478,6 +1766,8 @@ class FastSimulation(object):
         if isinstance(wire, (Input, Register)):
             return 'd[' + repr(wire.name) + ']'  # passed in
         elif isinstance(wire, Const):
+            if self._vectorized:
+                return '_u64(%d)' % wire.val  # keeps the lane arithmetic in uint64
             return str(wire.val)  # hardcoded
         else:
             return self._varname(wire)
@@ -490,24 +1780,29 @@ class FastSimulation(object):
         else:
             return self._varname(wire)
 
-    _no_mask_bitwidth = {  # bitwidth that the dest has to have in order to not need masking
-        'w': lambda net: len(net.args[0]),
-        'r': lambda net: len(net.args[0]),
-        '~': lambda net: -1,  # bitflips always need masking
-        '&': lambda net: len(net.args[0]),
-        '|': lambda net: len(net.args[0]),
-        '^': lambda net: len(net.args[0]),
-        'n': lambda net: -1,  # bitflips always need masking
-        '+': lambda net: len(net.args[0]) + 1,
-        '-': lambda net: -1,  # need to handle negative numbers correctly
-        '*': lambda net: len(net.args[0]) + len(net.args[1]),
-        '<': lambda net: 1,
-        '>': lambda net: 1,
-        '=': lambda net: 1,
-        'x': lambda net: len(net.args[1]),
-        'c': lambda net: sum(len(a) for a in net.args),
-        's': lambda net: len(net.op_param),
-        'm': lambda net: -1,   # just not going to optimize this right now
+    # the most bits the value computed by a net can have, given the most bits
+    # the values of its args can have; the dest is only masked if it could be
+    # wider than that (None if the value can be negative or is not bounded)
+    _value_bits = {
+        'w': lambda net, bits: bits[0],
+        'r': lambda net, bits: bits[0],
+        '~': lambda net, bits: len(net.args[0]),  # bitflips are an xor with the bitmask
+        '&': lambda net, bits: min(bits),
+        '|': lambda net, bits: max(bits),
+        '^': lambda net, bits: max(bits),
+        'n': lambda net, bits: len(net.args[0]),
+        '+': lambda net, bits: max(bits) + 1,
+        '-': lambda net, bits: None,  # need to handle negative numbers correctly
+        '*': lambda net, bits: sum(bits),
+        '<': lambda net, bits: 1,
+        '>': lambda net, bits: 1,
+        '=': lambda net, bits: 1,
+        'x': lambda net, bits: max(bits[1:]),
+        'c': lambda net, bits: max(b + sum(len(a) for a in net.args[i + 1:])
+                                   for i, b in enumerate(bits)),
+        's': lambda net, bits: max([i + 1 for i, b in enumerate(net.op_param) if b < bits[0]]
+                                   or [0]),
+        'm': lambda net, bits: None,   # just not going to optimize this right now
     }
 
     # Yeah, triple quotes don't respect indentation (aka the 4 spaces on the
@@ -524,16 +1819,382 @@ class FastSimulation(object):
         # Because of fast locals in functions in both CPython and PyPy, getting a
         # function to execute makes the code a few times faster than
         # just executing it in the global exec scope.
+        if self._chunk_nets() is not None:
+            return self._compiled_chunks()
+        prog = [self._prog_start]
+        self._compiled_nets(prog, '    ', self._arg_varname, self._dest_varname,
+                            lambda mem: 'd["%s"]' % self._mem_varname(mem))
+
+        # add traced wires to dict
+        for wire_name in self._traced_names():
+            wire = self.block.wirevector_by_name[wire_name]
+            v_wire_name = self._varname(wire)
+            if not isinstance(wire, (Input, Const, Register, Output)):
+                prog.append('    outs["%s"] = %s' % (wire_name, v_wire_name))
+        self._compiled_return(prog)
+        return '\n'.join(prog)
+
+    def _compiled_return(self, prog):
+        """ Append the end of sim_func, checking the assertions and returning. """
+        # a single check of all of the assertions, with the position in
+        # _assert_wires of the first failing one returned when it fails
+        if self._assert_wires and not self._vectorized:
+            values = ['outs[%r]' % w.name for w in self._assert_wires]
+            prog.append('    if not (%s):' % ' and '.join(values))
+            prog.append('        return regs, outs, mem_ws, [%s].index(0)' % ', '.join(values))
+        prog.append("    return regs, outs, mem_ws, None")
+
+    def _compiled_chunks(self):
+        """ Return the code of sim_func split into chunks, as a list of sources.
+
+        The nets are cut, in topological order, into functions of about
+        _chunk_nets() nets each, which sim_func calls in order.  A wire
+        computed in one chunk and read in a later one is passed on through
+        the list v: the chunk computing it stores it in v, and each later
+        chunk reading it loads it from there into a local variable.
+        """
+        owners = self._mux_arm_owners()
+        inlined = self._inlined_wires(owners)
+        emit = self._net_emitter(self._arg_varname, self._dest_varname,
+                                 lambda mem: 'd["%s"]' % self._mem_varname(mem), owners, inlined)
+        size = self._chunk_nets()
+        nets = tuple(self.block)
+        top = [net for net in nets if net not in owners and not
+               (net.dests and net.dests[0] in inlined)]
+        # hashing a LogicNet hashes all of its fields, so the (many) lookups
+        # below are keyed by the id of each net instead
+        chunk_of = {id(net): i // size for i, net in enumerate(top)}
+        user = {id(inlined[arg]): net for net in nets for arg in net.args if arg in inlined}
+        for net in reversed(nets):  # a mux (or the user of an inlined wire) comes later
+            if id(net) in user:
+                chunk_of[id(net)] = chunk_of[id(user[id(net)])]
+            elif net in owners:
+                chunk_of[id(net)] = chunk_of[id(owners[net][0])]
+        n_chunks = (len(top) + size - 1) // size
+
+        producer_chunk = {}
+        loads = [set() for i in range(n_chunks)]
+        stores = [set() for i in range(n_chunks)]
+        for net in nets:
+            i = chunk_of[id(net)]
+            for arg in net.args:
+                if isinstance(arg, (Input, Const, Register)):
+                    continue
+                if producer_chunk[arg] != i:
+                    loads[i].add(arg)
+                    stores[producer_chunk[arg]].add(arg)
+            for w in net.dests:
+                producer_chunk[w] = i
+        slot = {w: i for i, w in enumerate(sorted(set().union(*stores), key=lambda w: w.name))}
+        traced = [self.block.wirevector_by_name[name] for name in self._traced_names()]
+        traced = [w for w in traced if not isinstance(w, (Input, Const, Register, Output))]
+
+        progs = [[] for i in range(n_chunks)]
+        for net in top:
+            emit(progs[chunk_of[id(net)]], '    ', net)
+        sources = []
+        for i, prog in enumerate(progs):
+            chunk = ['def _fastsim_chunk_%d(d, v, regs, outs, mem_ws):' % i]
+            for w in sorted(loads[i], key=lambda w: w.name):
+                chunk.append('    %s = v[%d]' % (self._varname(w), slot[w]))
+            chunk.extend(prog)
+            for w in traced:
+                if producer_chunk.get(w) == i:
+                    chunk.append('    outs["%s"] = %s' % (w.name, self._varname(w)))
+            for w in sorted(stores[i], key=lambda w: w.name):
+                chunk.append('    v[%d] = %s' % (slot[w], self._varname(w)))
+            sources.append('\n'.join(chunk))
+
+        prog = [self._prog_start, '    v = [0] * %d' % len(slot)]
+        for i in range(n_chunks):
+            prog.append('    _fastsim_chunk_%d(d, v, regs, outs, mem_ws)' % i)
+        self._compiled_return(prog)
+        sources.append('\n'.join(prog))
+        return sources
+
+    # regions of fewer nets than this are compiled together with other small
+    # regions, into one of _region_buckets functions picked by their keys
+    _region_min_nets = 100
+    _region_buckets = 16
+
+    def _load_regions(self, context):
+        """ Exec into context the code of sim_func, compiled region by region.
+
+        Each region of the block (see partition_block) becomes a function
+        keyed by a digest of the labels of its nets, as in _structural_hash.
+        The regions are evaluated independently within a cycle, so sim_func
+        just calls each of them in turn.  The code of a region whose key was
+        compiled before, by an earlier build of this simulation or into the
+        code_cache, is reused rather than generated and compiled again.
+
+        As memids differ from one build of a design to the next, the memories
+        a region uses are numbered by their first use in the region instead,
+        and their names passed to its function in a tuple in that order.
+        """
+        import hashlib
+
+        def digest(parts):
+            return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+        traced = set(self._traced_names())
+        common = '\n'.join([sys.version, repr(self.default_value),
+                            repr(self.dense_mem_addrwidth), _codegen_fingerprint()])
+        groups = {}
+        for nets in _partition_nets(self.block):
+            mem_ids = _memory_numbers(nets)
+            mems = sorted(mem_ids, key=mem_ids.get)
+            wires = set(w for net in nets for w in net.args + net.dests)
+            labels = _net_labels(nets, _interface_labels(wires, traced), mem_ids)
+            key = digest([common] + sorted(labels))
+            region = (key, nets, mems)
+            if len(nets) >= self._region_min_nets:
+                groups[key] = [region]
+            else:
+                groups.setdefault(int(key[:8], 16) % self._region_buckets, []).append(region)
+        units = []
+        for members in groups.values():
+            members.sort(key=lambda member: member[0])
+            units.append((digest(key for key, nets, mems in members), members))
+        units.sort(key=lambda unit: unit[0])
+
+        owners = self._mux_arm_owners()
+
+        params = {}  # the expression naming each memory of the region being generated
+        emit = self._net_emitter(self._arg_varname, self._dest_varname,
+                                 lambda mem: 'd[%s]' % params[mem], owners,
+                                 self._inlined_wires(owners), lambda mem: params[mem])
+
+        def unit_source(members):
+            # every region gets names of its own, even for a rom it shares
+            # with another region of the unit
+            prog = ['def _fastsim_region(d, regs, outs, mem_ws, _fastsim_mems):']
+            names = ('_fastsim_mems[%d]' % i for i in itertools.count())
+            for key, nets, mems in members:
+                params.clear()
+                params.update((mem, next(names)) for mem in mems)
+                for net in nets:
+                    if net not in owners:
+                        emit(prog, '    ', net)
+                    for w in net.dests:
+                        if w.name in traced and not isinstance(w, (Register, Output)):
+                            prog.append('    outs["%s"] = %s' % (w.name, self._varname(w)))
+            return '\n'.join(prog)
+
+        codes = []
+        for key, members in units:
+            code = self._region_code.get(key)
+            if code is None and self.code_cache is not None:
+                code = self.code_cache.load(key)
+            codes.append(code)
+        missing = [i for i, code in enumerate(codes) if code is None]
+        sources = [unit_source(units[i][1]) for i in missing]
+        for i, code in zip(missing, _compile_sources(sources)):
+            codes[i] = code
+            if self.code_cache is not None:
+                self.code_cache.store(units[i][0], code)
+        self._region_code = {key: code for (key, members), code in zip(units, codes)}
+
         prog = [self._prog_start]
+        for i, code in enumerate(codes):
+            exec(code, context)
+            context['_fastsim_region_%d' % i] = context.pop('_fastsim_region')
+            mem_names = ''.join('"%s", ' % self._mem_varname(mem)
+                                for key, nets, mems in units[i][1] for mem in mems)
+            prog.append('    _fastsim_region_%d(d, regs, outs, mem_ws, (%s))' % (i, mem_names))
+        self._compiled_return(prog)
+        source = '\n'.join(prog)
+        if self.code_file is not None:  # only holds the regions compiled this time
+            with open(self.code_file, 'w') as file:
+                file.write('\n\n\n'.join(sources + [source]))
+        exec(compile(source, '<string>', 'exec'), context)
+
+    def _compiled_run(self):
+        """ Return a string of the code of run_func, which runs many cycles per call.
+
+        run_func(n, inputs, regs, mems, traces) runs up to n cycles, pulling the
+        values of each input from the iterators in inputs and writing the value
+        of each traced wire into the preallocated lists in traces.  It returns
+        the number of cycles run, a status (None if all n cycles were run,
+        "assert" if an assertion failed, or (input name, bad value) if an input
+        value was out of range or missing), the new register values, and the
+        context of the last cycle run (None if no cycle was run).
+        """
+        # inside the loop every wire lives in a local variable; the values
+        # registers take at the end of a cycle are kept in separate locals
+        # until the start of the next one
+        regs = sorted(self.block.wirevector_subset(Register), key=lambda w: w.name)
+        next_names = {r: '_fastsim_next_%d' % i for i, r in enumerate(regs)}
+        inputs = sorted(self.block.wirevector_subset(Input), key=lambda w: w.name)
+        mems = {}
+        for net in self.block.logic_subset('m@'):
+            mem = net.op_param[1]
+            mems[self._mem_varname(mem)] = '_fastsim_' + self._mem_varname(mem)
+        has_writes = any(True for net in self.block.logic_subset('@'))
+        traced = self._traced_names()
+        asserts = sorted(self.block.rtl_assert_dict, key=lambda w: w.name)
+
+        def loop_arg_varname(wire):
+            if isinstance(wire, Const):
+                return str(wire.val)
+            return self._varname(wire)
+
+        def loop_dest_varname(wire):
+            if isinstance(wire, Register):
+                return next_names[wire]
+            return self._varname(wire)
+
+        prog = ['def run_func(n, inputs, regs, mems, traces):']
+        for i, wire in enumerate(inputs):
+            prog.append('    _fastsim_in_%d = inputs[%r]' % (i, wire.name))
+        for r in regs:
+            prog.append('    %s = regs[%r]' % (next_names[r], r.name))
+        for mem, local in sorted(mems.items()):
+            prog.append('    %s = mems[%r]' % (local, mem))
+        for i, name in enumerate(traced):
+            prog.append('    _fastsim_tr_%d = traces[%r]' % (i, name))
+        prog.append('    _fastsim_status = None')
+        prog.append('    _fastsim_cycle = 0')
+        prog.append('    while _fastsim_cycle < n:')
+        # inputs are read into temporaries so that a bad input value leaves
+        # the wires holding the values of the last complete cycle
+        for i, wire in enumerate(inputs):
+            var = '_fastsim_val_%d' % i
+            prog.append('        %s = next(_fastsim_in_%d, None)' % (var, i))
+            prog.append('        if %s is None or not 0 <= %s <= %d:' % (var, var, wire.bitmask))
+            prog.append('            _fastsim_status = (%r, %s)' % (wire.name, var))
+            prog.append('            break')
+        for i, wire in enumerate(inputs):
+            prog.append('        %s = _fastsim_val_%d' % (self._varname(wire), i))
+        for r in regs:
+            prog.append('        %s = %s' % (self._varname(r), next_names[r]))
+        if has_writes:
+            prog.append('        mem_ws = []')
+        self._compiled_nets(prog, '        ', loop_arg_varname, loop_dest_varname,
+                            lambda mem: mems[self._mem_varname(mem)])
+        if has_writes:
+            prog.append('        for _fastsim_mem, _fastsim_addr, _fastsim_val in mem_ws:')
+            prog.append('            mems[_fastsim_mem][_fastsim_addr] = _fastsim_val')
+        for i, name in enumerate(traced):
+            wire = self.block.wirevector_by_name[name]
+            prog.append('        _fastsim_tr_%d[_fastsim_cycle] = %s'
+                        % (i, loop_arg_varname(wire)))
+        prog.append('        _fastsim_cycle += 1')
+        if asserts:
+            prog.append('        if not (%s):' % ' and '.join(self._varname(w) for w in asserts))
+            prog.append('            _fastsim_status = "assert"')
+            prog.append('            break')
+
+        new_regs = ', '.join('%r: %s' % (r.name, next_names[r]) for r in regs)
+        prog.append('    if _fastsim_cycle == 0:')
+        prog.append('        return _fastsim_cycle, _fastsim_status, {%s}, None' % new_regs)
+        # the same values that step leaves in its context
+        context = [w for w in self.block.wirevector_subset((Input, Output, Register))]
+        context.extend(self.block.wirevector_by_name[name] for name in traced)
+        context = sorted(set(context), key=lambda w: w.name)
+        context = ', '.join('%r: %s' % (w.name, loop_arg_varname(w)) for w in context)
+        prog.append('    return _fastsim_cycle, _fastsim_status, {%s}, {%s}'
+                    % (new_regs, context))
+        return '\n'.join(prog)
+
+    def _mux_arm_owners(self):
+        """ Map each net only needed by one arm of a mux to that (mux net, arm arg index).
+
+        A net belongs to an arm if every use of its result is either as that
+        arm of the mux or by a net belonging to the arm, so it need only be
+        evaluated in the cycles in which the mux selects the arm.  Nets
+        belonging to the arm of a mux which itself belongs to the arm of
+        another mux form nested cones.  Wires which the generated code has
+        to report (outputs, registers, traced and toggle counted wires) and
+        memory writes are always evaluated, as is everything in batched
+        mode (where each lane can select another arm) and when profiling.
+        """
+        if self._vectorized or self.profile is not None or self._toggle_wires:
+            return {}
+        kept = set(self._traced_names())
+        kept.update(w.name for w in self._assert_wires)
+        wire_src_dict, wire_sink_dict = self.block._net_connections()
+        owners = {}
+        for net in reversed(tuple(self.block)):
+            if net.op in 'r@' or not net.dests:
+                continue
+            dest = net.dests[0]
+            if isinstance(dest, (Output, Register)) or dest.name in kept:
+                continue
+            slots = set()
+            for sink in wire_sink_dict.get(dest, ()):
+                for i, arg in enumerate(sink.args):
+                    if arg is dest:
+                        slots.add((sink, i) if sink.op == 'x' and i > 0 else owners.get(sink))
+            if len(slots) == 1 and None not in slots:
+                owners[net] = slots.pop()
+        return owners
+
+    # the most nets inlined into a single expression, one inside the other
+    _inline_depth = 8
+
+    def _inlined_wires(self, owners):
+        """ Map each wire whose value is inlined into the expression using it to its driver.
+
+        :param owners: the mux arms the nets belong to, see _mux_arm_owners
+
+        A net whose result is used exactly once gets its expression inlined
+        into that of the net using it, rather than assigned to a variable of
+        its own, as long as that nests at most _inline_depth nets.  Wires the
+        generated code has to report and the muxes generated as if statements
+        are always assigned, as is everything in batched mode and when
+        profiling or counting toggles.
+        """
+        if self._vectorized or self.profile is not None or self._toggle_wires:
+            return {}
+        kept = set(self._traced_names())
+        kept.update(w.name for w in self._assert_wires)
+        statement_muxes = set(id(mux) for mux, arm in owners.values())
+        wire_src_dict, wire_sink_dict = self.block._net_connections()
+        inlined = {}
+        depth = {}  # the number of nets nested in the expression of each inlined wire
+        for net in self.block:
+            if net.op in 'r@' or not net.dests:
+                continue
+            dest = net.dests[0]
+            if (isinstance(dest, (Output, Register)) or dest.name in kept
+                    or id(net) in statement_muxes):
+                continue
+            sinks = wire_sink_dict.get(dest, ())
+            if len(sinks) != 1 or (sinks[0].op == 's' and not _is_bit_range(sinks[0].op_param)):
+                continue  # a select of several ranges of bits reads its arg several times
+            nested = 1 + max([depth[a] for a in net.args if a in inlined] or [0])
+            if nested <= self._inline_depth:
+                inlined[dest] = net
+                depth[dest] = nested
+        return inlined
+
+    def _net_emitter(self, arg_varname, dest_varname, mem_ref, owners, inlined, mem_key=None):
+        """ Return a function emit(prog, indent, net) generating the code of a net.
+
+        :param arg_varname: function giving the expression for reading a wire
+        :param dest_varname: function giving the target for assigning a wire
+        :param mem_ref: function giving the expression for the storage of a memory
+        :param owners: the mux arms the nets belong to, see _mux_arm_owners
+        :param inlined: the wires whose drivers are inlined, see _inlined_wires
+        :param mem_key: function giving the expression for the name of a memory
+          in "mem_ws" (by default its name as a string literal)
+
+        emit appends to prog the statements evaluating net, and for a mux
+        also those of the nets belonging to its arms.  Nets driving inlined
+        wires are skipped, as they are evaluated within the expression of the
+        net using them.  Memory writes are appended to the list "mem_ws"
+        rather than executed.
+        """
+        if mem_key is None:
+            def mem_key(mem):
+                return '"%s"' % self._mem_varname(mem)
 
         simple_func = {  # OPS
             'w': lambda x: x,
             'r': lambda x: x,
-            '~': lambda x: '(~' + x + ')',
             '&': lambda l, r: '(' + l + '&' + r + ')',
             '|': lambda l, r: '(' + l + '|' + r + ')',
             '^': lambda l, r: '(' + l + '^' + r + ')',
-            'n': lambda l, r: '(~(' + l + '&' + r + '))',
             '+': lambda l, r: '(' + l + '+' + r + ')',
             '-': lambda l, r: '(' + l + '-' + r + ')',
             '*': lambda l, r: '(' + l + '*' + r + ')',
@@ -542,6 +2203,14 @@ class FastSimulation(object):
             '=': lambda l, r: 'int(' + l + '==' + r + ')',
             'x': lambda sel, f, t: '({}) if ({}==0) else ({})'.format(f, sel, t),
         }
+        if self._vectorized:
+            # comparisons and muxes have to work elementwise across the lanes
+            simple_func.update({
+                '<': lambda a, b: '(' + a + '<' + b + ').astype(_u64)',
+                '>': lambda a, b: '(' + a + '>' + b + ').astype(_u64)',
+                '=': lambda a, b: '(' + a + '==' + b + ').astype(_u64)',
+                'x': lambda sel, f, t: '_np.where({}, {}, {})'.format(sel, t, f),
+            })
 
         def shift(value, direction, shift_amt):
             if shift_amt == 0:
@@ -549,28 +2218,103 @@ class FastSimulation(object):
             else:
                 return '(%s %s %d)' % (value, direction, shift_amt)
 
-        def make_split():
-            if split_start_bit == 0:
+        def make_split(source, source_bits, split_start_bit, split_length, split_res_start_bit):
+            # source_bits is the most bits the value of the source can have
+            if source_bits <= split_start_bit and not self._vectorized:
+                return '0'
+            elif source_bits <= split_start_bit + split_length:
+                bit = shift(source, '>>', split_start_bit)
+            elif split_start_bit == 0:
                 bit = '(%d & %s)' % ((1 << split_length) - 1, source)
-            elif len(net.args[0]) - split_start_bit == split_length:
-                bit = '(%s >> %d)' % (source, split_start_bit)
             else:
                 bit = '(%d & (%s >> %d))' % ((1 << split_length) - 1, source, split_start_bit)
             return shift(bit, '<<', split_res_start_bit)
 
+        # the most bits the value of each wire computed so far can have; never
+        # narrowed for registers, whose values also come from their initial
+        # values, snapshots and rebuilds rather than only their next values
+        bits = {}
+
+        def arg_bits(wire):
+            if isinstance(wire, Const):
+                return wire.val.bit_length()
+            if isinstance(wire, (Input, Register)):
+                return len(wire)
+            return bits.get(wire, len(wire))
+
+        def masked(net, expr):
+            dest = net.dests[0]
+            value_bits = self._value_bits[net.op](net, [arg_bits(a) for a in net.args])
+            if not isinstance(dest, Register):
+                bits[dest] = len(dest) if value_bits is None else min(value_bits, len(dest))
+            if value_bits is not None and value_bits <= len(dest):
+                return expr
+            return '%s & %s' % (dest.bitmask, expr)
+
+        def arg_expr(wire):
+            if wire in inlined:
+                return '(%s)' % expression(inlined[wire])
+            return arg_varname(wire)
+
+        # the nets only needed by one arm of a mux are evaluated inside of
+        # an if statement picking the arm, rather than on every cycle
+        arm_nets = {}  # (mux net, arg index of the arm) -> nets in topological order
         for net in self.block:
+            if net in owners:
+                arm_nets.setdefault(owners[net], []).append(net)
+
+        def emit_mux(prog, indent, net):
+            result = dest_varname(net.dests[0])
+            prog.append(indent + 'if %s:' % arg_expr(net.args[0]))
+            for arm_net in arm_nets.get((net, 2), ()):
+                emit(prog, indent + '    ', arm_net)
+            prog.append(indent + '    %s = %s' % (result, masked(net, arg_expr(net.args[2]))))
+            prog.append(indent + 'else:')
+            for arm_net in arm_nets.get((net, 1), ()):
+                emit(prog, indent + '    ', arm_net)
+            prog.append(indent + '    %s = %s' % (result, masked(net, arg_expr(net.args[1]))))
+
+        def emit(prog, indent, net):
+            if net.dests and net.dests[0] in inlined:
+                return
+            if net.op == 'x' and ((net, 1) in arm_nets or (net, 2) in arm_nets):
+                emit_mux(prog, indent, net)
+                return
+            if net.op == '@':
+                mem = mem_key(net.op_param[1])
+                write_addr = arg_expr(net.args[0])
+                write_val = arg_expr(net.args[1])
+                write_enable = arg_expr(net.args[2])
+                if self._vectorized:  # the enable is applied per lane by step
+                    prog.append(indent + 'mem_ws.append(({}, {}, {}, {}))'
+                                .format(mem, write_addr, write_val, write_enable))
+                    return
+                prog.append(indent + 'if {}:'.format(write_enable))
+                prog.append(indent + '    mem_ws.append(({}, {}, {}))'
+                            .format(mem, write_addr, write_val))
+                return  # memwrites are special
+            # prog.append(indent + '#  ' + str(net))
+            prog.append(indent + '%s = %s' % (dest_varname(net.dests[0]), expression(net)))
+
+        def expression(net):
+            """ The expression of the value of net, masked to the bitwidth of its dest. """
             if net.op in simple_func:
-                argvals = (self._arg_varname(arg) for arg in net.args)
+                argvals = (arg_expr(arg) for arg in net.args)
                 expr = simple_func[net.op](*argvals)
+            elif net.op == '~':  # the same as ~x, as the bits above the bitmask are all 0
+                expr = '(%s ^ %d)' % (arg_expr(net.args[0]), net.dests[0].bitmask)
+            elif net.op == 'n':
+                expr = '((%s & %s) ^ %d)' % (arg_expr(net.args[0]), arg_expr(net.args[1]),
+                                             net.dests[0].bitmask)
             elif net.op == 'c':
                 expr = ''
                 for i in range(len(net.args)):
                     if expr is not '':
                         expr += ' | '
                     shiftby = sum(len(j) for j in net.args[i+1:])
-                    expr += shift(self._arg_varname(net.args[i]), '<<', shiftby)
+                    expr += shift(arg_expr(net.args[i]), '<<', shiftby)
             elif net.op == 's':
-                source = self._arg_varname(net.args[0])
+                source = arg_expr(net.args[0])
                 expr = ''
                 split_length = 0
                 split_start_bit = -2
@@ -580,66 +2324,1259 @@ class FastSimulation(object):
                     if b != split_start_bit + split_length:
                         if split_start_bit >= 0:
                             # create a wire
-                            expr += make_split() + '|'
+                            expr += make_split(source, arg_bits(net.args[0]), split_start_bit,
+                                               split_length, split_res_start_bit) + '|'
                         split_length = 1
                         split_start_bit = b
                         split_res_start_bit = i
                     else:
                         split_length += 1
-                expr += make_split()
+                expr += make_split(source, arg_bits(net.args[0]), split_start_bit,
+                                   split_length, split_res_start_bit)
             elif net.op == 'm':
-                read_addr = self._arg_varname(net.args[0])
+                read_addr = arg_expr(net.args[0])
                 mem = net.op_param[1]
-                if isinstance(net.op_param[1], RomBlock):
-                    expr = 'd["%s"]._get_read_data(%s)' % (self._mem_varname(mem), read_addr)
+                if self._vectorized:
+                    if isinstance(mem, RomBlock):  # materialized contents of the rom
+                        expr = '%s[%s]' % (mem_ref(mem), read_addr)
+                    else:  # one row per lane
+                        expr = '%s[_lane_idx, %s]' % (mem_ref(mem), read_addr)
+                elif isinstance(self.mems[self._mem_varname(mem)], _RomData):
+                    expr = '%s[%s]' % (mem_ref(mem), read_addr)
+                elif isinstance(mem, RomBlock):
+                    expr = '%s._get_read_data(%s)' % (mem_ref(mem), read_addr)
+                elif isinstance(self.mems[self._mem_varname(mem)], _DenseMemory):
+                    expr = '%s.storage[%s]' % (mem_ref(mem), read_addr)
                 else:  # memories act async for reads
-                    expr = 'd["%s"].get(%s, %s)' % (self._mem_varname(mem),
-                                                    read_addr, self.default_value)
-            elif net.op == '@':
-                mem = self._mem_varname(net.op_param[1])
-                write_addr = self._arg_varname(net.args[0])
-                write_val = self._arg_varname(net.args[1])
-                write_enable = self._arg_varname(net.args[2])
-                prog.append('    if {}:'.format(write_enable))
-                prog.append('        mem_ws.append(("{}", {}, {}))'
-                            .format(mem, write_addr, write_val))
-                continue  # memwrites are special
+                    expr = '%s.get(%s, %s)' % (mem_ref(mem), read_addr, self.default_value)
             else:
                 raise PyrtlError('FastSimulation cannot handle primitive "%s"' % net.op)
+            return masked(net, expr)
+        return emit
 
-            # prog.append('    #  ' + str(net))
-            result = self._dest_varname(net.dests[0])
-            if len(net.dests[0]) == self._no_mask_bitwidth[net.op](net):
-                prog.append("    %s = %s" % (result, expr))
-            else:
-                mask = str(net.dests[0].bitmask)
-                prog.append('    %s = %s & %s' % (result, mask, expr))
-
-        # add traced wires to dict
-        if self.tracer is not None:
-            for wire_name in self.tracer.trace:
-                wire = self.block.wirevector_by_name[wire_name]
-                v_wire_name = self._varname(wire)
-                if not isinstance(wire, (Input, Const, Register, Output)):
-                    prog.append('    outs["%s"] = %s' % (wire_name, v_wire_name))
-
-        prog.append("    return regs, outs, mem_ws")
-        return '\n'.join(prog)
-
+    def _compiled_nets(self, prog, indent, arg_varname, dest_varname, mem_ref):
+        """ Append to prog the statements evaluating every net of the block once.
 
-# ----------------------------------------------------------------
-#    ___  __        __   ___
-#     |  |__)  /\  /  ` |__
-#     |  |  \ /~~\ \__, |___
-#
+        :param indent: the indentation of the generated statements
 
+        See _net_emitter for the other parameters.
+        """
+        owners = self._mux_arm_owners()
+        emit = self._net_emitter(arg_varname, dest_varname, mem_ref, owners,
+                                 self._inlined_wires(owners))
+
+        def profile_net(i):
+            # the time since the last net finished is charged to net i
+            prog.append(indent + '_fastsim_prof_count[%d] += 1' % i)
+            prog.append(indent + '_fastsim_now = _fastsim_clock()')
+            prog.append(indent + '_fastsim_prof_time[%d] += _fastsim_now - _fastsim_then' % i)
+            prog.append(indent + '_fastsim_then = _fastsim_now')
+
+        if self.profile is not None:
+            prog.append(indent + '_fastsim_then = _fastsim_clock()')
+        for i, net in enumerate(self.block):
+            if self.profile is not None and i > 0:
+                profile_net(i - 1)
+            if net not in owners:
+                emit(prog, indent, net)
+        if self.profile is not None and self.profile.nets:
+            profile_net(len(self.profile.nets) - 1)
+
+        # count the bits flipped since the last cycle, registers and inputs
+        # being read as their values in this cycle
+        for i, wire in enumerate(self._toggle_wires):
+            if isinstance(wire, (Input, Register)):
+                current = arg_varname(wire)
+            else:
+                current = dest_varname(wire)
+            prog.append(indent + '_fastsim_flipped = %s ^ _fastsim_toggle_prior[%d]' % (current, i))
+            prog.append(indent + 'if _fastsim_flipped:')
+            prog.append(indent + "    _fastsim_toggles[%d] += bin(_fastsim_flipped).count('1')" % i)
+            prog.append(indent + '    _fastsim_toggle_prior[%d] = %s' % (i, current))
+
+    # largest addrwidth for which a memory can be stored by the native code
+    _native_mem_max_addrwidth = 20
+
+    def _initialize_native(self):
+        """ Compile and load the native code, return False if it cannot be used. """
+        if any(len(w) > 64 for w in self.block.wirevector_set):
+            return False
+        for net in self.block.logic_subset('m@'):
+            if net.op_param[1].addrwidth > self._native_mem_max_addrwidth:
+                return False
+        compiler = _find_c_compiler()
+        if compiler is None:
+            return False
+        try:
+            source = self._compiled_c()
+        except PyrtlError:  # a rom whose data cannot be materialized
+            return False
+        if self.code_file is not None:
+            with open(self.code_file, 'w') as file:
+                file.write(source)
+        lib = _build_c_library(compiler, source)
+        if lib is None:
+            return False
+
+        import ctypes
+        u64_p = ctypes.POINTER(ctypes.c_uint64)
+        self._native_lib = lib
+        self._native_run = lib.pyrtl_run
+        self._native_run.argtypes = [ctypes.c_long, u64_p, u64_p, ctypes.POINTER(u64_p),
+                                     u64_p, u64_p]
+        self._native_run.restype = ctypes.c_long
+        self._native_mems = ctypes.cast((u64_p * len(self._native_mem_names))(),
+                                        ctypes.POINTER(u64_p))
+        for i, varname in enumerate(self._native_mem_names):
+            self.mems[varname] = _DenseMemory(self.mems[varname], 2**self._native_mem_widths[i],
+                                              self.default_value, native=True)
+            self._native_mems[i] = ctypes.cast(self.mems[varname].storage, u64_p)
+        # the buffers passed to the native code are allocated once: the
+        # registers are kept in theirs (which self.regs is a view of), and
+        # step reuses the same input, traced value and context buffers
+        u64 = ctypes.c_uint64
+        self._native_reg_state = _NativeRegisters(
+            self._native_regs, (u64 * max(len(self._native_regs), 1))())
+        self._native_reg_state.update(self.regs)
+        self.regs = self._native_reg_state
+        self._native_in_ports = {}  # both the Inputs and their names to (index, bitmask)
+        for i, w in enumerate(self._native_inputs):
+            self._native_in_ports[w] = self._native_in_ports[w.name] = (i, w.bitmask)
+        self._native_step_ins = (u64 * max(len(self._native_inputs), 1))()
+        self._native_step_out = (u64 * max(len(self._native_traced), 1))()
+        self._native_last = (u64 * len(self._native_columns))()
+        # the entry point of step: a second handle on pyrtl_run with all of its
+        # arguments bound, and without the argtypes converting them on each call
+        step_run = lib['pyrtl_run']
+        step_run.restype = ctypes.c_long
+        self._native_step_run = functools.partial(
+            step_run, ctypes.c_long(1), self._native_step_ins, self._native_reg_state.storage,
+            self._native_mems, self._native_step_out, self._native_last)
+        return True
+
+    def _native_reg_storage(self, regs):
+        """ The register buffer of the native code, loaded with regs if they are not already in it.
+
+        self.regs is replaced by a dict by restore, for example.
+        """
+        state = self._native_reg_state
+        if regs is not state:
+            state.update(regs)
+        return state.storage
+
+    def _step_native(self, provided_inputs):
+        """ Run one cycle through the native code. """
+        ports, n_ins = self._native_in_ports, len(self._native_inputs)
+        values = [None] * n_ins
+        for wire, value in provided_inputs.items():
+            port = ports.get(wire)
+            bitmask = port[1] if port is not None else \
+                self.block.wirevector_by_name[self._to_name(wire)].bitmask
+            if value > bitmask or value < 0:
+                raise PyrtlError("Wire {} has value {} which cannot be represented"
+                                 " using its bitwidth".format(self._to_name(wire), value))
+            if port is not None:
+                values[port[0]] = value
+        if None in values:
+            missing = self._native_inputs[values.index(None)]
+            raise PyrtlError('Input "%s" has no input value specified' % missing.name)
+
+        self._native_step_ins[:n_ins] = values
+        if self.regs is not self._native_reg_state:
+            self._native_reg_storage(self.regs)
+            self.regs = self._native_reg_state
+        ran = self._native_step_run()
+        self.context = dict(zip(self._native_columns, self._native_last[:]))
+        if self.tracer is not None:
+            self.tracer.add_fast_step(self)
+        if ran < 0:  # an assertion failed, checked by the native code
+            check_rtl_assertions(self)
 
-class _WaveRendererBase(object):
-    _tick, _up, _down, _x, _low, _high, _revstart, _revstop = ('' for i in range(8))
+    def _native_run_func(self, n, inputs, regs, mems, traces):
+        """ The native counterpart of the generated run_func (see _compiled_run).
 
-    def __init__(self):
-        super(_WaveRendererBase, self).__init__()
-        self.prior_val = None
+        The cycles are run in blocks of at most _run_block_cycles, so that the
+        buffers of the input and traced values stay bounded.  The values of
+        each input for a whole block are taken from its iterator at once and
+        packed into the input buffer by ctypes, rather than cycle by cycle.
+        """
+        import ctypes
+        u64 = ctypes.c_uint64
+        n_ins, n_traced = len(self._native_inputs), len(self._native_traced)
+        iters = [inputs[wire.name] for wire in self._native_inputs]
+        regs = self._native_reg_storage(regs)
+        last = self._native_last
+        traces = [(self._native_traced.index(name), values) for name, values in traces.items()]
+        status = None
+        done = 0
+        while done < n and status is None:
+            block = min(n - done, self._run_block_cycles)
+            ins = (u64 * max(block * n_ins, 1))()
+            for i, (wire, it) in enumerate(zip(self._native_inputs, iters)):
+                values = list(itertools.islice(it, block))
+                bad = _first_bad_value(values, wire.bitmask)
+                if bad < block:  # stop before the first cycle missing a valid value
+                    block = bad
+                    status = (wire.name, values[bad] if bad < len(values) else None)
+                ins[i:block * n_ins:n_ins] = values[:block]
+            if block == 0:
+                break
+            out = (u64 * max(block * n_traced, 1))()
+            ran = self._native_run(block, ins, regs, self._native_mems, out, last)
+            if ran < 0:  # an assertion failed in cycle -ran
+                ran, status = -ran, 'assert'
+            for col, values in traces:
+                values[done:done + ran] = out[col:ran * n_traced:n_traced]
+            done += ran
+        if done == 0:
+            return 0, status, self._native_reg_state, None
+        return done, status, self._native_reg_state, dict(zip(self._native_columns, last))
+
+    def _compiled_c(self):
+        """ Return the C source of pyrtl_run, which runs n cycles of the block.
+
+        long pyrtl_run(long n, const uint64_t *ins, uint64_t *regs,
+                       uint64_t **mems, uint64_t *out, uint64_t *last)
+        reads the inputs of each cycle from ins (in the order of _native_inputs),
+        keeps the register state in regs (in the order of _native_regs) and the
+        contents of the memories in mems, and writes the values of the traced
+        wires (_native_traced) to out for every cycle.  The values of the wires
+        in _native_columns are written to last for the last cycle run only.
+        It returns n, or -(k + 1) if an assertion failed in cycle k (after
+        which it stops).
+        """
+        by_name = sorted(self.block.wirevector_set, key=lambda w: w.name)
+        var = {w: 'w%d' % i for i, w in enumerate(by_name)}
+        self._native_inputs = [w for w in by_name if isinstance(w, Input)]
+        regs = [w for w in by_name if isinstance(w, Register)]
+        self._native_regs = [w.name for w in regs]
+        columns = set(w for w in by_name if isinstance(w, (Input, Output, Register)))
+        columns.update(self.block.wirevector_by_name[name] for name in self._traced_names())
+        columns = sorted(columns, key=lambda w: w.name)
+        self._native_columns = [w.name for w in columns]
+        traced = [self.block.wirevector_by_name[name] for name in self._traced_names()]
+        self._native_traced = [w.name for w in traced]
+
+        mems, roms = {}, {}
+        for net in sorted(self.block.logic_subset('m@'), key=lambda net: net.op_param[0]):
+            mem = net.op_param[1]
+            if isinstance(mem, RomBlock):
+                roms.setdefault(mem, 'rom%d' % len(roms))
+            else:
+                mems.setdefault(mem, 'mem%d' % len(mems))
+        mem_order = sorted(mems, key=lambda mem: mems[mem])
+        # looked up by identity, as == on a wire builds a comparison net
+        mem_index = {mem: i for i, mem in enumerate(mem_order)}
+        reg_index = {reg: i for i, reg in enumerate(regs)}
+        self._native_mem_names = [self._mem_varname(mem) for mem in mem_order]
+        self._native_mem_widths = [mem.addrwidth for mem in mem_order]
+
+        def arg(wire):
+            if isinstance(wire, Const):
+                return '%dULL' % wire.val
+            return var[wire]
+
+        def mask(wire):
+            return '0x%xULL' % wire.bitmask
+
+        binary = {'&': '&', '|': '|', '^': '^', '+': '+', '-': '-', '*': '*',
+                  '<': '<', '>': '>', '=': '=='}
+        prog = ['#include <stdint.h>', '']
+        for rom, name in sorted(roms.items(), key=lambda item: item[1]):
+            data = ', '.join('%dULL' % rom._get_read_data(addr)
+                             for addr in range(2**rom.addrwidth))
+            prog.append('static const uint64_t %s[%d] = {%s};' % (name, 2**rom.addrwidth, data))
+        prog.append('')
+        prog.append('long pyrtl_run(long n, const uint64_t *ins, uint64_t *regs, '
+                    'uint64_t **mems, uint64_t *out, uint64_t *last)')
+        prog.append('{')
+        prog.append('    long cycle;')
+        for mem, name in sorted(mems.items(), key=lambda item: item[1]):
+            prog.append('    uint64_t *%s = mems[%d];' % (name, mem_index[mem]))
+        prog.append('    for (cycle = 0; cycle < n; cycle++) {')
+        prog.append('        const uint64_t *in = ins + cycle * %d;' % len(self._native_inputs))
+        prog.append('        uint64_t *o = out + cycle * %d;' % len(traced))
+        for i, wire in enumerate(self._native_inputs):
+            prog.append('        uint64_t %s = in[%d];' % (var[wire], i))
+        for i, wire in enumerate(regs):
+            prog.append('        uint64_t %s = regs[%d];' % (var[wire], i))
+
+        reg_updates, mem_writes = [], []
+        for net in self.block:
+            if net.op == 'r':
+                reg_updates.append('        regs[%d] = %s & %s;' % (
+                    reg_index[net.dests[0]], arg(net.args[0]), mask(net.dests[0])))
+                continue
+            if net.op == '@':
+                addr, data, enable = (arg(a) for a in net.args)
+                mem_writes.append('        if (%s) %s[%s] = %s;' % (
+                    enable, mems[net.op_param[1]], addr, data))
+                continue
+            args = [arg(a) for a in net.args]
+            if net.op in binary:
+                expr = '(%s %s %s)' % (args[0], binary[net.op], args[1])
+            elif net.op == 'w':
+                expr = args[0]
+            elif net.op == '~':
+                expr = '(~%s)' % args[0]
+            elif net.op == 'n':
+                expr = '(~(%s & %s))' % tuple(args)
+            elif net.op == 'x':
+                expr = '(%s ? %s : %s)' % (args[0], args[2], args[1])
+            elif net.op == 'c':
+                parts, shift = [], 0
+                for a, wire in reversed(list(zip(args, net.args))):
+                    parts.append('(%s << %d)' % (a, shift))
+                    shift += len(wire)
+                expr = '(%s)' % ' | '.join(parts)
+            elif net.op == 's':
+                parts = ['(((%s >> %d) & 1ULL) << %d)' % (args[0], bit, i)
+                         for i, bit in enumerate(net.op_param)]
+                expr = '(%s)' % ' | '.join(parts)
+            elif net.op == 'm':
+                mem = net.op_param[1]
+                expr = '%s[%s]' % (roms[mem] if isinstance(mem, RomBlock) else mems[mem], args[0])
+            else:
+                raise PyrtlInternalError('error, unknown op type')
+            prog.append('        uint64_t %s = (uint64_t)%s & %s;' % (
+                var[net.dests[0]], expr, mask(net.dests[0])))
+
+        for i, wire in enumerate(traced):
+            prog.append('        o[%d] = %s;' % (i, arg(wire)))
+        asserts = sorted(self.block.rtl_assert_dict, key=lambda w: w.name)
+        if asserts:
+            prog.append('        int failed = !(%s);' % ' && '.join(var[w] for w in asserts))
+            prog.append('        if (failed || cycle + 1 == n) {')
+        else:
+            prog.append('        if (cycle + 1 == n) {')
+        for i, wire in enumerate(columns):
+            prog.append('            last[%d] = %s;' % (i, arg(wire)))
+        prog.append('        }')
+        prog.extend(mem_writes)
+        prog.extend(reg_updates)
+        if asserts:
+            prog.append('        if (failed)')
+            prog.append('            return -(cycle + 1);')
+        prog.append('    }')
+        prog.append('    return n;')
+        prog.append('}')
+        return '\n'.join(prog) + '\n'
+
+
+def _find_c_compiler():
+    """ Return the path of the C compiler for native simulation, or None. """
+    import os
+    compiler = os.environ.get('CC', 'cc')
+    try:
+        from shutil import which
+    except ImportError:  # python 2
+        from distutils.spawn import find_executable as which
+    return which(compiler)
+
+
+def _build_c_library(compiler, source):
+    """ Compile source into a shared library and load it, returning None on failure. """
+    import ctypes
+    import os
+    import shutil
+    import subprocess
+    import tempfile
+    import warnings
+    build_dir = tempfile.mkdtemp(prefix='pyrtl_native_')
+    try:
+        c_file = os.path.join(build_dir, 'sim.c')
+        so_file = os.path.join(build_dir, 'sim.so')
+        with open(c_file, 'w') as f:
+            f.write(source)
+        try:
+            subprocess.check_output([compiler, '-O2', '-shared', '-fPIC', '-o', so_file, c_file],
+                                    stderr=subprocess.STDOUT)
+        except (OSError, subprocess.CalledProcessError) as e:
+            warnings.warn('native simulation disabled, compiling failed: %s' % str(e))
+            return None
+        return ctypes.CDLL(so_file)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def _compile_sources(sources):
+    """ Compile each of the sources on its own, returning a tuple of code objects. """
+    return tuple(compile(source, '<string>', 'exec') for source in sources)
+
+
+def _first_bad_value(values, bitmask):
+    """ The index of the first value that is None or does not fit in bitmask, or len(values). """
+    try:
+        if min(values) >= 0 and max(values) <= bitmask:
+            return len(values)
+    except (TypeError, ValueError):  # a None, or no values at all
+        pass
+    for i, value in enumerate(values):
+        if value is None or not 0 <= value <= bitmask:
+            return i
+    return len(values)
+
+
+def _is_bit_range(bits):
+    """ Whether the bit indices are consecutive and ascending, as in wire[2:7]. """
+    return all(b == bits[0] + i for i, b in enumerate(bits))
+
+
+# ----------------------------------------------------------------
+#    __    ___  __        __                  ___
+#   |__) |  |  |__)  /\  |__)  /\  |    |    |__  |
+#   |__) |  |  |    /~~\ |  \ /~~\ |___ |___ |___ |___
+#
+
+
+class BitParallelSimulation(object):
+    """A class for simulating many independent test vectors on a synthesized block.
+
+    After synthesis every wire of the block (other than the inputs, outputs and
+    memory ports) is a single bit and every gate is a simple bitwise operation.
+    BitParallelSimulation packs the values of a wire bit across all of the
+    "lanes" (independent test vectors) into a single Python integer, bit i of
+    which holds the value for lane i, so that each gate is evaluated for all
+    lanes at once with a single bitwise operation.
+    """
+
+    def __init__(
+            self, lanes=64, register_value_map=None, memory_value_map=None,
+            default_value=0, wires_to_track=None, block=None):
+        """ Creates a new bit parallel simulator.
+
+        :param lanes: the number of independent test vectors simulated at once.
+          Any number of lanes is supported, but a multiple of the machine word
+          size (such as 64) uses the underlying integers most efficiently.
+        :param wires_to_track: the wires for which per lane traces are kept;
+          defaults to the Inputs and Outputs of the block
+        :param block: the PostSynthBlock to simulate (defaults to the working block)
+
+        Look at Simulation.__init__ for descriptions for the other parameters.
+        Registers and memories in the value maps may be given either as the
+        pre-synthesis objects or as those of the synthesized block, and the
+        values may either be a single value for all lanes or a list with one
+        value per lane.
+        """
+        block = working_block(block)
+        if not isinstance(block, PostSynthBlock):
+            raise PyrtlError('BitParallelSimulation requires a synthesized block '
+                             '(see pyrtl.synthesize)')
+        block.sanity_check()
+        if not isinstance(lanes, numbers.Integral) or lanes < 1:
+            raise PyrtlError('lanes must be a positive integer, not "%s"' % str(lanes))
+
+        self.block = block
+        self.lanes = lanes
+        self.default_value = default_value
+        self.all_lanes = (1 << lanes) - 1
+        if wires_to_track is None:
+            wires_to_track = block.wirevector_subset((Input, Output))
+        self.wires_to_track = [block.wirevector_by_name[self._to_name(w)]
+                               for w in wires_to_track]
+        self.trace = {w.name: [] for w in self.wires_to_track}
+        self.regs = {}
+        self.mems = {}
+        self.context = None
+        self._initialize(register_value_map, memory_value_map)
+
+    def _initialize(self, register_value_map, memory_value_map):
+        if register_value_map is None:
+            register_value_map = {}
+        reg_values = {}
+        for reg, value in register_value_map.items():
+            name = self._to_name(reg)
+            values = self._lane_values(value)
+            if name in self.block.wirevector_by_name:
+                reg_values[name] = values
+            else:  # a pre-synthesis register, which synthesis split into bits
+                prefix = name + '_synth_'
+                bits = {reg.name: int(reg.name[len(prefix):])
+                        for reg in self.block.wirevector_subset(Register)
+                        if reg.name.startswith(prefix) and reg.name[len(prefix):].isdigit()}
+                if not bits:
+                    raise PyrtlError('register_value_map has a value for "%s", which is not '
+                                     'a register of the block' % name)
+                for bit_name, i in bits.items():
+                    reg_values[bit_name] = [(v >> i) & 1 for v in values]
+        for reg in self.block.wirevector_subset(Register):
+            values = reg_values.get(reg.name, [self.default_value] * self.lanes)
+            self.regs[reg.name] = self._pack(values, len(reg))
+
+        if memory_value_map is None:
+            memory_value_map = {}
+        for mem, mem_map in memory_value_map.items():
+            if isinstance(mem, RomBlock):
+                raise PyrtlError('error, one or more of the memories in the map is a RomBlock')
+            mem = self.block.mem_map.get(mem, mem)
+            self.mems[self._mem_varname(mem)] = [dict(mem_map) for lane in range(self.lanes)]
+        for net in self.block.logic_subset('m@'):
+            mem = net.op_param[1]
+            if self._mem_varname(mem) not in self.mems:
+                if isinstance(mem, RomBlock):
+                    self.mems[self._mem_varname(mem)] = mem
+                else:
+                    self.mems[self._mem_varname(mem)] = [{} for lane in range(self.lanes)]
+
+        context = {'_unpack': self._unpack, '_pack': self._pack}
+        exec(compile(self._compiled(), '<string>', 'exec'), context)
+        self.sim_func = context['sim_func']
+
+    def step(self, provided_inputs):
+        """ Run the simulation for a cycle of every lane.
+
+        :param provided_inputs: a dictionary mapping Inputs (either those of the
+          synthesized block, the pre-synthesis Inputs or their names) to either
+          a list with one value per lane or a single value shared by all lanes
+        """
+        ins = {}
+        for wire, value in provided_inputs.items():
+            name = self._to_name(wire)
+            sim_wire = self.block.wirevector_by_name.get(name)
+            if not isinstance(sim_wire, Input):
+                raise PyrtlError('step provided a value for "%s" which is not a known input'
+                                 % name)
+            ins[name] = self._pack(self._lane_values(value, sim_wire), len(sim_wire))
+        missing = set(w.name for w in self.block.wirevector_subset(Input)) - set(ins)
+        if missing:
+            raise PyrtlError('Input "%s" has no input value specified' % missing.pop())
+
+        d = dict(ins)
+        d.update(self.regs)
+        d.update(self.mems)
+        regs, outs, mem_writes = self.sim_func(d)
+
+        for mem, addr, data, enable in mem_writes:
+            addrs, values = self._unpack(addr), self._unpack(data)
+            for lane in range(self.lanes):
+                if (enable >> lane) & 1:
+                    self.mems[mem][lane][addrs[lane]] = values[lane]
+
+        self.context = outs
+        self.context.update(self.regs)
+        self.context.update(ins)
+        self.regs = regs
+        for name, planes_trace in self.trace.items():
+            planes_trace.append(self.context[name])
+
+        for (w, exp) in self.block.rtl_assert_dict.items():
+            if w.name in self.context and self.context[w.name][0] != self.all_lanes:
+                _rtl_assertion_failed(self, w, exp)
+
+    def inspect(self, w):
+        """ Get the per lane values of a wirevector in the last simulation cycle.
+
+        :param w: the name of the WireVector to inspect
+        :return: list with the value of w in each lane
+
+        Only the Inputs, Outputs, Registers and tracked wires can be inspected.
+        """
+        if self.context is None:
+            raise PyrtlError("No context available. Please run a simulation step in "
+                             "order to populate values for wires")
+        return self._unpack(self.context[self._to_name(w)])
+
+    def inspect_mem(self, mem):
+        """ Get the values in a memory during the current simulation cycle.
+
+        :param mem: the memory to inspect (either pre or post synthesis)
+        :return: a list of {address: value} dictionaries, one per lane
+        """
+        if isinstance(mem, RomBlock):
+            raise PyrtlError("ROM blocks are not stored in the simulation object")
+        return self.mems[self._mem_varname(self.block.mem_map.get(mem, mem))]
+
+    def lane_trace(self, lane):
+        """ Return a SimulationTrace holding the tracked wires of a single lane. """
+        if not 0 <= lane < self.lanes:
+            raise PyrtlError('lane %d does not exist' % lane)
+        tracer = SimulationTrace(self.wires_to_track, self.block)
+        for name, planes_trace in self.trace.items():
+            tracer.trace[name].extend(
+                sum(((p >> lane) & 1) << i for i, p in enumerate(planes))
+                for planes in planes_trace)
+        return tracer
+
+    def _to_name(self, wire):
+        if isinstance(wire, WireVector):
+            wire = self.block.io_map.get(wire, wire)
+            return wire.name
+        return wire
+
+    def _lane_values(self, value, wire=None):
+        if isinstance(value, numbers.Integral):
+            values = [value] * self.lanes
+        else:
+            values = list(value)
+        if len(values) != self.lanes:
+            raise PyrtlError('expected %d lane values, got %d' % (self.lanes, len(values)))
+        for v in values:
+            if not isinstance(v, numbers.Integral) or v < 0 or \
+                    (wire is not None and v > wire.bitmask):
+                raise PyrtlError('value %s is not valid for %s' % (str(v), str(wire)))
+        return values
+
+    def _pack(self, values, bitwidth):
+        """ Transpose per lane values into a tuple of per bit lane masks. """
+        return tuple(int(''.join('1' if (v >> i) & 1 else '0' for v in reversed(values)), 2)
+                     for i in range(bitwidth))
+
+    def _unpack(self, planes):
+        """ Transpose a tuple of per bit lane masks back into per lane values. """
+        lane_bits = [format(p, 'b').zfill(self.lanes)[::-1] for p in reversed(planes)]
+        return [int(''.join(bits[lane] for bits in lane_bits), 2) for lane in range(self.lanes)]
+
+    @staticmethod
+    def _mem_varname(mem):
+        return 'fs_mem' + str(mem.id)
+
+    def _compiled(self):
+        """ Return the code of a function evaluating every lane of one cycle.
+
+        Each bit of each wire is held in its own local variable, which are all
+        named after the index of the wire rather than its name.
+        """
+        wire_index = {w: i for i, w in enumerate(self.block.wirevector_set)}
+
+        def planes(wire):
+            if isinstance(wire, Const):
+                return [str(self.all_lanes) if (wire.val >> i) & 1 else '0'
+                        for i in range(len(wire))]
+            return ['_v%d_%d' % (wire_index[wire], i) for i in range(len(wire))]
+
+        def assign(targets, exprs):
+            if targets:
+                prog.append('    %s = %s' % (', '.join(targets), ', '.join(exprs)))
+
+        def store(wire, dest):
+            prog.append('    %s[%s] = (%s,)' % (dest, repr(wire.name), ', '.join(planes(wire))))
+
+        prog = ['def sim_func(d):', '    regs = {}', '    outs = {}', '    mem_ws = []']
+        for wire in self.block.wirevector_subset((Input, Register)):
+            assign(planes(wire), ['d[%s][%d]' % (repr(wire.name), i) for i in range(len(wire))])
+
+        for net in self.block:
+            if net.op in 'r@':
+                continue  # registers are latched at the end, memory writes go through step
+            dest = planes(net.dests[0])
+            args = [planes(a) for a in net.args]
+            if net.op == 'w':
+                exprs = args[0]
+            elif net.op == '~':
+                exprs = ['(%d ^ %s)' % (self.all_lanes, a) for a in args[0]]
+            elif net.op in '&|^':
+                exprs = ['(%s %s %s)' % (a, net.op, b) for a, b in zip(*args)]
+            elif net.op == 'n':
+                exprs = ['(%d ^ (%s & %s))' % (self.all_lanes, a, b) for a, b in zip(*args)]
+            elif net.op == 'c':
+                exprs = [p for a in reversed(args) for p in a]
+            elif net.op == 's':
+                exprs = [args[0][b] for b in net.op_param]
+            elif net.op == 'm':
+                # memory reads are done lane by lane on the unpacked address
+                mem = net.op_param[1]
+                prog.append('    _mem = d["%s"]' % self._mem_varname(mem))
+                prog.append('    _addrs = _unpack((%s,))' % ', '.join(args[0]))
+                if isinstance(mem, RomBlock):
+                    read = '_mem._get_read_data(_a)'
+                else:
+                    read = '_mem[_lane].get(_a, %d)' % self.default_value
+                prog.append('    _data = _pack([%s for _lane, _a in enumerate(_addrs)], %d)'
+                            % (read, len(dest)))
+                exprs = ['_data[%d]' % i for i in range(len(dest))]
+            else:
+                raise PyrtlError('BitParallelSimulation cannot handle primitive "%s", '
+                                 'the block must be synthesized first' % net.op)
+            assign(dest, exprs[:len(dest)])
+
+        for net in self.block.logic_subset('@'):
+            addr, data, enable = (planes(a) for a in net.args)
+            prog.append('    mem_ws.append(("%s", (%s,), (%s,), %s))'
+                        % (self._mem_varname(net.op_param[1]), ', '.join(addr),
+                           ', '.join(data), enable[0]))
+        for net in self.block.logic_subset('r'):
+            next_planes = planes(net.args[0])[:len(net.dests[0])]
+            prog.append('    regs[%s] = (%s,)' % (repr(net.dests[0].name), ', '.join(next_planes)))
+        for wire in self.block.wirevector_subset(Output):
+            store(wire, 'outs')
+        for wire in self.wires_to_track:
+            if not isinstance(wire, (Input, Register, Output)):
+                store(wire, 'outs')
+        prog.append('    return regs, outs, mem_ws')
+        return '\n'.join(prog)
+
+
+def _structural_hash(block, named_wires=()):
+    """ Return a hex digest identifying the structure of the logic in block.
+
+    :param named_wires: names of wires whose names are significant even though
+      they are not Inputs, Outputs or Registers (such as traced wires)
+
+    Two blocks get the same hash if they compute the same thing through the same
+    nets, even if their temporary wires are named differently.  Each wire is
+    labelled either by its name (for the interface of the block) or by the net
+    driving it, which in turn is labelled by its op and the labels of its args.
+    """
+    import hashlib
+    labels = _interface_labels(block.wirevector_set, named_wires)
+    net_labels = _net_labels(block, labels, _memory_numbers(block))
+
+    digest = hashlib.sha1()
+    for label in sorted(net_labels) + sorted(labels[w] for w in block.wirevector_set):
+        digest.update(label.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def _memory_numbers(nets):
+    """ Return {memory: number}, numbering the memories of nets in the order of first use. """
+    mem_ids = {}
+    for net in nets:
+        if net.op in 'm@':
+            mem_ids.setdefault(net.op_param[1], len(mem_ids))
+    return mem_ids
+
+
+def _interface_labels(wires, named_wires=()):
+    """ Return {wire: label} for those of wires labelled by their name or value. """
+    named_wires = set(named_wires)
+    labels = {}
+    for w in wires:
+        if isinstance(w, Const):
+            labels[w] = 'C%d/%d' % (w.val, w.bitwidth)
+        elif isinstance(w, (Input, Output, Register)) or w.name in named_wires:
+            labels[w] = '%s:%s/%d' % (type(w).__name__, w.name, w.bitwidth)
+    return labels
+
+
+def _net_labels(nets, labels, mem_ids):
+    """ Return the labels of nets, which are in topological order (see _structural_hash).
+
+    labels holds the labels of the wires labelled by name, see _interface_labels,
+    and the labels of the other wires driven by the nets are added to it.
+    mem_ids maps each memory to the number it is labelled by in place of its
+    memid (see _memory_numbers), which differs between builds of a design.
+    """
+    import hashlib
+
+    def param_label(net):
+        if net.op in 'm@':
+            mem = net.op_param[1]
+            return '%d:%s:%d:%d' % (mem_ids[mem], type(mem).__name__, mem.bitwidth,
+                                    mem.addrwidth)
+        return repr(net.op_param)
+
+    net_labels = []
+    for net in nets:
+        body = '%s(%s)[%s]' % (net.op, param_label(net), ','.join(labels[a] for a in net.args))
+        for i, dest in enumerate(net.dests):
+            if dest not in labels:  # digests keep labels short in deep logic
+                body_digest = hashlib.sha1(body.encode('utf-8')).hexdigest()
+                labels[dest] = 'W%s.%d/%d' % (body_digest, i, dest.bitwidth)
+        net_labels.append(body + '->' + ','.join(labels[d] for d in net.dests))
+    return net_labels
+
+
+class SimulationCodeCache(object):
+    """ An on-disk cache of the code compiled by FastSimulation.
+
+    Compiled code objects are stored with marshal in cache_dir, keyed by the
+    structure of the simulated block and everything else that changes the
+    generated code.  When the files in the directory grow beyond max_size bytes
+    the least recently used ones are removed.
+    """
+
+    def __init__(self, cache_dir=None, max_size=64 * 2**20):
+        """ Creates a cache of compiled simulation code.
+
+        :param cache_dir: directory holding the cache; defaults to the
+          PYRTL_CACHE_DIR environment variable or ~/.cache/pyrtl
+        :param max_size: the maximum total size, in bytes, of the cached code
+        """
+        import os
+        if cache_dir is None:
+            cache_dir = os.environ.get('PYRTL_CACHE_DIR',
+                                       os.path.join(os.path.expanduser('~'), '.cache', 'pyrtl'))
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, block, traced_names, default_value, options=None):
+        """ Return the cache key of the code for simulating block. """
+        import hashlib
+        parts = [sys.version, _structural_hash(block, traced_names),
+                 repr(sorted(traced_names)), repr(default_value),
+                 repr(sorted((options or {}).items())), _codegen_fingerprint()]
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        import os
+        return os.path.join(self.cache_dir, key + '.code')
+
+    def load(self, key):
+        """ Return the cached code object for key, or None if it is not cached. """
+        import os
+        import marshal
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                code = marshal.loads(f.read())
+            os.utime(path, None)  # mark it as recently used
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return code
+
+    def store(self, key, code):
+        """ Add a code object to the cache, evicting old entries if needed. """
+        import os
+        import marshal
+        import tempfile
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(marshal.dumps(code))
+            os.rename(tmp_path, self._path(key))  # atomic, so readers never see partial files
+        except OSError:
+            os.remove(tmp_path)
+        self._evict()
+
+    def _evict(self):
+        import os
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.code'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue  # removed by another process
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """ Remove every entry from the cache. """
+        import os
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.code'):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+_codegen_fingerprint_value = None
+
+
+def _codegen_fingerprint():
+    """ Return a digest of the code generator, so upgrades invalidate cached code. """
+    global _codegen_fingerprint_value
+    if _codegen_fingerprint_value is None:
+        import hashlib
+        import inspect
+        try:
+            source = inspect.getsource(FastSimulation)
+        except (IOError, OSError, TypeError):
+            source = ''
+        _codegen_fingerprint_value = hashlib.sha1(source.encode('utf-8')).hexdigest()
+    return _codegen_fingerprint_value
+
+
+# ----------------------------------------------------------------
+#    __        __                  ___          __
+#   |__)  /\  |__)  /\  |    |    |__  |       /__` |  |\/|
+#   |    /~~\ |  \ /~~\ |___ |___ |___ |___    .__/ |  |  |
+#
+
+def parallel_simulate(design, stimuli, cycles=None, wires_to_track=None,
+                      register_value_map=None, memory_value_map=None, default_value=0,
+                      max_workers=None, chunksize=None):
+    """ Run many independent simulations of a design across worker processes.
+
+    :param design: the Block to simulate, or a function building the design in
+      the working block (it has to be picklable, i.e. defined at module level)
+    :param stimuli: a list of stimulus sets, each a dict mapping the name of
+      every Input to the list of its values, one per cycle (as for FastSimulation.run)
+    :param cycles: the number of cycles to run each simulation for; defaults
+      to running until the inputs run out
+    :param wires_to_track: the names of the wires to trace, defaults to the
+      wires a SimulationTrace traces by default
+    :param register_value_map: initial values of registers, as {register name: value}
+    :param memory_value_map: initial values of memories, as {memory name: {address: value}}
+    :param default_value: the value of all other registers and memory addresses
+    :param max_workers: the number of worker processes, defaults to the number of cores
+    :param chunksize: the number of stimulus sets sent to a worker at a time
+    :return: a list with the trace of each stimulus set, as a dict mapping wire
+      names to lists of values
+
+    Each worker builds the design and compiles a FastSimulation once, then
+    resets and reuses it for every stimulus set it is given.  If an rtl_assert
+    fails, the exception of the failure in the earliest stimulus set is
+    raised (with the stimulus index in the attribute stimulus_index) and the
+    simulations not yet started are cancelled.  Requires concurrent.futures.
+    """
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+    except ImportError:
+        raise PyrtlError('parallel_simulate requires concurrent.futures '
+                         '(install the "futures" backport on python 2)')
+    import multiprocessing
+
+    if not isinstance(design, Block) and not callable(design):
+        raise PyrtlError('design must be a Block or a function building the design')
+    stimuli = list(stimuli)
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, len(stimuli) // (max_workers * 4))
+    chunks = [(start, stimuli[start:start + chunksize])
+              for start in range(0, len(stimuli), chunksize)]
+    sim_args = (wires_to_track, register_value_map, memory_value_map, default_value)
+
+    traces = [None] * len(stimuli)
+    with ProcessPoolExecutor(max_workers, initializer=_parallel_worker_init,
+                             initargs=(design, sim_args)) as executor:
+        futures = [executor.submit(_parallel_worker_run, start, chunk, cycles)
+                   for start, chunk in chunks]
+        try:
+            for future in futures:
+                start, chunk_traces, failure = future.result()
+                traces[start:start + len(chunk_traces)] = chunk_traces
+                if failure is not None:
+                    failure.stimulus_index = start + len(chunk_traces)
+                    raise failure
+        finally:
+            for future in futures:
+                future.cancel()
+    return traces
+
+
+# the FastSimulation of the design in a worker process of parallel_simulate,
+# along with its initial register and memory state
+_parallel_worker = None
+
+
+def _parallel_worker_init(design, sim_args):
+    global _parallel_worker
+    if isinstance(design, Block):
+        block = design
+    else:
+        reset_working_block()
+        design()
+        block = working_block()
+
+    wires_to_track, register_value_map, memory_value_map, default_value = sim_args
+    if wires_to_track is not None:
+        wires_to_track = [block.wirevector_by_name[name] for name in wires_to_track]
+    registers = {block.wirevector_by_name[name]: value
+                 for name, value in (register_value_map or {}).items()}
+    mems = {}
+    if memory_value_map is not None:
+        mems_by_name = {net.op_param[1].name: net.op_param[1]
+                        for net in block.logic_subset('m@')}
+        mems = {mems_by_name[name]: dict(values) for name, values in memory_value_map.items()}
+
+    tracer = SimulationTrace(wires_to_track, block)
+    sim = FastSimulation(register_value_map=registers, memory_value_map=mems,
+                         default_value=default_value, tracer=tracer, block=block)
+    _parallel_worker = (sim, sim.snapshot())
+
+
+def _parallel_worker_run(start, stimuli, cycles):
+    """ Run the worker's simulation over each stimulus set, stopping at the first failure. """
+    sim, initial_state = _parallel_worker
+    asserts = tuple(sim.block.rtl_assert_dict.values())
+    traces = []
+    for stimulus in stimuli:
+        sim.restore(initial_state)  # which also empties the trace
+        try:
+            sim.run(cycles, stimulus)
+        except Exception as e:
+            if any(e is exp for exp in asserts):
+                return start, traces, e
+            raise
+        traces.append({name: list(values) for name, values in sim.tracer.trace.items()})
+    return start, traces, None
+
+
+# ----------------------------------------------------------------
+#    __        __  ___   ___    __        ___  __      __
+#   |__)  /\  |__)  |  |  |  | /  \ |\ | |__  |  \    /__` |  |\/|
+#   |    /~~\ |  \  |  |  |  | \__/ | \| |___ |__/    .__/ |  |  |
+#
+
+class PartitionedSimulation(object):
+    """A simulation evaluating the register-isolated regions of a block separately.
+
+    The block is split into regions that only communicate through registers
+    (see pyrtl.analysis.partition_block), and the regions are spread over
+    groups that are each simulated by their own FastSimulation.  In every
+    cycle a group is given the values of the inputs and of the registers of
+    other groups it reads, and returns the new values of its own registers.
+
+    With workers=N the groups are simulated in N worker processes, which
+    step concurrently; this only pays off when the logic of each group takes
+    much longer to evaluate than a round trip to a worker process.
+    """
+
+    def __init__(
+            self, register_value_map=None, memory_value_map=None,
+            default_value=0, tracer=None, block=None, workers=None):
+        """ Creates a new partitioned simulation.
+
+        :param workers: the number of worker processes to spread the regions
+          over; by default every region is simulated in this process, as a
+          separate FastSimulation
+
+        Look at Simulation.__init__ for descriptions for the other parameters
+        """
+        block = working_block(block)
+        block.sanity_check()  # check that this is a good hw block
+
+        self.block = block
+        self.default_value = default_value
+        if tracer is None:
+            tracer = SimulationTrace(block=block)
+        self.tracer = tracer
+        self.workers = workers
+
+        regions = partition_block(block)
+        if workers is None:
+            groups = [set(region) for region in regions]
+        else:
+            if not isinstance(workers, numbers.Integral) or workers < 1:
+                raise PyrtlError('workers must be a positive integer, not "%s"' % str(workers))
+            groups = [set() for i in range(min(workers, len(regions)))]
+            for region in regions:  # largest first, onto the emptiest group
+                min(groups, key=len).update(region)
+
+        register_value_map = {self._to_name(reg): val
+                              for reg, val in (register_value_map or {}).items()}
+        memory_value_map = {self._to_name(mem): values
+                            for mem, values in (memory_value_map or {}).items()}
+        self.regs = {reg.name: register_value_map.get(reg.name, default_value)
+                     for reg in block.wirevector_subset(Register)}
+        self._inputs = block.wirevector_subset(Input)
+        traced = set(w.name for w in tracer.wires_to_track) if tracer is not None else set()
+
+        self._groups = []
+        self._group_inputs = []
+        self._mem_groups = {}
+        for i, nets in enumerate(groups):
+            region = _region_block(nets)
+            inputs = tuple(w.name for w in region.wirevector_subset(Input))
+            mems = _block_memories(region)
+            spec = (region, traced, register_value_map,
+                    {name: memory_value_map.get(name, {}) for name in mems}, default_value)
+            if workers is None:
+                self._groups.append(_PartitionGroup(*spec))
+            else:
+                self._groups.append(_PartitionWorker(spec))
+            self._group_inputs.append(inputs)
+            self._mem_groups.update((name, i) for name in mems)
+
+    def step(self, provided_inputs):
+        """ Take the simulation forward one cycle
+
+        :param provided_inputs: a dictionary mapping WireVectors (or their names)
+          to their values for this step
+        """
+        values = {}
+        for wire, value in provided_inputs.items():
+            name = self._to_name(wire)
+            sim_wire = self.block.wirevector_by_name.get(name)
+            if sim_wire not in self._inputs:
+                raise PyrtlError('step provided a value for input for "%s" which is '
+                                 'not a known input ' % name)
+            if not isinstance(value, numbers.Integral) or not 0 <= value <= sim_wire.bitmask:
+                raise PyrtlError("Wire {} has value {} which cannot be represented"
+                                 " using its bitwidth".format(name, value))
+            values[name] = value
+        for wire in self._inputs:
+            if wire.name not in values:
+                raise PyrtlError('Input "%s" has no input value specified' % wire.name)
+
+        context = dict(values)
+        values.update(self.regs)
+        for group, inputs in zip(self._groups, self._group_inputs):
+            group.send_step({name: values[name] for name in inputs})
+        # the groups in workers step concurrently; every group is heard back
+        # from before any error is raised, so that no reply is left unread
+        results, error = [], None
+        for group in self._groups:
+            try:
+                results.append(group.receive_step())
+            except Exception as e:
+                error = e if error is None else error
+        if error is not None:
+            raise error
+        for group_context, group_regs in results:
+            context.update(group_context)
+            self.regs.update(group_regs)
+
+        self.context = context
+        if self.tracer is not None:
+            self.tracer.add_fast_step(self)
+        check_rtl_assertions(self)
+
+    def inspect(self, w):
+        """ Get the value of a wirevector in the last simulation cycle.
+
+        :param w: the name of the WireVector to inspect
+            (passing in a WireVector instead of a name is deprecated)
+        :return: value of w in the current step of simulation
+        """
+        try:
+            return self.context[self._to_name(w)]
+        except AttributeError:
+            raise PyrtlError("No context available. Please run a simulation step in "
+                             "order to populate values for wires")
+
+    def inspect_mem(self, mem):
+        """ Get a copy of the contents of a memory, as {address: value}. """
+        return self._groups[self._mem_groups[mem.name]].inspect_mem(mem.name)
+
+    def close(self):
+        """ Stop the worker processes (if any). """
+        for group in self._groups:
+            group.close()
+
+    def _to_name(self, wire):
+        """ Converts Wires and memories to strings, keeps strings as is """
+        if isinstance(wire, (WireVector, MemBlock)):
+            return wire.name
+        return wire
+
+
+class _PartitionGroup(object):
+    """ The FastSimulation of a group of regions of a PartitionedSimulation. """
+
+    def __init__(self, block, traced, register_value_map, memory_value_map, default_value):
+        wires = block.wirevector_by_name
+        mems = _block_memories(block)
+        self.registers = tuple(w.name for w in block.wirevector_subset(Register))
+        # what the group reports of each cycle: everything it drives that
+        # is traced, an output or a register
+        self.reported = tuple(sorted(
+            name for name, w in wires.items()
+            if not isinstance(w, (Input, Const)) and
+            (name in traced or isinstance(w, (Output, Register)))))
+        tracked = [wires[name] for name in self.reported if name in traced]
+        self.sim = FastSimulation(
+            register_value_map={wires[name]: register_value_map.get(name, default_value)
+                                for name in self.registers},
+            memory_value_map={mems[name]: dict(values)
+                              for name, values in memory_value_map.items()},
+            default_value=default_value, block=block,
+            tracer=RingBufferTrace(1, tracked, block))
+        self._result = None
+
+    def send_step(self, values):
+        # an error is kept until receive_step, as it is for a worker, so that
+        # the other groups are still stepped
+        sim = self.sim
+        try:
+            sim._step(values)
+        except Exception as e:
+            self._result = (False, e)
+            return
+        context, regs = sim.context, sim.regs
+        self._result = (True, ({name: context[name] for name in self.reported},
+                               {name: regs[name] for name in self.registers}))
+
+    def receive_step(self):
+        ok, result = self._result
+        if not ok:
+            raise result
+        return result
+
+    def inspect_mem(self, name):
+        return dict(self.sim.inspect_mem(_block_memories(self.sim.block)[name]))
+
+    def close(self):
+        pass
+
+
+class _PartitionWorker(object):
+    """ A _PartitionGroup simulated in a worker process. """
+
+    def __init__(self, spec):
+        import multiprocessing
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_partition_worker_main,
+                                                args=(child_conn, spec))
+        self._process.daemon = True
+        self._process.start()
+        self._receive()  # the group has been built
+
+    def _receive(self):
+        ok, result = self._conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def send_step(self, values):
+        self._conn.send(('step', values))
+
+    def receive_step(self):
+        return self._receive()
+
+    def inspect_mem(self, name):
+        self._conn.send(('mem', name))
+        return self._receive()
+
+    def close(self):
+        if self._process.is_alive():
+            self._conn.send(None)
+            self._process.join()
+
+
+def _partition_worker_main(conn, spec):
+    """ Serve the requests to a _PartitionGroup until told to stop. """
+    try:
+        group = _PartitionGroup(*spec)
+    except Exception as e:
+        conn.send((False, e))
+        return
+    conn.send((True, None))
+    while True:
+        request = conn.recv()
+        if request is None:
+            return
+        command, arg = request
+        try:
+            if command == 'step':
+                group.send_step(arg)
+                result = group.receive_step()
+            else:
+                result = group.inspect_mem(arg)
+        except Exception as e:
+            conn.send((False, e))
+        else:
+            conn.send((True, result))
+
+
+# ----------------------------------------------------------------
+#    ___  __        __   ___
+#     |  |__)  /\  /  ` |__
+#     |  |  \ /~~\ \__, |___
+#
+
+
+class _WaveRendererBase(object):
+    _tick, _up, _down, _x, _low, _high, _revstart, _revstop = ('' for i in range(8))
+
+    def __init__(self):
+        super(_WaveRendererBase, self).__init__()
+        self.prior_val = None
         self.prev_wire = None
 
     def tick_segment(self, n, symbol_len, segment_size):
@@ -721,11 +3658,16 @@ def _trace_sort_key(w):
     return [tryint(c) for c in re.split('([0-9]+)', w)]
 
 
-class TraceStorage(collections.Mapping):
+class TraceStorage(Mapping):
     __slots__ = ('__data',)
 
     def __init__(self, wvs):
-        self.__data = {wv.name: [] for wv in wvs}
+        self.__data = {wv.name: self._new_trace(wv) for wv in wvs}
+
+    @staticmethod
+    def _new_trace(wv):
+        """ Return the empty container in which the values of wv are stored. """
+        return []
 
     def __len__(self):
         return len(self.__data)
@@ -742,17 +3684,204 @@ class TraceStorage(collections.Mapping):
             key = key.name
         return self.__data[key]
 
+    def repeat_last(self, n_cycles):
+        """ Add n_cycles more copies of the last value to the end of every trace. """
+        for values in self.values():
+            values.extend(itertools.repeat(values[-1], n_cycles))
+
+
+def _trace_typecode():
+    """ The array typecode of an unsigned 64 bit integer on this platform. """
+    for typecode in ('Q', 'L'):
+        try:
+            if array.array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:  # no 'Q' on python 2
+            pass
+    raise PyrtlInternalError('no 64 bit unsigned array type available')
+
+
+class _WideTraceList(object):
+    """ Values of a wire wider than 64 bits, stored as 64 bit chunks in one array. """
+    __slots__ = ('chunks', '_values')
+
+    def __init__(self, bitwidth):
+        self.chunks = (bitwidth + 63) // 64
+        self._values = array.array(_trace_typecode())
+
+    def append(self, value):
+        self._values.extend((value >> (64 * i)) & 0xFFFFFFFFFFFFFFFF
+                            for i in range(self.chunks))
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def __len__(self):
+        return len(self._values) // self.chunks
+
+    def pop(self):
+        value = self[-1]
+        del self._values[-self.chunks:]
+        return value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('trace index out of range')
+        start = index * self.chunks
+        value = 0
+        for chunk in reversed(self._values[start:start + self.chunks]):
+            value = (value << 64) | chunk
+        return value
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class CompactTraceStorage(TraceStorage):
+    """ A TraceStorage keeping the values of each wire in a compact array.
+
+    Wires of up to 64 bits are stored in an array of unsigned 64 bit integers
+    and wider wires as a sequence of 64 bit chunks, rather than as a list of
+    Python ints.  Each trace supports the same len, indexing, iteration,
+    append and extend as a list, but does not compare equal to one.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def _new_trace(wv):
+        if wv.bitwidth <= 64:
+            return array.array(_trace_typecode())
+        return _WideTraceList(wv.bitwidth)
+
+    def to_numpy(self, key):
+        """ Return the trace of the given wire as a NumPy array (requires NumPy).
+
+        Traces of wires of up to 64 bits become uint64 arrays, wider ones
+        arrays of Python ints.
+        """
+        import numpy
+        values = self[key]
+        if isinstance(values, _WideTraceList):
+            return numpy.array(list(values), dtype=object)
+        return numpy.frombuffer(values, dtype=numpy.uint64).copy()
+
+
+class _RunLengthTraceList(object):
+    """ Values of a wire stored as runs of cycles in which the value is repeated. """
+    __slots__ = ('_values', '_ends')
+
+    def __init__(self):
+        self._values = []
+        self._ends = []  # the index one past the last cycle of each run
+
+    def append(self, value):
+        self.append_run(value, 1)
+
+    def append_run(self, value, count):
+        """ Append count copies of value. """
+        if count <= 0:
+            return
+        if self._values and self._values[-1] == value:
+            self._ends[-1] += count
+        else:
+            self._ends.append(len(self) + count)
+            self._values.append(value)
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def runs(self):
+        """ Return the trace as a list of (value, number of cycles) pairs. """
+        starts = [0] + self._ends[:-1]
+        return [(value, end - start)
+                for value, start, end in zip(self._values, starts, self._ends)]
+
+    def __len__(self):
+        return self._ends[-1] if self._ends else 0
+
+    def pop(self):
+        value = self[-1]
+        self._ends[-1] -= 1
+        if self._ends[-1] == (self._ends[-2] if len(self._ends) > 1 else 0):
+            self._values.pop()
+            self._ends.pop()
+        return value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('trace index out of range')
+        return self._values[bisect.bisect_right(self._ends, index)]
+
+    def __iter__(self):
+        for value, count in self.runs():
+            for _ in range(count):
+                yield value
+
+
+class RunLengthTraceStorage(TraceStorage):
+    """ A TraceStorage keeping the values of each wire as runs of repeated values.
+
+    A stretch of cycles in which a wire keeps its value is stored once, as
+    the value and the number of cycles, so the idle stretches of a long
+    simulation take almost no memory and the cycles skipped by step_repeat
+    are added in constant time.  Each trace supports the same len, indexing,
+    iteration, append and extend as a list (plus runs(), listing the runs),
+    but does not compare equal to one.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def _new_trace(wv):
+        return _RunLengthTraceList()
+
+    def repeat_last(self, n_cycles):
+        """ Add n_cycles more copies of the last value to the end of every trace. """
+        for values in self.values():
+            values.append_run(values[-1], n_cycles)
+
+
+class _RingTraceStorage(TraceStorage):
+    """ A TraceStorage keeping only the last capacity values of each wire. """
+    __slots__ = ('capacity',)
+
+    def __init__(self, wvs, capacity):
+        self.capacity = capacity
+        super(_RingTraceStorage, self).__init__(wvs)
+
+    def _new_trace(self, wv):
+        return collections.deque(maxlen=self.capacity)
+
+    def repeat_last(self, n_cycles):
+        """ Add n_cycles more copies of the last value to the end of every trace. """
+        super(_RingTraceStorage, self).repeat_last(min(n_cycles, self.capacity))
+
 
 class SimulationTrace(object):
     """ Storage and presentation of simulation waveforms. """
 
-    def __init__(self, wires_to_track=None, block=None):
+    def __init__(self, wires_to_track=None, block=None, compact=False, run_length=False):
         """
         Creates a new Simulation Trace
 
         :param wires_to_track: The wires that the tracer should track
         :param block:
+        :param compact: If True, store the trace in a CompactTraceStorage,
+          which takes several times less memory for long traces
+        :param run_length: If True, store the trace in a RunLengthTraceStorage,
+          which stores each run of cycles in which a wire keeps its value once
         """
+        if compact and run_length:
+            raise PyrtlError('a trace cannot be both compact and run_length')
         self.block = working_block(block)
 
         def is_internal_name(name):
@@ -766,7 +3895,12 @@ class SimulationTrace(object):
             wires_to_track = self.block.wirevector_set
 
         self.wires_to_track = wires_to_track
-        self.trace = TraceStorage(wires_to_track)
+        if compact:
+            self.trace = CompactTraceStorage(wires_to_track)
+        elif run_length:
+            self.trace = RunLengthTraceStorage(wires_to_track)
+        else:
+            self.trace = TraceStorage(wires_to_track)
         self._wires = {wv.name: wv for wv in wires_to_track}
 
     def __len__(self):
@@ -777,6 +3911,10 @@ class SimulationTrace(object):
         wire, value_list = next(x for x in self.trace.items())
         return len(value_list)
 
+    # the cycle the first entry of the trace is from, which is where the
+    # timestamps of print_vcd start (see RingBufferTrace)
+    start_cycle = 0
+
     def add_step(self, value_map):
         """ Add the values in value_map to the end of the trace. """
         if len(self.trace) == 0:
@@ -788,11 +3926,32 @@ class SimulationTrace(object):
             wirevec = self._wires[wire]
             tracelist.append(value_map[wirevec])
 
+    def add_steps(self, value_lists):
+        """ Add several cycles at once, given as a map from wire names to lists of values. """
+        for wire_name in self.trace:
+            self.trace[wire_name].extend(value_lists[wire_name])
+
     def add_fast_step(self, fastsim):
         """ Add the fastsim context to the trace. """
         for wire_name in self.trace:
             self.trace[wire_name].append(fastsim.context[wire_name])
 
+    def repeat_last_step(self, n_cycles):
+        """ Add n_cycles more cycles with the same values as the last one. """
+        if len(self) == 0:
+            raise PyrtlError('error, cannot repeat the last step of an empty trace')
+        self.trace.repeat_last(n_cycles)
+
+    def assertion_failed(self, wire, exception):
+        """ Called by check_rtl_assertions right before exception is raised. """
+        pass
+
+    def truncate(self, length):
+        """ Drop the cycles after the first length cycles of the trace. """
+        for tracelist in self.trace.values():
+            while len(tracelist) > length:
+                tracelist.pop()
+
     def print_trace(self, file=sys.stdout):
         if len(self.trace) == 0:
             raise PyrtlError('error, cannot print an empty trace')
@@ -818,12 +3977,14 @@ class SimulationTrace(object):
         print(' '.join(['$timescale', '1ns', '$end']), file=file)
         print(' '.join(['$scope', 'module logic', '$end']), file=file)
 
+        sorted_names = sorted(self.trace, key=_trace_sort_key)
+
         def print_trace_strs(time):
-            for wn in sorted(self.trace, key=_trace_sort_key):
+            for wn in sorted_names:
                 print(' '.join([str(bin(self.trace[wn][time]))[1:], _varname(wn)]), file=file)
 
         # dump variables
-        for wn in sorted(self.trace, key=_trace_sort_key):
+        for wn in sorted_names:
             print(' '.join(['$var', 'wire', str(self._wires[wn].bitwidth),
                             _varname(wn), _varname(wn), '$end']), file=file)
         print(' '.join(['$upscope', '$end']), file=file)
@@ -834,10 +3995,11 @@ class SimulationTrace(object):
 
         # dump values
         endtime = max([len(self.trace[w]) for w in self.trace])
+        start = self.start_cycle
         for timestamp in range(endtime):
-            print(''.join(['#', str(timestamp)]), file=file)
+            print(''.join(['#', str(start + timestamp)]), file=file)
             print_trace_strs(timestamp)
-        print(''.join(['#', str(endtime)]), file=file)
+        print(''.join(['#', str(start + endtime)]), file=file)
         file.flush()
 
     def render_trace(
@@ -919,3 +4081,222 @@ class SimulationTrace(object):
             print(formatted_trace_line(w, self.trace[w]), file=file)
         if extra_line:
             print(file=file)
+
+
+class RingBufferTrace(SimulationTrace):
+    """ A SimulationTrace keeping only a window of the most recent cycles.
+
+    Only the last capacity cycles are stored, so the memory used does not
+    grow with the length of the simulation.  If a trigger wire is given,
+    recording stops post_trigger cycles after the first cycle in which the
+    trigger is nonzero, leaving a window of the cycles around the trigger
+    (build any more complex trigger condition as logic driving that wire).
+    If a dump_file is given, the window is written to it as a VCD when an
+    rtl_assert fails.  The trace can be printed and rendered like any other
+    SimulationTrace; start_cycle gives the cycle its first entry is from.
+    """
+
+    def __init__(self, capacity, wires_to_track=None, block=None, trigger=None,
+                 post_trigger=0, dump_file=None):
+        """
+        Creates a new Ring Buffer Trace
+
+        :param capacity: the number of cycles kept
+        :param wires_to_track: The wires that the tracer should track
+        :param block: the block being simulated, defaults to the working block
+        :param trigger: a traced wire (or its name) starting the end of the recording
+        :param post_trigger: the number of cycles recorded after the trigger cycle
+        :param dump_file: an open file to which the window is written as a VCD
+          when an assertion fails
+        """
+        if not isinstance(capacity, numbers.Integral) or capacity < 1:
+            raise PyrtlError('capacity must be a positive integer')
+        if not 0 <= post_trigger < capacity:
+            raise PyrtlError('post_trigger must be at least 0 and less than capacity')
+        super(RingBufferTrace, self).__init__(wires_to_track, block)
+        self.trace = _RingTraceStorage(self.wires_to_track, capacity)
+        self.capacity = capacity
+        self.cycles = 0  # the number of cycles simulated so far
+        if trigger is not None:
+            trigger = getattr(trigger, 'name', trigger)
+            if trigger not in self.trace:
+                raise PyrtlError('the trigger wire "%s" is not traced' % trigger)
+        self.trigger = trigger
+        self.post_trigger = post_trigger
+        self.trigger_cycle = None
+        self.dump_file = dump_file
+
+    @property
+    def start_cycle(self):
+        """ The cycle the first entry of the trace is from. """
+        return self.cycles - len(self)
+
+    @property
+    def recording(self):
+        """ False once the window around the trigger has been recorded. """
+        return self.trigger_cycle is None or self.cycles <= self.trigger_cycle + self.post_trigger
+
+    def _cycle_added(self):
+        self.cycles += 1
+        if self.trigger is not None and self.trigger_cycle is None and self.trace[self.trigger][-1]:
+            self.trigger_cycle = self.cycles - 1
+
+    def add_step(self, value_map):
+        """ Add the values in value_map to the end of the trace. """
+        if self.recording:
+            super(RingBufferTrace, self).add_step(value_map)
+            self._cycle_added()
+
+    def add_fast_step(self, fastsim):
+        """ Add the fastsim context to the trace. """
+        if self.recording:
+            super(RingBufferTrace, self).add_fast_step(fastsim)
+            self._cycle_added()
+
+    def add_steps(self, value_lists):
+        """ Add several cycles at once, given as a map from wire names to lists of values. """
+        columns = [(self.trace[name], value_lists[name]) for name in self.trace]
+        for cycle in range(len(columns[0][1]) if columns else 0):
+            if not self.recording:
+                break
+            for tracelist, values in columns:
+                tracelist.append(values[cycle])
+            self._cycle_added()
+
+    def repeat_last_step(self, n_cycles):
+        """ Add n_cycles more cycles with the same values as the last one. """
+        if self.trigger_cycle is not None:  # stop where the recording ends
+            end = self.trigger_cycle + self.post_trigger + 1
+            n_cycles = max(min(n_cycles, end - self.cycles), 0)
+        if n_cycles:
+            super(RingBufferTrace, self).repeat_last_step(n_cycles)
+            self.cycles += n_cycles
+
+    def truncate(self, length):
+        """ Drop the cycles after the first length cycles of the window. """
+        dropped = max(len(self) - length, 0)
+        super(RingBufferTrace, self).truncate(length)
+        self.cycles -= dropped
+        if self.trigger_cycle is not None and self.trigger_cycle >= self.cycles:
+            self.trigger_cycle = None
+
+    def assertion_failed(self, wire, exception):
+        """ Write the window to dump_file (if any) as the assertion fires. """
+        if self.dump_file is not None:
+            self.print_vcd(self.dump_file)
+
+
+class StreamingVcdTrace(object):
+    """ A tracer writing a VCD file as the simulation runs.
+
+    Instead of keeping the waveforms in memory (as SimulationTrace does)
+    each cycle is written out as it is simulated, listing only the wires
+    whose value changed since the previous cycle.  The only state kept is
+    the last value of each wire plus the text of the cycles not yet
+    written, which is written out every buffer_cycles cycles.  It can be
+    passed as the tracer of Simulation or FastSimulation in place of a
+    SimulationTrace; call close() once the simulation is done.
+    """
+
+    def __init__(self, file, wires_to_track=None, block=None, buffer_cycles=1024):
+        """
+        Creates a new Streaming VCD Trace
+
+        :param file: the open file to write the VCD to
+        :param wires_to_track: The wires that the tracer should track (see SimulationTrace)
+        :param block: the block being simulated, defaults to the working block
+        :param buffer_cycles: the number of cycles buffered before writing them to file
+        """
+        self.block = working_block(block)
+        if wires_to_track is None:
+            wires_to_track = SimulationTrace(block=self.block).wires_to_track
+        elif wires_to_track == 'all':
+            wires_to_track = self.block.wirevector_set
+        if len(wires_to_track) == 0:
+            raise PyrtlError('error, simulation trace needs at least 1 signal to track')
+        self.wires_to_track = sorted(wires_to_track, key=lambda w: _trace_sort_key(w.name))
+        self.file = file
+        self.buffer_cycles = buffer_cycles
+        self.cycles = 0
+        self._buffer = []
+        self._prior = None  # the values of the wires in the last cycle
+        self._closed = False
+
+        internal_names = _VerilogSanitizer('_vcd_tmp_')
+        for wire in self.wires_to_track:
+            internal_names.make_valid_string(wire.name)
+        self._varnames = [internal_names[wire.name] for wire in self.wires_to_track]
+
+    def __len__(self):
+        """ Return the number of cycles traced so far. """
+        return self.cycles
+
+    def add_step(self, value_map):
+        """ Add the values in value_map (a map from WireVectors) as the next cycle. """
+        self._add_values([value_map[wire] for wire in self.wires_to_track])
+
+    def add_fast_step(self, fastsim):
+        """ Add the fastsim context as the next cycle. """
+        context = fastsim.context
+        self._add_values([context[wire.name] for wire in self.wires_to_track])
+
+    def add_steps(self, value_lists):
+        """ Add several cycles at once, given as a map from wire names to lists of values. """
+        columns = [value_lists[wire.name] for wire in self.wires_to_track]
+        for values in zip(*columns):
+            self._add_values(values)
+
+    def repeat_last_step(self, n_cycles):
+        """ Add n_cycles more cycles with the same values as the last one. """
+        if self._closed:
+            raise PyrtlError('error, cannot add cycles to a closed trace')
+        if self._prior is None:
+            raise PyrtlError('error, cannot repeat the last step of an empty trace')
+        self.cycles += n_cycles  # nothing changes, so nothing is written
+
+    def _add_values(self, values):
+        if self._closed:
+            raise PyrtlError('error, cannot add cycles to a closed trace')
+        buf = self._buffer
+        if self._prior is None:
+            self._write_header(values)
+        buf.append('#%d\n' % self.cycles)
+        for varname, value, prior in zip(self._varnames, values, self._prior):
+            if value != prior:
+                buf.append('b{0:b} {1}\n'.format(value, varname))
+        self._prior = values
+        self.cycles += 1
+        if self.cycles % self.buffer_cycles == 0:
+            self.flush()
+
+    def _write_header(self, values):
+        buf = self._buffer
+        buf.append('$timescale 1ns $end\n')
+        buf.append('$scope module logic $end\n')
+        for wire, varname in zip(self.wires_to_track, self._varnames):
+            buf.append('$var wire %d %s %s $end\n' % (wire.bitwidth, varname, varname))
+        buf.append('$upscope $end\n')
+        buf.append('$enddefinitions $end\n')
+        buf.append('$dumpvars\n')
+        for varname, value in zip(self._varnames, values):
+            buf.append('b{0:b} {1}\n'.format(value, varname))
+        buf.append('$end\n')
+        self._prior = values
+
+    def assertion_failed(self, wire, exception):
+        """ Make sure the cycles up to the failing assertion are in the file. """
+        self.flush()
+
+    def flush(self):
+        """ Write the buffered cycles to the file. """
+        self.file.write(''.join(self._buffer))
+        self.file.flush()
+        self._buffer = []
+
+    def close(self):
+        """ Write out the end of the trace (the file itself is not closed). """
+        if not self._closed:
+            if self._prior is not None:
+                self._buffer.append('#%d\n' % self.cycles)
+            self.flush()
+            self._closed = True
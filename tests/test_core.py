@@ -96,6 +96,66 @@ class TestBlock(unittest.TestCase):
             print(net)
 
 
+class TestBlockCaches(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.a, self.b = pyrtl.Input(4, 'a'), pyrtl.Input(4, 'b')
+        self.o = pyrtl.Output(name='o')
+        self.o <<= ~(self.a & self.b)
+        self.block = pyrtl.working_block()
+
+    def check_order(self):
+        seen = set(self.block.wirevector_subset((pyrtl.Input, pyrtl.Const, pyrtl.Register)))
+        nets = list(self.block)
+        self.assertEqual(set(nets), self.block.logic)
+        for net in nets:
+            self.assertTrue(all(arg in seen for arg in net.args))
+            seen.update(net.dests)
+        return nets
+
+    def test_order_is_cached(self):
+        self.assertEqual(self.check_order(), list(self.block))
+        self.assertIs(self.block._net_connections(), self.block._net_connections())
+
+    def test_add_net_invalidates(self):
+        self.check_order()
+        p = pyrtl.Output(name='p')
+        p <<= self.b + self.a
+        self.check_order()
+
+    def test_direct_logic_changes_invalidate(self):
+        self.check_order()
+        src_dict, dst_dict = self.block.net_connections()
+        not_net = src_dict[self.block.wirevector_by_name['o']]
+        self.block.logic.remove(not_net)
+        self.assertNotIn(not_net, list(self.block))
+        self.block.logic = self.block.logic | {not_net}
+        self.assertIn(not_net, list(self.block))
+        self.block.logic -= {not_net}
+        self.assertNotIn(not_net, list(self.block))
+
+    def test_wirevector_changes_invalidate(self):
+        src_dict, dst_dict = self.block.net_connections()
+        c = pyrtl.Input(4, 'c')
+        self.assertIn(c, self.block.net_connections(True)[0])
+        self.block.remove_wirevector(c)
+        self.assertNotIn(c, self.block.net_connections(True)[0])
+
+    def test_net_connections_returns_copies(self):
+        src_dict, dst_dict = self.block.net_connections()
+        del dst_dict[self.a][:]
+        del src_dict[self.o]
+        src_dict, dst_dict = self.block.net_connections()
+        self.assertEqual(len(dst_dict[self.a]), 1)
+        self.assertIn(self.o, src_dict)
+
+    def test_loops_are_still_found(self):
+        w = pyrtl.WireVector(4, 'w')
+        w <<= ~w
+        with self.assertRaises(pyrtl.PyrtlError):
+            list(self.block)
+
+
 class TestSetWorkingBlock(unittest.TestCase):
     def setUp(self):
         pyrtl.reset_working_block()
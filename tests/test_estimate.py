@@ -13,6 +13,37 @@ class TestAreaEstimate(unittest.TestCase):
         pyrtl.reset_working_block()
 
 
+class TestPowerEstimate(unittest.TestCase):
+
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+    def build_and_simulate(self, use_multiplier):
+        a, b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+        o = pyrtl.Output(name='o')
+        o <<= a * b if use_multiplier else a + b
+        sim = pyrtl.FastSimulation(count_toggles=True)
+        for cycle in range(20):
+            sim.step({a: (cycle * 37) % 256, b: (cycle * 91) % 256})
+        return sim.toggle_counts()
+
+    def test_scales_with_toggles(self):
+        self.build_and_simulate(use_multiplier=False)
+        no_toggles = pyrtl.analysis.power_estimation({})
+        toggles = {'o': 10}
+        energy = pyrtl.analysis.power_estimation(toggles)
+        self.assertEqual(no_toggles, 0)
+        self.assertGreater(energy, 0)
+        self.assertAlmostEqual(pyrtl.analysis.power_estimation({'o': 20}), 2 * energy)
+        self.assertLess(pyrtl.analysis.power_estimation(toggles, tech_in_nm=65), energy)
+
+    def test_multiplier_costs_more_than_adder(self):
+        adder = pyrtl.analysis.power_estimation(self.build_and_simulate(use_multiplier=False))
+        pyrtl.reset_working_block()
+        multiplier = pyrtl.analysis.power_estimation(self.build_and_simulate(use_multiplier=True))
+        self.assertGreater(multiplier, adder)
+
+
 class TestTimingEstimate(unittest.TestCase):
 
     def setUp(self):
@@ -362,6 +362,19 @@ class TestRtlAssert(unittest.TestCase):
         with self.assertRaises(self.RTLSampleException):
             sim.step({i: 0})
 
+    def test_assert_fastsimulation_many_assertions(self):
+        a = pyrtl.Input(4, 'a')
+        for bound in range(1, 9):
+            pyrtl.rtl_assert(a != bound, self.RTLSampleException('a is %d' % bound))
+
+        sim = pyrtl.FastSimulation()
+        sim.step({a: 0})
+        sim.step({a: 12})
+        with self.assertRaises(self.RTLSampleException) as cm:
+            sim.step({a: 6})
+        self.assertEqual(str(cm.exception), 'a is 6')
+        self.assertEqual(sim.inspect('a'), 6)
+
 
 class TestLoopDetection(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,64 @@
+from __future__ import print_function, unicode_literals, absolute_import
+
+import unittest
+import pyrtl
+from pyrtl.analysis import partition_block
+from pyrtl.analysis.partition import _region_block
+
+
+class TestPartitionBlock(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+    def region_of(self, regions, wire):
+        found = [r for r in regions if any(d is wire for net in r for d in net.dests)]
+        self.assertEqual(len(found), 1)
+        return found[0]
+
+    def test_registers_split_regions(self):
+        a = pyrtl.Input(4, 'a')
+        r1, r2 = pyrtl.Register(4, 'r1'), pyrtl.Register(4, 'r2')
+        r1.next <<= r1 + a
+        r2.next <<= r2 ^ r1
+        o = pyrtl.Output(name='o')
+        o <<= r2 & a
+        regions = partition_block()
+        self.assertEqual(sum(len(r) for r in regions), len(pyrtl.working_block().logic))
+        self.assertEqual(len(regions), 3)
+        self.assertEqual(len(set([self.region_of(regions, r1), self.region_of(regions, r2),
+                                  self.region_of(regions, o)])), 3)
+
+    def test_shared_logic_joins_regions(self):
+        a = pyrtl.Input(4, 'a')
+        r1, r2 = pyrtl.Register(4, 'r1'), pyrtl.Register(4, 'r2')
+        shared = r1 + r2
+        r1.next <<= shared
+        r2.next <<= shared + a
+        regions = partition_block()
+        self.assertEqual(len(regions), 1)
+
+    def test_memory_ports_join_regions(self):
+        a = pyrtl.Input(3, 'a')
+        r1, r2 = pyrtl.Register(4, 'r1'), pyrtl.Register(4, 'r2')
+        mem = pyrtl.MemBlock(4, 3, 'mem', asynchronous=True)
+        incremented = (r1 + 1)[:4]
+        mem[a] <<= incremented
+        r1.next <<= incremented
+        r2.next <<= mem[~a]
+        regions = partition_block()
+        self.assertIs(self.region_of(regions, r2), self.region_of(regions, r1))
+
+    def test_region_block(self):
+        a = pyrtl.Input(4, 'a')
+        r1, r2 = pyrtl.Register(4, 'r1'), pyrtl.Register(4, 'r2')
+        r1.next <<= r1 + a
+        r2.next <<= r2 ^ r1
+        region = _region_block(self.region_of(partition_block(), r2))
+        region.sanity_check()
+        self.assertIsInstance(region.wirevector_by_name['r1'], pyrtl.Input)
+        self.assertIsInstance(region.wirevector_by_name['r2'], pyrtl.Register)
+        self.assertNotIn('a', region.wirevector_by_name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,10 @@
 import unittest
+import random
 import io
+import pickle
+import os
+import shutil
+import tempfile
 
 import pyrtl
 from pyrtl.corecircuits import _basic_add
@@ -567,7 +572,7 @@ class InspectBase(unittest.TestCase):
         b <<= a
         sim_trace = pyrtl.SimulationTrace()
         sim = self.sim(tracer=sim_trace)
-        if self.sim is pyrtl.Simulation:
+        if issubclass(self.sim, pyrtl.Simulation):
             self.assertEqual(sim.inspect(a), 0)
             self.assertEqual(sim.inspect(b), 0)
         else:
@@ -591,6 +596,428 @@ class InspectBase(unittest.TestCase):
         self.assertEqual(sim.inspect_mem(mem), {23: 3})
 
 
+class CompactTraceBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.a = pyrtl.Input(8, 'a')
+        wide = pyrtl.Register(100, 'wide')
+        wide.next <<= pyrtl.concat(wide[:92], self.a)
+        o = pyrtl.Output(name='o')
+        o <<= self.a + 1
+
+    def run_trace(self, compact):
+        sim_trace = pyrtl.SimulationTrace(compact=compact)
+        sim = self.sim(tracer=sim_trace)
+        for i in range(20):
+            sim.step({self.a: (i * 37) % 256})
+        outputs = []
+        for output_func in (sim_trace.print_trace, sim_trace.print_vcd):
+            output = io.StringIO()
+            output_func(output)
+            outputs.append(output.getvalue())
+        output = io.StringIO()
+        sim_trace.render_trace(file=output, render_cls=pyrtl.simulation.AsciiWaveRenderer)
+        outputs.append(output.getvalue())
+        return sim_trace, outputs
+
+    def test_same_output_as_lists(self):
+        list_trace, list_outputs = self.run_trace(compact=False)
+        compact_trace, compact_outputs = self.run_trace(compact=True)
+        self.assertEqual(compact_outputs, list_outputs)
+        self.assertEqual(len(compact_trace), 20)
+        for name in list_trace.trace:
+            self.assertEqual(list(compact_trace.trace[name]), list_trace.trace[name])
+        self.assertEqual(compact_trace.trace['wide'][-1], list_trace.trace['wide'][-1])
+        self.assertEqual(compact_trace.trace['wide'][2:5], list_trace.trace['wide'][2:5])
+
+
+def vcd_values(vcd):
+    """ Return the value of every variable at every timestamp of a vcd string. """
+    values, cycles = {}, []
+    for line in vcd.splitlines():
+        if line.startswith('#'):
+            cycles.append(dict(values))
+        elif line.startswith('b'):
+            value, var = line.split()
+            values[var] = int(value[1:], 2)
+    return cycles
+
+
+class StreamingVcdTraceBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.a = pyrtl.Input(4, 'a')
+        r = pyrtl.Register(8, 'r')
+        r.next <<= r + self.a
+        o = pyrtl.Output(name='o')
+        o <<= self.a == 3
+
+    def test_matches_print_vcd(self):
+        stimulus = [0, 0, 3, 3, 1, 0, 0, 0, 2, 3, 3]
+        sim_trace = pyrtl.SimulationTrace()
+        sim = self.sim(tracer=sim_trace)
+        for value in stimulus:
+            sim.step({self.a: value})
+        expected = io.StringIO()
+        sim_trace.print_vcd(expected)
+
+        pyrtl.reset_working_block()
+        self.setUp()
+        output = io.StringIO()
+        vcd_trace = pyrtl.StreamingVcdTrace(output, buffer_cycles=4)
+        sim = self.sim(tracer=vcd_trace)
+        for cycle, value in enumerate(stimulus):
+            sim.step({self.a: value})
+            # only whole blocks of cycles have been written
+            self.assertEqual(output.getvalue().count('\n#'), (cycle + 1) // 4 * 4)
+        vcd_trace.close()
+        self.assertEqual(len(vcd_trace), len(stimulus))
+        self.assertEqual(vcd_values(output.getvalue()), vcd_values(expected.getvalue()))
+        # unchanged values are not repeated
+        self.assertLess(output.getvalue().count('\nb'), expected.getvalue().count('\nb'))
+
+
+class RingBufferTraceBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.a = pyrtl.Input(4, 'a')
+        count = pyrtl.Register(8, 'count')
+        count.next <<= count + 1
+        self.hit = pyrtl.WireVector(1, 'hit')
+        self.hit <<= self.a == 9
+
+    def test_keeps_last_cycles(self):
+        sim_trace = pyrtl.RingBufferTrace(4)
+        sim = self.sim(tracer=sim_trace)
+        for cycle in range(10):
+            sim.step({self.a: cycle})
+        self.assertEqual(len(sim_trace), 4)
+        self.assertEqual(sim_trace.start_cycle, 6)
+        self.assertEqual(list(sim_trace.trace['count']), [6, 7, 8, 9])
+        output = io.StringIO()
+        sim_trace.print_trace(output)
+        self.assertEqual(output.getvalue(), '    a 6789\ncount 6789\n  hit 0001\n')
+
+    def test_trigger_window(self):
+        sim_trace = pyrtl.RingBufferTrace(5, trigger='hit', post_trigger=2)
+        sim = self.sim(tracer=sim_trace)
+        for cycle in range(30):
+            sim.step({self.a: cycle % 16})
+        self.assertEqual(sim_trace.trigger_cycle, 9)
+        self.assertFalse(sim_trace.recording)
+        self.assertEqual(list(sim_trace.trace['count']), [7, 8, 9, 10, 11])
+
+    def test_dump_on_assertion(self):
+        pyrtl.rtl_assert(~self.hit, ValueError('a is 9'))
+        output = io.StringIO()
+        sim_trace = pyrtl.RingBufferTrace(3, dump_file=output)
+        sim = self.sim(tracer=sim_trace)
+        with self.assertRaises(ValueError):
+            for cycle in range(20):
+                sim.step({self.a: cycle})
+        self.assertEqual(vcd_values(output.getvalue())[-1]['count'], 9)
+        self.assertEqual(len(vcd_values(output.getvalue())), 4)
+        timestamps = [line for line in output.getvalue().splitlines() if line.startswith('#')]
+        self.assertEqual(timestamps, ['#7', '#8', '#9', '#10'])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.RingBufferTrace(0)
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.RingBufferTrace(3, trigger='hit', post_trigger=3)
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.RingBufferTrace(3, trigger='not_a_wire')
+
+
+class SnapshotBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.a = pyrtl.Input(4, 'a')
+        acc = pyrtl.Register(8, 'acc')
+        acc.next <<= acc + self.a
+        self.mem = pyrtl.MemBlock(8, 4, 'mem', asynchronous=True)
+        self.mem[self.a] <<= acc
+        o = pyrtl.Output(name='o')
+        o <<= self.mem[~self.a] ^ acc
+
+    def steps(self, sim, values):
+        for value in values:
+            sim.step({self.a: value})
+        output = io.StringIO()
+        sim.tracer.print_trace(output)
+        return output.getvalue()
+
+    def test_fork_from_snapshot(self):
+        sim = self.sim()
+        self.steps(sim, [3, 7, 1, 12, 5])
+        snapshot = pickle.loads(pickle.dumps(sim.snapshot()))
+        first = self.steps(sim, [2, 9, 9, 4])
+        mem_after = dict(sim.inspect_mem(self.mem))
+        self.steps(sim, [15, 15, 0])
+        sim.restore(snapshot)
+        self.assertEqual(sim.inspect('o'), snapshot.values['o'])
+        self.assertEqual(len(sim.tracer), 5)
+        self.assertEqual(self.steps(sim, [2, 9, 9, 4]), first)
+        self.assertEqual(sim.inspect_mem(self.mem), mem_after)
+
+    def test_restore_into_new_simulation(self):
+        sim = self.sim()
+        self.steps(sim, [3, 7, 1])
+        snapshot = sim.snapshot()
+        self.steps(sim, [8, 6])
+        fresh = self.sim()
+        fresh.restore(snapshot)
+        self.steps(fresh, [8, 6])
+        for name in ('acc', 'o'):
+            self.assertEqual(list(fresh.tracer.trace[name]), sim.tracer.trace[name][-2:])
+
+
+class DenseMemoryBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        random.seed(271828)
+        self.a, self.we = pyrtl.Input(4, 'a'), pyrtl.Input(1, 'we')
+        acc = pyrtl.Register(8, 'acc')
+        acc.next <<= acc + self.a
+        self.mem = pyrtl.MemBlock(8, 4, 'mem', asynchronous=True)
+        self.mem[self.a] <<= pyrtl.MemBlock.EnabledWrite(acc, self.we)
+        self.big = pyrtl.MemBlock(8, 12, 'big', asynchronous=True)
+        self.big[pyrtl.concat(self.a, self.a, self.a)] <<= acc
+        rom = pyrtl.RomBlock(8, 4, lambda addr: (addr * 37) % 256)
+        o, p = pyrtl.Output(name='o'), pyrtl.Output(name='p')
+        o <<= self.mem[~self.a] ^ rom[self.a]
+        p <<= self.big[pyrtl.concat(~self.a, self.a, self.a)]
+
+    def run_sim(self, sim, cycles=40):
+        for cycle in range(cycles):
+            sim.step({self.a: random.randrange(16), self.we: random.randrange(2)})
+
+    def test_matches_sparse_memories(self):
+        dense = self.sim(memory_value_map={self.mem: {3: 9}}, dense_mem_addrwidth=8)
+        sparse = self.sim(memory_value_map={self.mem: {3: 9}})
+        random.seed(5)
+        self.run_sim(dense)
+        random.seed(5)
+        self.run_sim(sparse)
+        self.assertEqual(dense.tracer.trace, sparse.tracer.trace)
+        self.assertEqual(dict(dense.inspect_mem(self.mem)),
+                         {addr: val for addr, val in sparse.inspect_mem(self.mem).items() if val})
+        self.assertEqual(dense.inspect_mem(self.big), sparse.inspect_mem(self.big))
+        self.assertIsInstance(sparse.inspect_mem(self.mem), dict)
+        self.assertIsInstance(dense.inspect_mem(self.big), dict)  # too big to be dense
+
+    def test_mapping_view(self):
+        sim = self.sim(memory_value_map={self.mem: {3: 9, 5: 0}}, dense_mem_addrwidth=8)
+        mem = sim.inspect_mem(self.mem)
+        self.assertEqual(len(mem), 1)
+        self.assertEqual(list(mem), [3])
+        self.assertEqual(sorted(mem.items()), [(3, 9)])
+        self.assertIn(3, mem)
+        self.assertNotIn(5, mem)
+        self.assertNotIn(16, mem)
+        self.assertEqual(mem[5], 0)
+        self.assertEqual(mem.get(16, 7), 7)
+
+    def test_snapshot_restore(self):
+        sim = self.sim(dense_mem_addrwidth=4)
+        self.run_sim(sim, 10)
+        snapshot = sim.snapshot()
+        state = random.getstate()
+        self.run_sim(sim, 10)
+        expected = dict(sim.inspect_mem(self.mem)), sim.tracer.trace['o'][-10:]
+        sim.restore(snapshot)
+        random.setstate(state)
+        self.run_sim(sim, 10)
+        self.assertEqual((dict(sim.inspect_mem(self.mem)), sim.tracer.trace['o'][-10:]),
+                         expected)
+
+    def test_invalid_rom_data_raises_when_read(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(2, 'a')
+        rom = pyrtl.RomBlock(4, 2, [1, 2, 3])
+        o = pyrtl.Output(name='o')
+        o <<= rom[a]
+        sim = self.sim(dense_mem_addrwidth=4)
+        sim.step({a: 2})
+        self.assertEqual(sim.inspect('o'), 3)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({a: 3})
+
+
+class BindInputsBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.a, self.b = pyrtl.Input(4, 'a'), pyrtl.Input(2, 'b')
+        acc = pyrtl.Register(8, 'acc')
+        acc.next <<= acc + self.a * self.b
+        o = pyrtl.Output(name='o')
+        o <<= acc ^ self.a
+
+    def test_matches_step(self):
+        values = [(3, 1), (15, 3), (0, 2), (7, 0), (9, 3)]
+        stepped = self.sim()
+        for a, b in values:
+            stepped.step({self.a: a, self.b: b})
+        for validate in (True, False):
+            bound = self.sim()
+            step = bound.bind_inputs(['b', self.a], validate=validate)
+            for a, b in values:
+                step(b, a)
+            self.assertEqual(bound.tracer.trace, stepped.tracer.trace)
+            self.assertEqual(bound.inspect('o'), stepped.inspect('o'))
+
+    def test_bad_ports(self):
+        sim = self.sim()
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.bind_inputs([self.a])
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.bind_inputs([self.a, self.b, self.a])
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.bind_inputs([self.a, self.b, 'o'])
+
+    def test_bad_values(self):
+        step = self.sim().bind_inputs([self.a, self.b])
+        with self.assertRaises(pyrtl.PyrtlError):
+            step(16, 0)
+        with self.assertRaises(pyrtl.PyrtlError):
+            step(1, -1)
+        with self.assertRaises(pyrtl.PyrtlError):
+            step(1)
+
+
+class ProfileBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        pyrtl.set_debug_mode()
+        self.a = pyrtl.Input(4, 'a')
+        acc = pyrtl.Register(8, 'acc')
+        total = acc + self.a
+        acc.next <<= total
+        o = pyrtl.Output(name='o')
+        o <<= total[:4] * self.a
+        pyrtl.set_debug_mode(False)
+
+    def tearDown(self):
+        pyrtl.set_debug_mode(False)
+
+    def test_profile(self):
+        sim = self.sim(profile=True)
+        for cycle in range(10):
+            sim.step({self.a: cycle})
+        stats = sim.profile.stats()
+        self.assertEqual(stats['op']['+']['count'], 10)
+        self.assertEqual(stats['op']['*']['count'], 10)
+        self.assertEqual(stats['wire']['o']['count'], 10)
+        self.assertGreater(sum(entry['time'] for entry in stats['op'].values()), 0)
+        sites = [site for site in stats['site'] if site.startswith(__file__.rstrip('c'))]
+        self.assertGreaterEqual(len(sites), 2)
+
+        output = io.StringIO()
+        sim.profile.report(by='wire', limit=2, file=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('wire'))
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.profile.report(by='nothing')
+
+        sim.profile.reset()
+        sim.step({self.a: 1})
+        self.assertEqual(sim.profile.stats()['op']['+']['count'], 1)
+
+    def test_no_profile(self):
+        sim = self.sim()
+        sim.step({self.a: 1})
+        self.assertIsNone(sim.profile)
+
+
+class ToggleCountBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.a = pyrtl.Input(4, 'a')
+        r = pyrtl.Register(4, 'r')
+        r.next <<= self.a
+        o = pyrtl.Output(name='o')
+        o <<= r ^ self.a
+
+    def test_toggle_counts(self):
+        sim = self.sim(count_toggles=True)
+        for value in (0b0011, 0b0011, 0b0101, 0b1111):
+            sim.step({self.a: value})
+        toggles = sim.toggle_counts()
+        self.assertEqual(toggles['a'], 2 + 0 + 2 + 2)
+        self.assertEqual(toggles['r'], 0 + 2 + 0 + 2)  # r is a, a cycle late
+        self.assertEqual(toggles['o'], 2 + 2 + 2 + 2)  # 0011, 0000, 0110, 1010
+        self.assertNotIn('const', ' '.join(toggles))
+
+    def test_not_counting(self):
+        sim = self.sim()
+        sim.step({self.a: 1})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.toggle_counts()
+
+
+class StepRepeatBase(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.en = pyrtl.Input(1, 'en')
+        count = pyrtl.Register(4, 'count')
+        count.next <<= pyrtl.select(self.en & (count != 5), count + 1, count)
+        self.mem = pyrtl.MemBlock(4, 2, name='mem')
+        self.mem[count[:2]] <<= pyrtl.MemBlock.EnabledWrite(count, self.en)
+        o = pyrtl.Output(4, 'o')
+        o <<= self.mem[0] + count
+
+    def run_sim(self, tracer, repeat):
+        sim = self.sim(tracer=tracer)
+        skipped = 0
+        for en, cycles in ((1, 20), (0, 3), (1, 4)):
+            if repeat:
+                skipped += sim.step_repeat({self.en: en}, cycles)
+            else:
+                for _ in range(cycles):
+                    sim.step({self.en: en})
+        return sim, skipped
+
+    def test_same_trace_as_stepping(self):
+        step_sim, _ = self.run_sim(pyrtl.SimulationTrace(), repeat=False)
+        repeat_sim, skipped = self.run_sim(pyrtl.SimulationTrace(), repeat=True)
+        # count saturates at 5 in cycle 5, with its write repeating from cycle 6
+        self.assertEqual(skipped, (20 - 7) + (3 - 1) + (4 - 2))
+        self.assertEqual(len(repeat_sim.tracer), 27)
+        for name, values in step_sim.tracer.trace.items():
+            self.assertEqual(repeat_sim.tracer.trace[name], values)
+        self.assertEqual(repeat_sim.inspect_mem(self.mem), step_sim.inspect_mem(self.mem))
+
+    def test_run_length_trace(self):
+        sim_trace = pyrtl.SimulationTrace(run_length=True)
+        sim, skipped = self.run_sim(sim_trace, repeat=True)
+        self.assertEqual(sim_trace.trace['count'].runs(),
+                         [(0, 1), (1, 1), (2, 1), (3, 1), (4, 1), (5, 22)])
+        self.assertEqual(list(sim_trace.trace['en']), [1] * 20 + [0] * 3 + [1] * 4)
+        self.assertEqual(sim_trace.trace['count'][-1], 5)
+        self.assertEqual(len(sim_trace), 27)
+        sim_trace.truncate(6)
+        self.assertEqual(sim_trace.trace['count'].runs(), [(i, 1) for i in range(6)])
+        self.assertEqual(sim_trace.trace['count'][2:4], [2, 3])
+
+    def test_ring_buffer_trace(self):
+        sim, skipped = self.run_sim(pyrtl.RingBufferTrace(4), repeat=True)
+        self.assertEqual(sim.tracer.cycles, 27)
+        self.assertEqual(list(sim.tracer.trace['en']), [1, 1, 1, 1])
+
+    def test_streaming_vcd_trace(self):
+        step_output, repeat_output = io.StringIO(), io.StringIO()
+        for output, repeat in ((step_output, False), (repeat_output, True)):
+            vcd_trace = pyrtl.StreamingVcdTrace(output)
+            self.run_sim(vcd_trace, repeat)
+            vcd_trace.close()
+            self.assertEqual(len(vcd_trace), 27)
+        # the skipped cycles only leave out timestamps in which nothing changed
+        self.assertEqual(vcd_values(repeat_output.getvalue())[-1],
+                         vcd_values(step_output.getvalue())[-1])
+        self.assertLess(len(repeat_output.getvalue()), len(step_output.getvalue()))
+
+
 class TraceErrorBase(unittest.TestCase):
     def setUp(self):
         pyrtl.reset_working_block()
@@ -625,9 +1052,1071 @@ def make_unittests():
             unittests[unit_name] = type(unit_name, (v,), {'sim': sim})
     g.update(unittests)
 
-sims = (pyrtl.Simulation, pyrtl.FastSimulation)
+sims = (pyrtl.Simulation, pyrtl.EventDrivenSimulation, pyrtl.FastSimulation)
 make_unittests()
 
 
+# The following tests cover features that only exist in one of the simulators,
+# so they are defined after make_unittests has run.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'batched simulation requires numpy')
+class TestFastSimulationLanes(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        random.seed(7913)
+
+    def check_against_scalar(self, inputs, cycles=6, lanes=5, vectorized=True):
+        stimulus = [{w: [random.randrange(2**len(w)) for lane in range(lanes)]
+                     for w in inputs} for cycle in range(cycles)]
+        batched = pyrtl.FastSimulation(lanes=lanes)
+        self.assertEqual(batched._vectorized, vectorized)
+        scalars = [pyrtl.FastSimulation() for lane in range(lanes)]
+        for cycle_inputs in stimulus:
+            batched.step(cycle_inputs)
+            for lane, sim in enumerate(scalars):
+                sim.step({w: vals[lane] for w, vals in cycle_inputs.items()})
+            for w in pyrtl.working_block().wirevector_subset((pyrtl.Output, pyrtl.Register)):
+                self.assertEqual(list(batched.inspect(w.name)),
+                                 [sim.inspect(w.name) for sim in scalars])
+        return batched, scalars
+
+    def test_arithmetic_and_muxes(self):
+        a, b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+        sel = pyrtl.Input(1, 'sel')
+        r = pyrtl.Register(8, 'r')
+        r.next <<= r + a
+        outs = [pyrtl.Output(name='o%d' % i) for i in range(6)]
+        outs[0] <<= a + b
+        outs[1] <<= a - b
+        outs[2] <<= a * b
+        outs[3] <<= pyrtl.concat(a < b, a > b, a == b, ~a)
+        outs[4] <<= pyrtl.select(sel, a ^ b, a.nand(b))
+        outs[5] <<= pyrtl.concat(r[2:5], pyrtl.Const(3, 2), b[0])
+        self.check_against_scalar([a, b, sel])
+
+    def test_rtllib_adder(self):
+        from pyrtl.rtllib import adders
+        a, b = pyrtl.Input(16, 'a'), pyrtl.Input(16, 'b')
+        s = pyrtl.Output(name='s')
+        s <<= adders.kogge_stone(a, b)
+        batched, scalars = self.check_against_scalar([a, b], lanes=40)
+        self.assertEqual(len(batched.tracer.trace['s']), 6)
+
+    def test_memories(self):
+        addr, data = pyrtl.Input(3, 'addr'), pyrtl.Input(4, 'data')
+        we = pyrtl.Input(1, 'we')
+        mem = pyrtl.MemBlock(4, 3, 'mem', asynchronous=True)
+        rom = pyrtl.RomBlock(4, 3, [3, 1, 4, 1, 5, 9, 2, 6])
+        mem[addr] <<= pyrtl.MemBlock.EnabledWrite(data, we)
+        o1, o2 = pyrtl.Output(name='o1'), pyrtl.Output(name='o2')
+        o1 <<= mem[~addr]
+        o2 <<= rom[addr]
+        batched, scalars = self.check_against_scalar([addr, data, we], cycles=20)
+        # the dense lane storage does not report addresses holding the default value
+        self.assertEqual(batched.inspect_mem(mem),
+                         [{addr: val for addr, val in sim.inspect_mem(mem).items() if val}
+                          for sim in scalars])
+
+    def test_wide_wires_fall_back_to_scalar(self):
+        a, b = pyrtl.Input(70, 'a'), pyrtl.Input(70, 'b')
+        o = pyrtl.Output(name='o')
+        o <<= a + b
+        self.check_against_scalar([a, b], vectorized=False)
+
+    def test_shared_scalar_input(self):
+        a, b = pyrtl.Input(4, 'a'), pyrtl.Input(4, 'b')
+        o = pyrtl.Output(name='o')
+        o <<= a & b
+        sim = pyrtl.FastSimulation(lanes=3)
+        sim.step({a: [1, 2, 3], b: 3})
+        self.assertEqual(list(sim.inspect('o')), [1, 2, 3])
+
+    def test_invalid_lane_inputs(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(name='o')
+        o <<= a
+        sim = pyrtl.FastSimulation(lanes=3)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({a: [1, 2]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({a: [1, 2, 16]})
+
+    def test_assertion_in_one_lane(self):
+        a = pyrtl.Input(4, 'a')
+        pyrtl.rtl_assert(a != 5, ValueError('a is 5'))
+        sim = pyrtl.FastSimulation(lanes=3)
+        sim.step({a: [1, 2, 3]})
+        with self.assertRaises(ValueError):
+            sim.step({a: [1, 5, 3]})
+
+    def test_snapshot(self):
+        a = pyrtl.Input(3, 'a')
+        r = pyrtl.Register(8, 'r')
+        mem = pyrtl.MemBlock(8, 3, 'mem', asynchronous=True)
+        r.next <<= r + a
+        mem[a] <<= r
+        o = pyrtl.Output(name='o')
+        o <<= mem[~a]
+        sim = pyrtl.FastSimulation(lanes=4)
+        sim.step({a: [1, 2, 3, 4]})
+        snapshot = sim.snapshot()
+        sim.step({a: [5, 6, 7, 0]})
+        first = (list(sim.inspect('o')), sim.inspect_mem(mem))
+        sim.restore(snapshot)
+        sim.step({a: [5, 6, 7, 0]})
+        self.assertEqual((list(sim.inspect('o')), sim.inspect_mem(mem)), first)
+
+
+class TestFastSimulationRun(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        random.seed(3301)
+
+    def build_counter(self):
+        a, we = pyrtl.Input(4, 'a'), pyrtl.Input(1, 'we')
+        r = pyrtl.Register(6, 'r')
+        mem = pyrtl.MemBlock(6, 4, 'mem', asynchronous=True)
+        r.next <<= r + a
+        mem[a] <<= pyrtl.MemBlock.EnabledWrite(r, we)
+        o, m = pyrtl.Output(name='o'), pyrtl.Output(name='m')
+        mid = pyrtl.WireVector(6, 'mid')
+        mid <<= r ^ a
+        o <<= mid
+        m <<= mem[~a]
+        return a, we, mem
+
+    def test_run_matches_step(self):
+        a, we, mem = self.build_counter()
+        stimulus = {a: [random.randrange(16) for i in range(50)],
+                    we: [random.randrange(2) for i in range(50)]}
+        step_sim = pyrtl.FastSimulation()
+        for cycle in range(50):
+            step_sim.step({w: vals[cycle] for w, vals in stimulus.items()})
+        run_sim = pyrtl.FastSimulation()
+        self.assertEqual(run_sim.run(20, {w: vals[:20] for w, vals in stimulus.items()}), 20)
+        self.assertEqual(run_sim.run(30, {w: vals[20:] for w, vals in stimulus.items()}), 30)
+        self.assertEqual(run_sim.tracer.trace, step_sim.tracer.trace)
+        self.assertEqual(run_sim.inspect_mem(mem), step_sim.inspect_mem(mem))
+        for name in ('a', 'r', 'o', 'm', 'mid'):
+            self.assertEqual(run_sim.inspect(name), step_sim.inspect(name))
+
+    def test_run_until_inputs_are_exhausted(self):
+        a, we, mem = self.build_counter()
+        sim = pyrtl.FastSimulation()
+        sim._run_block_cycles = 7
+        values = (i % 16 for i in range(30))
+        self.assertEqual(sim.run(inputs={'a': values, 'we': [1] * 40}), 30)
+        self.assertEqual(len(sim.tracer), 30)
+        self.assertEqual(sim.inspect('r'), sum(i % 16 for i in range(29)) % 64)
+
+    def test_run_input_errors(self):
+        a, we, mem = self.build_counter()
+        sim = pyrtl.FastSimulation()
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run(3, {a: [1, 2, 3]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run(3, {a: [1, 2, 3], we: [0, 2, 0]})
+        self.assertEqual(len(sim.tracer), 1)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run(5, {a: [1, 2, 3], we: [0, 0, 0]})
+
+    def test_run_streaming_vcd(self):
+        a, we, mem = self.build_counter()
+        stimulus = {a: [random.randrange(16) for i in range(30)], we: [1] * 30}
+        outputs = []
+        for use_run in (False, True):
+            output = io.StringIO()
+            sim = pyrtl.FastSimulation(tracer=pyrtl.StreamingVcdTrace(output))
+            if use_run:
+                sim.run(30, stimulus)
+            else:
+                for cycle in range(30):
+                    sim.step({w: vals[cycle] for w, vals in stimulus.items()})
+            sim.tracer.close()
+            outputs.append(output.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_run_assertion(self):
+        a = pyrtl.Input(4, 'a')
+        r = pyrtl.Register(4, 'r')
+        r.next <<= a
+        pyrtl.rtl_assert(r != 9, ValueError('r is 9'))
+        sim = pyrtl.FastSimulation()
+        with self.assertRaises(ValueError):
+            sim.run(10, {a: [1, 9, 2, 3, 4, 5, 6, 7, 8, 0]})
+        self.assertEqual(len(sim.tracer), 3)
+        self.assertEqual(sim.inspect('r'), 9)
+
+
+class TestFastSimulationMuxArms(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        random.seed(4099)
+        self.a, self.b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+        self.c = pyrtl.Input(2, 'c')
+        acc = pyrtl.Register(16, 'acc')
+        rom = pyrtl.RomBlock(8, 8, [(i * 7) % 256 for i in range(256)])
+        self.product = self.a * self.b
+        result = pyrtl.WireVector(16)
+        with pyrtl.conditional_assignment:
+            with self.c == 0:
+                result |= self.product + acc
+            with self.c == 1:
+                result |= (self.a + rom[self.b]) * (self.a - self.b)
+            with pyrtl.otherwise:
+                result |= self.a ^ self.b
+        acc.next <<= result
+        o = pyrtl.Output(16, 'o')
+        o <<= result
+
+    def stimulus(self, cycles):
+        return [{self.a: random.randrange(256), self.b: random.randrange(256),
+                 self.c: random.randrange(4)} for cycle in range(cycles)]
+
+    def test_same_trace_as_simulation(self):
+        stimulus = self.stimulus(100)
+        traces = []
+        for sim_class in (pyrtl.Simulation, pyrtl.FastSimulation):
+            sim = sim_class()
+            for inputs in stimulus:
+                sim.step(inputs)
+            traces.append(sim.tracer.trace)
+        run_sim = pyrtl.FastSimulation()
+        run_sim.run(inputs={w: [inputs[w] for inputs in stimulus] for w in stimulus[0]})
+        self.assertEqual(traces[1], traces[0])
+        self.assertEqual(run_sim.tracer.trace, traces[0])
+
+    def test_arm_cones(self):
+        sim = pyrtl.FastSimulation()
+        owners = sim._mux_arm_owners()
+        product_net = next(net for net in sim.block.logic if net.dests[0] is self.product)
+        mux, arm = owners[product_net]
+        self.assertEqual(mux.op, 'x')
+        self.assertGreater(len(owners), 10)
+        self.assertFalse(any(net.op in 'r@' for net in owners))
+
+    def test_reported_wires_are_always_evaluated(self):
+        self.product.name = 'product'
+        sim = pyrtl.FastSimulation()
+        for inputs in self.stimulus(20):
+            sim.step(inputs)
+            self.assertEqual(sim.inspect('product'), inputs[self.a] * inputs[self.b])
+        owners = sim._mux_arm_owners()
+        self.assertFalse(any(net.dests[0] is self.product for net in owners))
+        self.assertEqual(pyrtl.FastSimulation(profile=True)._mux_arm_owners(), {})
+        self.assertEqual(pyrtl.FastSimulation(count_toggles=True)._mux_arm_owners(), {})
+
+
+class TestFastSimulationChunks(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        random.seed(8191)
+        self.a, self.b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+        self.sel = pyrtl.Input(1, 'sel')
+        acc = pyrtl.Register(16, 'acc')
+        mem = pyrtl.MemBlock(8, 3, 'mem')
+        mem[self.a[:3]] <<= pyrtl.MemBlock.EnabledWrite(self.b, self.sel)
+        total = pyrtl.WireVector(16, 'total')
+        total <<= (self.a * self.b + acc)[:16]
+        acc.next <<= pyrtl.select(self.sel, total, acc ^ mem[self.b[:3]])
+        o = pyrtl.Output(16, 'o')
+        o <<= pyrtl.concat(self.a[4:] & self.b[:4], (self.a - self.b)[:8], self.sel)[:16]
+
+    def stimulus(self, cycles):
+        return [{self.a: random.randrange(256), self.b: random.randrange(256),
+                 self.sel: random.randrange(2)} for cycle in range(cycles)]
+
+    def test_same_trace_as_unchunked(self):
+        stimulus = self.stimulus(50)
+        traces = []
+        for kwargs in ({}, {'chunk_size': 3}, {'chunk_size': 1}):
+            sim = pyrtl.FastSimulation(**kwargs)
+            for inputs in stimulus:
+                sim.step(inputs)
+            run_sim = pyrtl.FastSimulation(**kwargs)
+            run_sim.run(inputs={w: [inputs[w] for inputs in stimulus] for w in stimulus[0]})
+            traces.append(sim.tracer.trace)
+            self.assertEqual(run_sim.tracer.trace, traces[0])
+        self.assertEqual(traces[1], traces[0])
+        self.assertEqual(traces[2], traces[0])
+
+    def test_code_file(self):
+        with tempfile.NamedTemporaryFile(mode='r', suffix='.py') as f:
+            pyrtl.FastSimulation(chunk_size=1, code_file=f.name)
+            code = f.read()
+        self.assertIn('def _fastsim_chunk_0(', code)
+        self.assertIn('def _fastsim_chunk_2(', code)
+
+    def test_unsupported_modes(self):
+        for kwargs in ({'chunk_size': 0}, {'chunk_size': 2.5},
+                       {'chunk_size': 3, 'profile': True},
+                       {'chunk_size': 3, 'count_toggles': True},
+                       {'chunk_size': 3, 'lanes': 4}):
+            with self.assertRaises(pyrtl.PyrtlError):
+                pyrtl.FastSimulation(**kwargs)
+
+
+class TestFastSimulationIncremental(unittest.TestCase):
+    def setUp(self):
+        random.seed(2027)
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def build_design(self, tweak=None, acc_width=8):
+        """ Three accumulators fed by separate logic, plus a memory; tweak changes one. """
+        pyrtl.reset_working_block()
+        a, b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+        for i in range(3):
+            acc = pyrtl.Register(acc_width if i == 2 else 8, 'acc%d' % i)
+            step = (a + i) * b if i != tweak else (a + i) * b + 1
+            acc.next <<= (acc + step)[:len(acc)]
+            o = pyrtl.Output(len(acc), 'o%d' % i)
+            o <<= acc
+        mem = pyrtl.MemBlock(8, 2, 'mem')
+        mem[a[:2]] <<= b
+        total = pyrtl.WireVector(8, 'total')
+        total <<= mem[b[:2]] ^ a
+        return a, b, mem
+
+    def stimulus(self, a, b, cycles):
+        return [{a: random.randrange(256), b: random.randrange(256)} for cycle in range(cycles)]
+
+    def test_same_trace_as_unincremental(self):
+        a, b, mem = self.build_design()
+        stimulus = self.stimulus(a, b, 30)
+        traces = []
+        for incremental in (False, True):
+            sim = pyrtl.FastSimulation(incremental=incremental)
+            for inputs in stimulus:
+                sim.step(inputs)
+            traces.append(sim.tracer.trace)
+        run_sim = pyrtl.FastSimulation(incremental=True)
+        run_sim.run(inputs={w: [inputs[w] for inputs in stimulus] for w in stimulus[0]})
+        self.assertEqual(traces[1], traces[0])
+        self.assertEqual(run_sim.tracer.trace, traces[0])
+
+    def test_rebuild_compiles_changed_regions(self):
+        a, b, mem = self.build_design()
+        sim = pyrtl.FastSimulation(incremental=True)
+        old_code = dict(sim._region_code)
+        a, b, mem = self.build_design(tweak=1)
+        sim.rebuild()
+        reused = [key for key, code in sim._region_code.items() if old_code.get(key) is code]
+        # the changed region can also move to the function of other small regions
+        self.assertIn(len(sim._region_code) - len(reused), (1, 2))
+        self.assertGreaterEqual(len(reused), 3)
+
+    def test_rebuild_keeps_state(self):
+        a, b, mem = self.build_design()
+        stimulus = self.stimulus(a, b, 10)
+        sim = pyrtl.FastSimulation(incremental=True)
+        for inputs in stimulus:
+            sim.step(inputs)
+        regs = dict(sim.regs)
+        contents = dict(sim.inspect_mem(mem))
+
+        a, b, mem = self.build_design(tweak=1, acc_width=10)
+        sim.rebuild()
+        self.assertEqual(sim.regs['acc0'], regs['acc0'])
+        self.assertEqual(sim.regs['acc1'], regs['acc1'])
+        self.assertEqual(sim.regs['acc2'], 0)  # its bitwidth changed
+        self.assertEqual(dict(sim.inspect_mem(mem)), contents)
+        sim.step({a: 3, b: 4})
+        self.assertEqual(sim.tracer.trace['acc1'], [regs['acc1']])
+        self.assertEqual(sim.regs['acc1'], (regs['acc1'] + 4 * 4 + 1) % 256)
+
+    def test_code_cache(self):
+        cache = pyrtl.SimulationCodeCache(self.cache_dir)
+        self.build_design()
+        cache_regions = pyrtl.FastSimulation(incremental=True, code_cache=cache)._region_code
+        self.assertEqual((cache.hits, cache.misses), (0, len(cache_regions)))
+        self.build_design(tweak=0)
+        n_regions = len(pyrtl.FastSimulation(incremental=True, code_cache=cache)._region_code)
+        self.assertIn(n_regions - cache.hits, (1, 2))
+        self.assertEqual(cache.hits + cache.misses, len(cache_regions) + n_regions)
+
+    def test_unsupported_modes(self):
+        self.build_design()
+        for kwargs in ({'chunk_size': 3}, {'profile': True}, {'count_toggles': True},
+                       {'lanes': 4}):
+            with self.assertRaises(pyrtl.PyrtlError):
+                pyrtl.FastSimulation(incremental=True, **kwargs)
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.FastSimulation(lanes=4).rebuild()
+
+
+class TestFastSimulationInlining(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        random.seed(3571)
+        self.a, self.b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+
+    def check_against_simulation(self, cycles=40):
+        stimulus = [{self.a: random.randrange(256), self.b: random.randrange(256)}
+                    for cycle in range(cycles)]
+        traces = []
+        for sim_class in (pyrtl.Simulation, pyrtl.FastSimulation):
+            sim = sim_class()
+            for inputs in stimulus:
+                sim.step(inputs)
+            traces.append(sim.tracer.trace)
+        self.assertEqual(traces[1], traces[0])
+
+    def test_single_use_wires(self):
+        once = self.a & self.b
+        twice = self.a | self.b
+        total = self.a + self.b
+        ranges = total[::-2]  # a select of several ranges of bits
+        traced = pyrtl.WireVector(8, 'traced')
+        traced <<= self.a ^ 3
+        o = pyrtl.Output(8, 'o')
+        o <<= pyrtl.concat((once ^ twice)[:4], twice[:2], ranges[:2]) + traced
+        inlined = pyrtl.FastSimulation()._inlined_wires({})
+        self.assertIn(once, inlined)
+        self.assertNotIn(twice, inlined)
+        self.assertNotIn(total, inlined)
+        self.assertFalse(any(w.name == 'traced' or isinstance(w, pyrtl.Output) for w in inlined))
+        self.assertEqual(pyrtl.FastSimulation(profile=True)._inlined_wires({}), {})
+        self.assertEqual(pyrtl.FastSimulation(count_toggles=True)._inlined_wires({}), {})
+        self.check_against_simulation()
+
+    def test_depth_limit(self):
+        x = self.a
+        for i in range(20):
+            x = ~x
+        o = pyrtl.Output(8, 'o')
+        o <<= x
+        sim = pyrtl.FastSimulation()
+        depth = sim._inline_depth
+        self.assertEqual(len(sim._inlined_wires({})), 20 - 20 // (depth + 1))
+        self.check_against_simulation()
+
+    def test_redundant_masks(self):
+        o1, o2, o3 = (pyrtl.Output(name='o%d' % i) for i in range(3))
+        o1 <<= ~self.a
+        o2 <<= self.a.zero_extended(12)[6:10]
+        o3 <<= self.a.nand(self.b)
+        with tempfile.NamedTemporaryFile(mode='r', suffix='.py') as f:
+            pyrtl.FastSimulation(code_file=f.name)
+            code = f.read()
+        self.assertNotIn('~', code)
+        self.assertIn("(d['a'] ^ 255)", code)
+        self.check_against_simulation()
+
+    def test_wide_register_values(self):
+        # the next value of r is at most 4 bits, but its initial value is not
+        r = pyrtl.Register(8, 'r')
+        r.next <<= self.a[:4].zero_extended(8)
+        o = pyrtl.Output(8, 'o')
+        o <<= pyrtl.concat(r[4:8], self.b[:4] ^ self.b[4:])
+        for options in ({}, {'chunk_size': 1}, {'incremental': True}):
+            sim = pyrtl.FastSimulation(register_value_map={r: 0xF3}, **options)
+            sim.step({self.a: 0, self.b: 0})
+            self.assertEqual(sim.inspect('o'), 0xF0)
+            sim = pyrtl.FastSimulation(default_value=0xA5, **options)
+            sim.step({self.a: 0, self.b: 0})
+            self.assertEqual(sim.inspect('o'), 0xA0)
+
+
+@unittest.skipIf(pyrtl.simulation._find_c_compiler() is None, "no C compiler available")
+class TestFastSimulationNative(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        random.seed(1729)
+
+    def build_design(self):
+        a, b, sel = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b'), pyrtl.Input(1, 'sel')
+        r = pyrtl.Register(8, 'r')
+        r.next <<= r + a
+        mem = pyrtl.MemBlock(8, 3, 'mem', asynchronous=True)
+        mem[a[:3]] <<= pyrtl.MemBlock.EnabledWrite(b, sel)
+        rom = pyrtl.RomBlock(4, 3, [3, 1, 4, 1, 5, 9, 2, 6])
+        outs = [pyrtl.Output(name='o%d' % i) for i in range(5)]
+        outs[0] <<= pyrtl.concat(a < b, a > b, a == b, ~a)
+        outs[1] <<= pyrtl.select(sel, a ^ b, a.nand(b))
+        outs[2] <<= pyrtl.concat(r[2:5], a[::-2], b[0])
+        outs[3] <<= (a * b) - r
+        outs[4] <<= mem[b[:3]] | rom[a[5:]]
+        return a, b, sel, mem
+
+    def stimulus(self, cycles):
+        return {'a': [random.randrange(256) for i in range(cycles)],
+                'b': [random.randrange(256) for i in range(cycles)],
+                'sel': [random.randrange(2) for i in range(cycles)]}
+
+    def test_step_matches_python(self):
+        a, b, sel, mem = self.build_design()
+        native, python = pyrtl.FastSimulation(native=True), pyrtl.FastSimulation()
+        self.assertTrue(native.native)
+        stimulus = self.stimulus(40)
+        for cycle in range(40):
+            values = {w: stimulus[w.name][cycle] for w in (a, b, sel)}
+            native.step(values)
+            python.step(values)
+        self.assertEqual(native.tracer.trace, python.tracer.trace)
+        self.assertEqual(native.inspect('r'), python.inspect('r'))
+        self.assertEqual(dict(native.inspect_mem(mem)),
+                         {addr: val for addr, val in python.inspect_mem(mem).items() if val})
+
+    def test_run_matches_python(self):
+        a, b, sel, mem = self.build_design()
+        native, python = pyrtl.FastSimulation(native=True), pyrtl.FastSimulation()
+        stimulus = self.stimulus(50)
+        self.assertEqual(native.run(inputs=stimulus), 50)
+        python.run(inputs=stimulus)
+        self.assertEqual(native.tracer.trace, python.tracer.trace)
+        self.assertEqual(native.inspect('o4'), python.inspect('o4'))
+
+    def test_run_in_blocks(self):
+        self.build_design()
+        native, python = pyrtl.FastSimulation(native=True), pyrtl.FastSimulation()
+        native._run_block_cycles = 7
+        stimulus = self.stimulus(40)
+        stimulus['a'] = stimulus['a'][:30]  # runs out in the middle of a block
+        self.assertEqual(native.run(inputs=stimulus), 30)
+        python.run(inputs=stimulus)
+        self.assertEqual(native.tracer.trace, python.tracer.trace)
+        self.assertEqual(native.inspect('o3'), python.inspect('o3'))
+        bad = dict(stimulus, a=[1] * 40, b=stimulus['b'][:33] + [256])
+        with self.assertRaises(pyrtl.PyrtlError):
+            native.run(inputs=bad)
+        self.assertEqual(len(native.tracer), 63)
+
+        untraced = pyrtl.FastSimulation(native=True, tracer=None)
+        untraced._run_block_cycles = 7
+        self.assertEqual(untraced.run(inputs=stimulus), 30)
+        self.assertEqual(untraced.inspect('o3'), python.inspect('o3'))
+
+    def test_bad_input_value(self):
+        self.build_design()
+        sim = pyrtl.FastSimulation(native=True)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': 256, 'b': 0, 'sel': 0})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': 1, 'b': 0})
+
+    def test_assertion(self):
+        a = pyrtl.Input(4, 'a')
+        r = pyrtl.Register(4, 'r')
+        r.next <<= r + a
+        pyrtl.rtl_assert(r < 10, pyrtl.PyrtlError('overflow'))
+        sim = pyrtl.FastSimulation(native=True)
+        self.assertTrue(sim.native)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run(inputs={'a': [3] * 10})
+        self.assertEqual(len(sim.tracer), 5)
+        self.assertEqual(sim.inspect('r'), 12)
+
+    def test_several_registers(self):
+        a, b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+        r1, r2, r3 = (pyrtl.Register(8, 'r%d' % i) for i in (1, 2, 3))
+        mem = pyrtl.MemBlock(8, 3, 'mem')
+        other = pyrtl.MemBlock(8, 2, 'other')
+        r1.next <<= a
+        r2.next <<= r1 + 1
+        r3.next <<= r3 ^ r2
+        mem[a[:3]] <<= b
+        other[b[:2]] <<= r2
+        o1, o2 = pyrtl.Output(8, 'o1'), pyrtl.Output(8, 'o2')
+        o1 <<= mem[r1[:3]] + r3
+        o2 <<= other[a[:2]]
+        n_nets = len(pyrtl.working_block().logic)
+        native = pyrtl.FastSimulation(native=True)
+        self.assertTrue(native.native)
+        self.assertEqual(len(pyrtl.working_block().logic), n_nets)
+        python = pyrtl.Simulation()
+        stimulus = self.stimulus(30)
+        del stimulus['sel']
+        for cycle in range(30):
+            values = {name: vals[cycle] for name, vals in stimulus.items()}
+            native.step(values)
+            python.step(values)
+        self.assertEqual(native.tracer.trace, python.tracer.trace)
+
+        native = pyrtl.FastSimulation(native=True)
+        self.assertEqual(native.run(inputs=stimulus), 30)
+        self.assertEqual(native.tracer.trace, python.tracer.trace)
+
+    def test_snapshot(self):
+        a, b, sel, mem = self.build_design()
+        sim = pyrtl.FastSimulation(native=True)
+        stimulus = self.stimulus(20)
+        sim.run(10, {name: vals[:10] for name, vals in stimulus.items()})
+        snap = sim.snapshot()
+        sim.run(10, {name: vals[10:] for name, vals in stimulus.items()})
+        expected = sim.inspect('o4'), dict(sim.inspect_mem(mem))
+        sim.restore(snap)
+        sim.run(10, {name: vals[10:] for name, vals in stimulus.items()})
+        self.assertEqual((sim.inspect('o4'), dict(sim.inspect_mem(mem))), expected)
+
+    def test_step_after_run_and_restore(self):
+        a, b, sel, mem = self.build_design()
+        native, python = pyrtl.FastSimulation(native=True), pyrtl.FastSimulation()
+        stimulus = self.stimulus(30)
+        native.run(10, stimulus)
+        python.run(10, stimulus)
+        snap = native.snapshot()
+        for sim in (native, python):
+            for cycle in range(10, 20):
+                sim.step({w: stimulus[w.name][cycle] for w in (a, b, sel)})
+        self.assertEqual(native.tracer.trace, python.tracer.trace)
+        self.assertEqual(native.inspect('r'), python.inspect('r'))
+
+        native.restore(snap)
+        native.regs = dict(native.regs)
+        for cycle in range(10, 20):
+            native.step({name: vals[cycle] for name, vals in stimulus.items()})
+        self.assertEqual(native.tracer.trace, python.tracer.trace)
+        self.assertEqual(native.inspect('r'), python.inspect('r'))
+
+    def test_falls_back_for_wide_wires(self):
+        a = pyrtl.Input(70, 'a')
+        o = pyrtl.Output(70, 'o')
+        o <<= a + 1
+        sim = pyrtl.FastSimulation(native=True)
+        self.assertFalse(sim.native)
+        sim.step({a: 2**69})
+        self.assertEqual(sim.inspect('o'), 2**69 + 1)
+
+
+class TestSimulationCompiledNets(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        random.seed(1861)
+
+    def test_matches_interpreted_nets(self):
+        a, b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+        sel = pyrtl.Input(1, 'sel')
+        r = pyrtl.Register(8, 'r')
+        mem = pyrtl.MemBlock(8, 3, 'mem', asynchronous=True)
+        rom = pyrtl.RomBlock(8, 3, [3, 1, 4, 1, 5, 9, 2, 6])
+        r.next <<= r + a
+        mem[a[:3]] <<= b
+        outs = [pyrtl.Output(name='o%d' % i) for i in range(6)]
+        outs[0] <<= pyrtl.concat(a < b, a > b, a == b, ~a)
+        outs[1] <<= pyrtl.select(sel, a ^ b, a.nand(b))
+        outs[2] <<= pyrtl.concat(r[2:5], a[::-2], b[0])
+        outs[3] <<= (a * b) - r
+        outs[4] <<= mem[b[:3]] | rom[a[5:]]
+        outs[5] <<= a & b
+        compiled, interpreted = pyrtl.Simulation(), pyrtl.Simulation()
+        interpreted.compiled_nets = None
+        for cycle in range(30):
+            inputs = {'a': random.randrange(256), 'b': random.randrange(256),
+                      'sel': random.randrange(2)}
+            compiled.step(inputs)
+            interpreted.step(inputs)
+        self.assertEqual(compiled.tracer.trace, interpreted.tracer.trace)
+
+    def test_subclass_semantics_are_kept(self):
+        class ParitySimulation(pyrtl.Simulation):
+            @staticmethod
+            def _sanitize(val, wirevector):
+                return val & wirevector.bitmask & ~1
+
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(5, 'o')
+        o <<= a + 1
+        sim = ParitySimulation()
+        self.assertIsNone(sim.compiled_nets)
+        sim.step({a: 12})
+        self.assertEqual(sim.inspect('o'), 12)
+
+
+class TestEventDrivenSimulation(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        random.seed(4127)
+
+    def build_design(self):
+        key, data, we = pyrtl.Input(8, 'key'), pyrtl.Input(8, 'data'), pyrtl.Input(1, 'we')
+        expanded = key
+        for i in range(20):  # a long chain only depending on the held key
+            expanded = (expanded * 3 + i)[:8] ^ key
+        count = pyrtl.Register(4, 'count')
+        count.next <<= count + 1
+        mem = pyrtl.MemBlock(8, 4, 'mem', asynchronous=True)
+        mem[count] <<= pyrtl.MemBlock.EnabledWrite(data, we)
+        out, m = pyrtl.Output(name='out'), pyrtl.Output(name='m')
+        out <<= expanded ^ data
+        m <<= mem[(count - 1)[:4]]
+        return mem
+
+    def test_matches_simulation(self):
+        mem = self.build_design()
+        stimulus = [{'key': 42 if cycle < 20 else 7, 'data': random.randrange(256),
+                     'we': random.randrange(2)} for cycle in range(40)]
+        ref, event = pyrtl.Simulation(), pyrtl.EventDrivenSimulation()
+        for inputs in stimulus:
+            ref.step(inputs)
+            event.step(inputs)
+        self.assertEqual(event.tracer.trace, ref.tracer.trace)
+        self.assertEqual(event.inspect_mem(mem), ref.inspect_mem(mem))
+
+    def test_activity(self):
+        self.build_design()
+        sim = pyrtl.EventDrivenSimulation()
+        total = len(sim.event_nets)
+        sim.step({'key': 42, 'data': 0, 'we': 0})
+        self.assertEqual(sim.nets_evaluated, total)
+        self.assertEqual(sim.activity(), 1.0)
+        evaluated = total
+        for cycle in range(1, 10):
+            sim.step({'key': 42, 'data': cycle, 'we': 0})
+            self.assertLess(sim.nets_evaluated, total / 4)
+            evaluated += sim.nets_evaluated
+        self.assertAlmostEqual(sim.activity(), evaluated / (10.0 * total))
+        self.assertLess(sim.activity(), 0.5)
+
+
+@unittest.skipIf(numpy is None, 'to_numpy requires numpy')
+class TestCompactTraceNumpy(unittest.TestCase):
+    def test_to_numpy(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(8, 'a')
+        r = pyrtl.Register(70, 'r')
+        r.next <<= r + a
+        sim_trace = pyrtl.SimulationTrace(compact=True)
+        sim = pyrtl.Simulation(tracer=sim_trace)
+        for i in range(5):
+            sim.step({a: 200})
+        self.assertEqual(sim_trace.trace.to_numpy('a').dtype, numpy.uint64)
+        self.assertEqual(list(sim_trace.trace.to_numpy('a')), [200] * 5)
+        self.assertEqual(list(sim_trace.trace.to_numpy('r')), [0, 200, 400, 600, 800])
+        sim.step({a: 1})  # the trace can still grow
+        self.assertEqual(len(sim_trace), 6)
+
+
+def build_accumulator():
+    a = pyrtl.Input(4, 'a')
+    acc = pyrtl.Register(8, 'acc')
+    acc.next <<= acc + a
+    o = pyrtl.Output(name='o')
+    o <<= acc
+    pyrtl.rtl_assert(acc != 200, ValueError('acc reached 200'))
+
+
+class TestParallelSimulate(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        random.seed(5501)
+        self.stimuli = [{'a': [random.randrange(4) for i in range(length)]}
+                        for length in range(1, 12)]
+
+    def serial_traces(self):
+        pyrtl.reset_working_block()
+        build_accumulator()
+        traces = []
+        for stimulus in self.stimuli:
+            sim = pyrtl.Simulation()
+            for value in stimulus['a']:
+                sim.step({'a': value})
+            traces.append({name: list(values) for name, values in sim.tracer.trace.items()})
+        return traces
+
+    def test_matches_serial(self):
+        traces = pyrtl.parallel_simulate(build_accumulator, self.stimuli,
+                                         max_workers=2, chunksize=3)
+        self.assertEqual(traces, self.serial_traces())
+
+    def test_block_design(self):
+        build_accumulator()
+        traces = pyrtl.parallel_simulate(pyrtl.working_block(), self.stimuli, max_workers=2,
+                                         wires_to_track=['acc'],
+                                         register_value_map={'acc': 100})
+        self.assertEqual(traces[2]['acc'], [100] + [100 + sum(self.stimuli[2]['a'][:1]),
+                                                    100 + sum(self.stimuli[2]['a'][:2])])
+
+    def test_first_failure(self):
+        self.stimuli[4] = self.stimuli[6] = {'a': [10] * 21}
+        with self.assertRaises(ValueError) as cm:
+            pyrtl.parallel_simulate(build_accumulator, self.stimuli, max_workers=2,
+                                    chunksize=2)
+        self.assertEqual(cm.exception.stimulus_index, 4)
+
+
+class TestPartitionedSimulation(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        random.seed(8128)
+        self.a, self.b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+        r1, r2, r3 = (pyrtl.Register(8, name) for name in ('r1', 'r2', 'r3'))
+        self.r2 = r2
+        r1.next <<= r1 + self.a
+        r2.next <<= r2 ^ (r1 + self.b)
+        self.mem = pyrtl.MemBlock(8, 4, 'mem', asynchronous=True)
+        self.mem[self.a[:4]] <<= r2
+        r3.next <<= self.mem[self.b[:4]] + r1
+        o = pyrtl.Output(name='o')
+        o <<= r3 * r2
+        pyrtl.rtl_assert(r3 != 77, ValueError('r3 is 77'))
+
+    def compare(self, sim, cycles=40):
+        reference = pyrtl.FastSimulation(register_value_map={self.r2: 5},
+                                         memory_value_map={self.mem: {3: 9}})
+        for cycle in range(cycles):
+            values = {self.a: random.randrange(256), self.b: random.randrange(256)}
+            reference.step(values)
+            sim.step(values)
+        self.assertEqual(sim.tracer.trace, reference.tracer.trace)
+        self.assertEqual(sim.inspect('o'), reference.inspect('o'))
+        self.assertEqual(sim.inspect_mem(self.mem), reference.inspect_mem(self.mem))
+
+    def test_in_process(self):
+        sim = pyrtl.PartitionedSimulation(register_value_map={self.r2: 5},
+                                          memory_value_map={self.mem: {3: 9}})
+        self.assertGreater(len(sim._groups), 1)
+        self.compare(sim)
+
+    def test_workers(self):
+        sim = pyrtl.PartitionedSimulation(register_value_map={self.r2: 5},
+                                          memory_value_map={self.mem: {3: 9}}, workers=2)
+        try:
+            self.assertEqual(len(sim._groups), 2)
+            self.compare(sim)
+        finally:
+            sim.close()
+
+    def test_assertion(self):
+        sim = pyrtl.PartitionedSimulation()
+        with self.assertRaises(ValueError):
+            for cycle in range(100):
+                sim.step({'a': 7, 'b': 0})
+        self.assertEqual(sim.inspect('r3'), 77)
+
+    def test_unused_logic_in_other_block(self):
+        block = pyrtl.Block()
+        with pyrtl.set_working_block(block):
+            a, b = pyrtl.Input(8, 'a'), pyrtl.Input(8, 'b')
+            r = pyrtl.Register(8, 'r')
+            r.next <<= r + a
+            unused = a * b  # a region driving nothing that is reported
+            o = pyrtl.Output(8, 'o')
+            o <<= r
+        pyrtl.reset_working_block()
+        pyrtl.Input(3, 'x')  # the working block is not the one simulated
+        for workers in (None, 2):
+            sim = pyrtl.PartitionedSimulation(block=block, workers=workers)
+            try:
+                for cycle in range(4):
+                    sim.step({'a': 3, 'b': 5})
+                self.assertEqual(sim.tracer.trace['o'], [0, 3, 6, 9])
+            finally:
+                sim.close()
+
+    def test_error_in_one_group(self):
+        pyrtl.reset_working_block()
+        a, b = pyrtl.Input(8, 'a'), pyrtl.Input(2, 'b')
+        r = pyrtl.Register(8, 'r')
+        r.next <<= r + a
+        rom = pyrtl.RomBlock(4, 2, [1, 2, 3])  # reading address 3 raises an error
+        q = pyrtl.Register(4, 'q')
+        q.next <<= (rom[b] ^ q) + (q & 5) - 1
+        for workers in (None, 2):
+            sim = pyrtl.PartitionedSimulation(workers=workers)
+            try:
+                self.assertEqual(len(sim._groups), 2)
+                sim.step({a: 1, b: 0})
+                with self.assertRaises(pyrtl.PyrtlError):
+                    sim.step({a: 1, b: 3})
+                for cycle in range(2, 5):  # no stale replies of the failed step are read
+                    sim.step({a: 1, b: 0})
+                    self.assertEqual(sim.inspect('r'), cycle)
+            finally:
+                sim.close()
+
+    def test_bad_inputs(self):
+        sim = pyrtl.PartitionedSimulation()
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': 1})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': 1, 'b': 256})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': 1, 'b': 2, 'o': 3})
+
+
+class TestSimulationCodeCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = pyrtl.SimulationCodeCache(self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def build_and_sim(self, extra_name=None):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(4, 'a')
+        r = pyrtl.Register(4, 'r')
+        r.next <<= r + a
+        o = pyrtl.Output(name='o')
+        o <<= r * 2
+        if extra_name:
+            w = pyrtl.WireVector(4, extra_name)
+            w <<= ~r
+        sim_trace = pyrtl.SimulationTrace()
+        sim = pyrtl.FastSimulation(tracer=sim_trace, code_cache=self.cache)
+        for i in range(4):
+            sim.step({a: i})
+        output = io.StringIO()
+        sim_trace.print_trace(output)
+        return output.getvalue()
+
+    def test_cache_hit_on_rebuilt_design(self):
+        first = self.build_and_sim()
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        self.assertEqual(self.build_and_sim(), first)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_cache_hit_with_memory(self):
+        traces = []
+        for build in range(2):  # the memory gets a new memid every time
+            pyrtl.reset_working_block()
+            a = pyrtl.Input(4, 'a')
+            mem = pyrtl.MemBlock(4, 2, 'mem', asynchronous=True)
+            mem[a[:2]] <<= a
+            o = pyrtl.Output(name='o')
+            o <<= mem[a[2:]]
+            sim = pyrtl.FastSimulation(code_cache=self.cache,
+                                       memory_value_map={mem: {1: 9}})
+            for i in range(8):
+                sim.step({a: i * 5 % 16})
+            traces.append((sim.tracer.trace, dict(sim.inspect_mem(mem))))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(traces[1], traces[0])
+
+    def test_toggles_of_rebuilt_design(self):
+        for names in (('p', 'q', 'r'), ('r', 'q', 'p')):
+            # the same design, with its untraced wires sorted differently
+            pyrtl.reset_working_block()
+            a = pyrtl.Input(4, 'a')
+            p, q, r = (pyrtl.WireVector(name=name) for name in names)
+            p <<= a + 1
+            q <<= pyrtl.select(a[0], p, a * 3)
+            r <<= q ^ 5
+            o = pyrtl.Output(name='o')
+            o <<= r + (a & 6)
+            sims = [pyrtl.FastSimulation(count_toggles=True, code_cache=cache,
+                                         tracer=pyrtl.SimulationTrace([a, o]))
+                    for cache in (self.cache, None)]
+            for sim in sims:
+                for value in (3, 12, 5, 0, 9, 6):
+                    sim.step({a: value})
+            self.assertEqual(sims[0].toggle_counts(), sims[1].toggle_counts())
+
+    def test_profile_of_nets_in_another_order(self):
+        for reverse in (False, True):
+            pyrtl.reset_working_block()
+            a, b = pyrtl.Input(4, 'a'), pyrtl.Input(4, 'b')
+            for i, op in enumerate((lambda x, y: x & y, lambda x, y: x * y, lambda x, y: x + y)):
+                o = pyrtl.Output(name='o%d' % i)
+                o <<= op(a, b)
+            block = pyrtl.working_block()
+            order = tuple(block)
+            if reverse:  # another topological order of the same block
+                drivers = {net.dests[0]: net for net in order}
+                outputs = [net for net in order if net.op == 'w']
+                block._caches['topological_order'] = tuple(
+                    net for w in reversed(outputs) for net in (drivers[w.args[0]], w))
+            sim = pyrtl.FastSimulation(profile=True, code_cache=self.cache)
+            self.assertEqual(sim.profile.nets, tuple(block))
+        # the profiled nets are indexed by their position in the order
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_different_trace_is_a_miss(self):
+        self.build_and_sim()
+        trace = self.build_and_sim(extra_name='inv')
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+        self.assertIn('inv 15151412', trace)
+
+    def test_corrupt_entry_is_a_miss(self):
+        self.build_and_sim()
+        for name in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, name), 'wb') as f:
+                f.write(b'garbage')
+        self.build_and_sim()
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_eviction(self):
+        self.cache.max_size = 1
+        self.build_and_sim()
+        self.build_and_sim(extra_name='inv')
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+class TestBitParallelSimulation(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+    def test_exhaustive_adder(self):
+        from pyrtl.rtllib import adders
+        a, b = pyrtl.Input(4, 'a'), pyrtl.Input(4, 'b')
+        s = pyrtl.Output(name='s')
+        s <<= adders.kogge_stone(a, b)
+        pyrtl.synthesize()
+        pyrtl.optimize()
+        sim = pyrtl.BitParallelSimulation(lanes=256)
+        avals, bvals = [i % 16 for i in range(256)], [i // 16 for i in range(256)]
+        sim.step({a: avals, b: bvals})
+        self.assertEqual(sim.inspect('s'), [x + y for x, y in zip(avals, bvals)])
+
+    def test_registers_and_lane_traces(self):
+        a = pyrtl.Input(3, 'a')
+        r = pyrtl.Register(3, 'r')
+        r.next <<= r + a
+        o = pyrtl.Output(name='o')
+        o <<= r
+        pyrtl.synthesize()
+        sim = pyrtl.BitParallelSimulation(lanes=3, register_value_map={r: [0, 1, 2]})
+        for i in range(3):
+            sim.step({'a': [1, 2, 3]})
+        self.assertEqual(sim.inspect(o), [2, 5, 0])
+        output = io.StringIO()
+        sim.lane_trace(1).print_trace(output)
+        self.assertEqual(output.getvalue(), 'a 222\no 135\n')
+
+    def test_register_values_by_name(self):
+        a = pyrtl.Input(3, 'a')
+        r = pyrtl.Register(3, 'r')
+        r.next <<= r + a
+        o = pyrtl.Output(name='o')
+        o <<= r
+        pyrtl.synthesize()
+        sim = pyrtl.BitParallelSimulation(lanes=2, register_value_map={'r': [5, 6]})
+        sim.step({'a': 0})
+        self.assertEqual(sim.inspect(o), [5, 6])
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.BitParallelSimulation(lanes=2, register_value_map={'q': 1})
+
+    def test_memories(self):
+        addr, data = pyrtl.Input(3, 'addr'), pyrtl.Input(4, 'data')
+        mem = pyrtl.MemBlock(4, 3, 'mem', asynchronous=True)
+        rom = pyrtl.RomBlock(4, 3, [3, 1, 4, 1, 5, 9, 2, 6])
+        mem[addr] <<= data
+        o1, o2 = pyrtl.Output(name='o1'), pyrtl.Output(name='o2')
+        o1 <<= mem[~addr]
+        o2 <<= rom[addr]
+        pyrtl.synthesize()
+        sim = pyrtl.BitParallelSimulation(lanes=2, memory_value_map={mem: {7: 5}})
+        sim.step({addr: [0, 1], data: [8, 9]})
+        self.assertEqual(sim.inspect('o1'), [5, 0])
+        self.assertEqual(sim.inspect('o2'), [3, 1])
+        self.assertEqual(sim.inspect_mem(mem), [{0: 8, 7: 5}, {1: 9, 7: 5}])
+
+    def test_requires_synthesized_block(self):
+        a = pyrtl.Input(3, 'a')
+        o = pyrtl.Output(name='o')
+        o <<= a + 1
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.BitParallelSimulation()
+
+
 if __name__ == '__main__':
     unittest.main()